@@ -0,0 +1,127 @@
+from queue import Empty
+
+import time
+
+# Control messages (commands, errors and the replies to them) between
+# the secretary and the electrometer or arduinoer. They go through
+# their own queues so they never wait behind measurements, which keep
+# using the data queues. Only the end of a voltage step stays with the
+# data, as it refers to the measurements sent before it.
+#
+# Each side of a queue pair has a ControlChannel. Every message sent
+# gets a sequence number ('Seq') and the time it was sent ('Sent'), and
+# the other side acknowledges it as soon as it reads it with a message
+# that only has 'Ack'. Acknowledgements are read (and not returned) by
+# receive(). The time from sending a message to its acknowledgement,
+# and from a message being sent to it being received, are kept to be
+# reported by the secretary.
+#
+# Messages to the secretary keep the data queue format ('Data', 'Error',
+# 'FatalError', 'CMD') so they can still go through the data queue
+# when a process is started without a control queue. The data is then
+# read from that queue without receive(), so each message read has to go
+# through accept().
+
+class ControlChannel:
+
+	def __init__(self, outQueue, inQueue):
+		self.outQueue = outQueue
+		self.inQueue = inQueue
+
+		self.nextSeq = 0
+
+		# Time each message waiting for its acknowledgement was sent.
+		self.pending = {}
+
+		# [number, total time, max time] of the messages acknowledged and
+		# received since the last stats().
+		self.acked = [0, 0.0, 0.0]
+		self.received = [0, 0.0, 0.0]
+
+	def send(self, message):
+		if self.outQueue is None:
+			return
+
+		message = dict(message)
+		message['Seq'] = self.nextSeq
+		message['Sent'] = time.time()
+
+		self.pending[self.nextSeq] = message['Sent']
+		self.nextSeq += 1
+
+		self.outQueue.put(message)
+
+	# Next message that is not an acknowledgement, or None if there is
+	# none after waiting up to timeout seconds.
+	def receive(self, timeout=0.0):
+		if self.inQueue is None:
+			return None
+
+		deadline = time.time() + timeout
+
+		while True:
+			try:
+				if timeout > 0.0:
+					message = self.inQueue.get(timeout=max(deadline - time.time(), 0.0))
+				else:
+					message = self.inQueue.get_nowait()
+			except Empty:
+				return None
+
+			message = self.accept(message)
+
+			if message is not None:
+				return message
+
+	# Does for a message read from inQueue by someone else what receive()
+	# does: records and drops acknowledgements (returns None) and
+	# acknowledges the rest. For inQueue shared with the data, when the
+	# data is read without receive().
+	def accept(self, message):
+		now = time.time()
+
+		if message.get('Ack') is not None:
+			sent = self.pending.pop(message['Ack'], None)
+
+			if sent is not None:
+				add_latency(self.acked, now - sent)
+
+			return None
+
+		if message.get('Seq') is not None:
+			add_latency(self.received, now - message['Sent'])
+
+			if self.outQueue is not None:
+				self.outQueue.put({ \
+					'Data' 			: None, \
+					'Error' 		: None, \
+					'FatalError' 	: None, \
+					'CMD' 			: None, \
+					'Ack' 			: message['Seq'] })
+
+		return message
+
+	# Messages sent more than 'age' seconds ago still not acknowledged.
+	def overdue(self, age):
+		now = time.time()
+
+		return len([sent for sent in self.pending.values() if now - sent > age])
+
+	# Returns (acked, received), each [number, mean time, max time], and
+	# starts counting again.
+	def stats(self):
+		acked, received = self.acked, self.received
+		self.acked = [0, 0.0, 0.0]
+		self.received = [0, 0.0, 0.0]
+
+		return (mean_latency(acked), mean_latency(received))
+
+def add_latency(latency, seconds):
+	latency[0] += 1
+	latency[1] += seconds
+	latency[2] = max(latency[2], seconds)
+
+def mean_latency(latency):
+	number, total, maxTime = latency
+
+	return [number, total/number if number > 0 else 0.0, maxTime]
@@ -0,0 +1,233 @@
+from Managers.FileReader import sipmFileReader
+
+import numpy as np
+import os
+
+# Exports a run of the database to a table file for people that do not
+# use HDF5. The run is read chunkRows rows at a time and written as it
+# goes, so the memory used does not depend on the size of the run:
+#
+#	exporter = sipmFileExporter('SiPM_Characterization.hdf5')
+#	exporter.export('run.parquet')
+#	exporter.close()
+#
+# The format comes from the extension of the file: .csv, .parquet or
+# .arrow (Arrow IPC file). Parquet and Arrow need pyarrow, which is only
+# imported when used.
+#
+# The table has one row per I-V measurement of every SiPM (SiPM column,
+# 1 based) with the humidity and temperature of the last HT measurement
+# at or before it. Both times are seconds since the electrometer and the
+# arduino started, so the match is as good as their start times agree.
+# The attributes of the run (Date, Comment, Error...) are saved as
+# metadata of the file, as '# key: value' lines at the top of a CSV.
+
+EXPORT_DTYPE = np.dtype([ \
+	('SiPM', 		'u1'), 	\
+	('Time', 		'<f8'), \
+	('Voltage', 	'<f4'), \
+	('Current', 	'<f4'), \
+	('Step', 		'<u2'), \
+	('Range', 		'u1'), 	\
+	('Retries', 	'u1'), 	\
+	('Humidity', 	'<f4'), \
+	('Temperature', '<f4')])
+
+EXPORT_FORMATS = ['csv', 'parquet', 'arrow']
+
+CSV_FORMAT = '%d,%.6f,%.6f,%.6e,%d,%d,%d,%.3f,%.3f\n'
+
+# Humidity and temperature at given times from the HT dataset. Only
+# the HT rows around the times asked are kept in memory, so times have
+# to be asked in increasing order.
+class HTCursor:
+
+	def __init__(self, dataset, chunkRows):
+		self.dataset = dataset
+		self.chunkRows = chunkRows
+
+		self.window = dataset[0:0]
+		self.end = 0
+
+	def lookup(self, times):
+		humidity = np.full(len(times), np.nan, dtype='<f4')
+		temperature = np.full(len(times), np.nan, dtype='<f4')
+
+		if len(times) == 0:
+			return (humidity, temperature)
+
+		# Reads ahead until the window goes past the last time.
+		while self.end < self.dataset.shape[0] and (len(self.window) == 0 \
+			or self.window['Time'][-1] <= times[-1]):
+			block = self.dataset[self.end:self.end + self.chunkRows]
+			self.window = np.concatenate((self.window, block))
+			self.end += len(block)
+
+		found = np.searchsorted(self.window['Time'], times, side='right') - 1
+		valid = found >= 0
+
+		humidity[valid] = self.window['Humidity'][found[valid]]
+		temperature[valid] = self.window['Temperature'][found[valid]]
+
+		# Rows before the one used by the last time are not needed anymore.
+		if found[-1] > 0:
+			self.window = self.window[found[-1]:]
+
+		return (humidity, temperature)
+
+class CSVTableWriter:
+
+	def __init__(self, path, metadata):
+		self.file = open(path, 'w', newline='')
+
+		for key, value in metadata.items():
+			value = value.replace('\n', ' ')
+			self.file.write(f'# {key}: {value}\n')
+
+		self.file.write(','.join(EXPORT_DTYPE.names) + '\n')
+
+	# Formatting whole columns is ~3 times faster than np.savetxt.
+	def write(self, table):
+		columns = [table[name].tolist() for name in EXPORT_DTYPE.names]
+
+		self.file.write(''.join([CSV_FORMAT % row for row in zip(*columns)]))
+
+	def close(self):
+		self.file.close()
+
+# Parquet (parquet=True) or Arrow IPC file.
+class ArrowTableWriter:
+
+	def __init__(self, path, metadata, parquet=True):
+		try:
+			import pyarrow
+			import pyarrow.ipc
+			import pyarrow.parquet
+		except ImportError:
+			raise Exception('Exporting to Parquet or Arrow needs pyarrow. \
+Install it with pip install pyarrow.')
+
+		self.pa = pyarrow
+		self.parquet = parquet
+		self.schema = pyarrow.schema( \
+			[(name, pyarrow.from_numpy_dtype(EXPORT_DTYPE[name])) \
+			for name in EXPORT_DTYPE.names], metadata=metadata)
+
+		if parquet:
+			self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+		else:
+			self.sink = pyarrow.OSFile(path, 'wb')
+			self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+
+	def write(self, table):
+		batch = self.pa.RecordBatch.from_arrays( \
+			[self.pa.array(np.ascontiguousarray(table[name])) \
+			for name in EXPORT_DTYPE.names], schema=self.schema)
+
+		if self.parquet:
+			self.writer.write_table(self.pa.Table.from_batches([batch]))
+		else:
+			self.writer.write_batch(batch)
+
+	def close(self):
+		self.writer.close()
+
+		if not self.parquet:
+			self.sink.close()
+
+def new_table_writer(fileFormat, path, metadata):
+	if fileFormat == 'csv':
+		return CSVTableWriter(path, metadata)
+	elif fileFormat == 'parquet':
+		return ArrowTableWriter(path, metadata, parquet=True)
+	elif fileFormat == 'arrow':
+		return ArrowTableWriter(path, metadata, parquet=False)
+
+	raise Exception(f'Unknown export format {fileFormat}, use one of \
+{EXPORT_FORMATS}.')
+
+class sipmFileExporter:
+
+	def __init__(self, filedir, chunkRows=65536, swmr=False):
+		self.filedir = filedir
+		self.chunkRows = chunkRows
+		self.reader = sipmFileReader(filedir, swmr=swmr)
+
+	# Writes run 'name' (the latest if None) to path. Returns the number
+	# of rows written.
+	def export(self, path, name=None, fileFormat=None):
+		if fileFormat is None:
+			fileFormat = os.path.splitext(path)[1][1:].lower()
+
+		run = self.reader.open_run(name)
+		writer = new_table_writer(fileFormat, path, self.metadata())
+
+		print(f'[File] Exporting run {self.reader.run_name} to {path}.')
+
+		numRows = 0
+		try:
+			for table in self.tables():
+				writer.write(table)
+				numRows += len(table)
+		finally:
+			writer.close()
+
+		print(f'[File] Exported {numRows} rows.')
+		return numRows
+
+	# Attributes of the run, as strings.
+	def metadata(self):
+		metadata = { \
+			'Database' 	: os.path.basename(self.filedir), \
+			'Run' 		: self.reader.run_name }
+
+		for key, value in self.reader.run.attrs.items():
+			metadata[key] = value.decode('utf-8') \
+				if isinstance(value, bytes) else str(value)
+
+		return metadata
+
+	# IV_i datasets of the run, by SiPM number.
+	def IV_datasets(self):
+		names = [name for name in self.reader.datasets() if name != 'HT']
+
+		return sorted(names, key=lambda name: int(name[3:]))
+
+	# The run as blocks of at most chunkRows rows of EXPORT_DTYPE.
+	def tables(self):
+		run = self.reader.run
+
+		for name in self.IV_datasets():
+			dataset = run[name]
+
+			# Runs from before HT_DTYPE are exported without HT.
+			cursor = None
+			if 'HT' in run and run['HT'].dtype.names is not None:
+				cursor = HTCursor(run['HT'], self.chunkRows)
+
+			for start in range(0, dataset.shape[0], self.chunkRows):
+				rows = dataset[start:start + self.chunkRows]
+
+				table = np.zeros(len(rows), dtype=EXPORT_DTYPE)
+				table['SiPM'] = int(name[3:])
+
+				if rows.dtype.names is None:
+					# Runs from before IV_DTYPE, time/voltage/current columns.
+					table['Time'] = rows[:, 0]
+					table['Voltage'] = rows[:, 1]
+					table['Current'] = rows[:, 2]
+				else:
+					for field in rows.dtype.names:
+						table[field] = rows[field]
+
+				if cursor is not None:
+					table['Humidity'], table['Temperature'] = \
+						cursor.lookup(table['Time'])
+				else:
+					table['Humidity'] = np.nan
+					table['Temperature'] = np.nan
+
+				yield table
+
+	def close(self):
+		self.reader.close()
@@ -0,0 +1,105 @@
+import time
+import numpy as np
+
+# Append engine for the measurement datasets. Rows are kept in memory
+# and written to the HDF5 dataset in blocks following a flush policy:
+# 	- count : once flushRows rows are waiting.
+#	- time 	: once flushTime seconds passed since the last flush.
+#	- step 	: when the file manager is told a voltage step ended.
+#
+# The dataset is grown ahead of the data, either geometrically
+# (growth='geometric') or one chunk at a time (growth='chunk'), so
+# only a handful of resizes happen per run. Because of that the dataset
+# is usually longer than the data, trim() cuts it to its real length
+# and has to be called before closing the file.
+#
+# growth='exact' resizes to the real length on every flush. It is meant
+# for SWMR mode, where readers use the dataset length to know how many
+# rows are valid. With swmr=True every block written is also flushed so
+# the readers can see it.
+
+class AppendHelper:
+
+	def __init__(self, dataset, flushRows=1024, flushTime=5.0, \
+		growth='geometric', swmr=False):
+
+		self.dataset = dataset
+		self.flushRows = flushRows
+		self.flushTime = flushTime
+		self.growth = growth
+		self.swmr = swmr
+
+		# Number of valid rows in the dataset.
+		self.size = 0
+
+		self.buffer = []
+		self.bufferSize = 0
+		self.lastFlush = time.time()
+
+	# Total number of rows, written or not.
+	def __len__(self):
+		return self.size + self.bufferSize
+
+	def append(self, rows):
+		rows = np.asarray(rows, dtype=self.dataset.dtype)
+		rows = rows.reshape((-1,) + self.dataset.shape[1:])
+
+		self.buffer.append(rows)
+		self.bufferSize += len(rows)
+
+		if self.bufferSize >= self.flushRows or self.expired():
+			self.flush()
+
+	# True if the buffer has been waiting for longer than flushTime.
+	def expired(self):
+		return self.bufferSize > 0 and \
+			(time.time() - self.lastFlush) >= self.flushTime
+
+	def flush(self):
+		self.lastFlush = time.time()
+
+		if self.bufferSize == 0:
+			return
+
+		rows = np.concatenate(self.buffer)
+		newSize = self.size + len(rows)
+
+		if newSize > self.dataset.shape[0]:
+			self.grow(newSize)
+
+		self.dataset[self.size:newSize] = rows
+
+		if self.swmr:
+			self.dataset.flush()
+
+		self.size = newSize
+		self.buffer = []
+		self.bufferSize = 0
+
+	def grow(self, minSize):
+		chunkRows = self.dataset.chunks[0] if self.dataset.chunks else 1
+
+		if self.growth == 'exact':
+			self.dataset.resize(minSize, axis=0)
+			return
+		elif self.growth == 'geometric':
+			newSize = max(minSize, 2*self.dataset.shape[0])
+		else:
+			newSize = minSize
+
+		# Always end up on a chunk boundary.
+		newSize = chunkRows*int(np.ceil(newSize/chunkRows))
+
+		self.dataset.resize(newSize, axis=0)
+
+	# Writes what is left and cuts the dataset to the real length.
+	def trim(self):
+		self.flush()
+
+		if self.dataset.shape[0] != self.size:
+			self.dataset.resize(self.size, axis=0)
+
+	# Throws away any row that was not written.
+	def discard(self):
+		self.buffer = []
+		self.bufferSize = 0
@@ -0,0 +1,188 @@
+import h5py
+import sqlite3
+import json
+import re
+import os
+
+# Catalog of the runs saved in the database, kept in a SQLite file next
+# to it (ex. SiPM_Characterization.hdf5.catalog.sqlite). It holds one
+# row per run with its date, comment, config, sample counts, number of
+# SiPMs and status, so runs can be found without opening every group of
+# the HDF5 file:
+#
+#	catalog = CatalogHelper('SiPM_Characterization.hdf5.catalog.sqlite')
+#	runs = catalog.query(status='finished', since='2026-01-01')
+#
+# It also remembers the next free _XX suffix of every run name so a new
+# name is found in one lookup.
+#
+# Status of a run: running, finished, restarted, deleted, failed (rows
+# did not reach the file, the journal was kept to recover them),
+# recovered or unknown (runs found in the HDF5 file that were not written
+# with the catalog).
+
+# Names of the runs of the HDF5 file that can be read. Runs in their own
+# file (sharding) can be missing, only their link is left.
+def run_names(sipm_group):
+	directory = os.path.dirname(sipm_group.file.filename)
+	names = []
+
+	for name in sipm_group.keys():
+		link = sipm_group.get(name, getlink=True)
+
+		if isinstance(link, h5py.ExternalLink) and \
+			not os.path.isfile(os.path.join(directory, link.filename)):
+			continue
+
+		names.append(name)
+
+	return names
+
+class CatalogHelper:
+
+	def __init__(self, path):
+		self.path = path
+
+		self.db = sqlite3.connect(path)
+		self.db.row_factory = sqlite3.Row
+
+		# Lets readers query while the secretary writes.
+		self.db.execute('PRAGMA journal_mode=WAL')
+
+		self.db.execute('CREATE TABLE IF NOT EXISTS runs ( \
+			name TEXT PRIMARY KEY, date TEXT, comment TEXT, error TEXT, \
+			config TEXT, num_sipms INTEGER, iv_rows INTEGER, ht_rows INTEGER, \
+			status TEXT)')
+		self.db.execute('CREATE INDEX IF NOT EXISTS runs_date ON runs(date)')
+		self.db.execute('CREATE INDEX IF NOT EXISTS runs_status ON runs(status)')
+
+		# Next _XX suffix to try for each base name.
+		self.db.execute('CREATE TABLE IF NOT EXISTS names ( \
+			base TEXT PRIMARY KEY, next INTEGER)')
+
+		self.db.commit()
+
+	# Names of the runs that still exist in the HDF5 file.
+	def names(self):
+		return set([row[0] for row in self.db.execute( \
+			'SELECT name FROM runs WHERE status != \'deleted\'')])
+
+	# True if the catalog has the same runs as the ones of the HDF5 file
+	# that can be read.
+	def matches(self, sipm_group):
+		return self.names() == set(run_names(sipm_group))
+
+	# Rebuilds the catalog from the groups of the HDF5 file. Used when the
+	# catalog is new or does not match the file.
+	def rebuild(self, sipm_group):
+		print('[File] Rebuilding the run catalog.')
+
+		self.db.execute('DELETE FROM runs')
+		self.db.execute('DELETE FROM names')
+
+		for name in run_names(sipm_group):
+			group = sipm_group.get(name)
+			if group is None:
+				continue
+
+			ivNames = [key for key in group.keys() \
+				if key.startswith('IV_') and key[3:].isdigit()]
+
+			self.db.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', ( \
+				name, \
+				str(group.attrs.get('Date', '')), \
+				str(group.attrs.get('Comment', '')), \
+				str(group.attrs.get('Error', '')), \
+				'{}', \
+				len(ivNames), \
+				sum(len(group[key]) for key in ivNames), \
+				len(group['HT']) if 'HT' in group else 0, \
+				'finished' if 'Error' in group.attrs else 'unknown'))
+
+			self.name_taken(name)
+
+		self.db.commit()
+
+	# Keeps the suffix counter ahead of a name that has been used.
+	def name_taken(self, name):
+		match = re.fullmatch(r'(.*)_(\d{2,})', name)
+		if match is None:
+			return
+
+		base, i = match.group(1), int(match.group(2))
+
+		self.db.execute('INSERT INTO names VALUES (?, ?) ON CONFLICT(base) \
+			DO UPDATE SET next = MAX(next, excluded.next)', (base, i + 1))
+
+	def exists(self, name):
+		return self.db.execute('SELECT 1 FROM runs WHERE name = ?', \
+			(name,)).fetchone() is not None
+
+	# Returns name if it is free, otherwise name_XX with the next free XX.
+	def allocate_name(self, name):
+		if not self.exists(name):
+			return name
+
+		row = self.db.execute('SELECT next FROM names WHERE base = ?', \
+			(name,)).fetchone()
+		i = row[0] if row is not None else 0
+
+		# Only loops if someone used name_XX as a base name.
+		while self.exists(f'{name}_{str(i).zfill(2)}'):
+			i += 1
+
+		return f'{name}_{str(i).zfill(2)}'
+
+	# config is the config section used by the run, the whole config file
+	# is saved.
+	def add_run(self, name, date, numSiPMs, config=None):
+		snapshot = '{}'
+		if config is not None:
+			parser = config.parser
+			snapshot = json.dumps({section : dict(parser[section]) \
+				for section in parser.sections()})
+
+		self.db.execute('INSERT OR REPLACE INTO runs VALUES \
+			(?, ?, \'\', \'\', ?, ?, 0, 0, \'running\')', \
+			(name, date, snapshot, numSiPMs))
+		self.name_taken(name)
+		self.db.commit()
+
+	# Changes columns of a run. Ex. update_run(name, status='finished')
+	def update_run(self, name, **columns):
+		if not columns:
+			return
+
+		keys = ', '.join(f'{key} = ?' for key in columns)
+		self.db.execute(f'UPDATE runs SET {keys} WHERE name = ?', \
+			list(columns.values()) + [name])
+		self.db.commit()
+
+	# Runs that match all the filters given, newest first. since/until
+	# compare against the 'Date' of the run ('YYYY-MM-DD HH:MM:SS'),
+	# name and comment are SQL LIKE patterns.
+	def query(self, status=None, since=None, until=None, name=None, \
+		comment=None, limit=None):
+		conditions = []
+		values = []
+
+		for column, operator, value in [ \
+			('status', '=', status), ('date', '>=', since), \
+			('date', '<=', until), ('name', 'LIKE', name), \
+			('comment', 'LIKE', comment)]:
+
+			if value is not None:
+				conditions.append(f'{column} {operator} ?')
+				values.append(value)
+
+		sql = 'SELECT * FROM runs'
+		if conditions:
+			sql += ' WHERE ' + ' AND '.join(conditions)
+		sql += ' ORDER BY date DESC, name DESC'
+		if limit is not None:
+			sql += f' LIMIT {int(limit)}'
+
+		return [dict(row) for row in self.db.execute(sql, values)]
+
+	def close(self):
+		self.db.close()
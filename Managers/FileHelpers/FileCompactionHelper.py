@@ -0,0 +1,114 @@
+import h5py
+import time
+import os
+
+# HDF5 does not give back the space of deleted groups or of datasets
+# that were trimmed, so a database that had runs deleted or restarted
+# keeps dead bytes forever. Compacting copies everything still linked
+# into a fresh file, with the same layout, chunks, compression and
+# attributes, and replaces the old file with it.
+#
+# Runs saved in their own file (sharding) are compacted one by one,
+# except the ones in 'skip' (ex. the run being written).
+
+# Bytes used by the datasets of the file and size of the file.
+def file_usage(path):
+	live = 0
+
+	def add_storage(name, obj):
+		nonlocal live
+		if isinstance(obj, h5py.Dataset):
+			live += obj.id.get_storage_size()
+
+	with h5py.File(path, 'r') as f:
+		f.visititems(add_storage)
+
+	return (live, os.path.getsize(path))
+
+# Fraction of the file that is not used by datasets. Metadata counts as
+# dead so this is never exactly 0.
+def dead_fraction(path):
+	live, size = file_usage(path)
+
+	if size == 0:
+		return 0.0
+
+	return 1.0 - live/size
+
+# Copies every object and attribute of group src into dst. External and
+# soft links are copied as links, not followed.
+def copy_group(src, dst):
+	dst.attrs.update(src.attrs)
+
+	for name in src.keys():
+		link = src.get(name, getlink=True)
+
+		if isinstance(link, (h5py.ExternalLink, h5py.SoftLink)):
+			dst[name] = link
+		else:
+			src.copy(src[name], dst, name=name)
+
+# Rewrites a single file. Returns the bytes reclaimed. If anything fails
+# (disk full, a reader holding the file on Windows...) the old file is
+# kept as it was, the copy is removed and 0 is returned.
+def compact_file(path):
+	oldSize = os.path.getsize(path)
+	newPath = f'{path}.compact'
+
+	try:
+		with h5py.File(path, 'r') as src, \
+			h5py.File(newPath, 'w', libver='latest') as dst:
+			copy_group(src, dst)
+
+		# Atomic, readers see either the old or the new file.
+		os.replace(newPath, path)
+
+	except Exception as err:
+		print(f'[File] Could not compact {path}: {err}.')
+
+		if os.path.isfile(newPath):
+			os.remove(newPath)
+
+		return 0
+
+	return oldSize - os.path.getsize(path)
+
+# Files that make up the database: itself and the run files it links.
+def database_files(filedir):
+	files = [filedir]
+	folder = os.path.dirname(filedir)
+
+	with h5py.File(filedir, 'r') as f:
+		group = f['SiPMs Measurements']
+
+		for name in group.keys():
+			link = group.get(name, getlink=True)
+
+			if isinstance(link, h5py.ExternalLink):
+				path = os.path.join(folder, link.filename)
+				if os.path.isfile(path):
+					files.append(path)
+
+	return files
+
+# Compacts the files of the database with more than minDeadFraction of
+# dead bytes. Returns (bytes reclaimed, seconds taken).
+def compact_database(filedir, minDeadFraction=0.0, skip=[]):
+	start = time.time()
+	reclaimed = 0
+
+	skip = [os.path.abspath(path) for path in skip]
+
+	for path in database_files(filedir):
+		if os.path.abspath(path) in skip:
+			continue
+
+		if dead_fraction(path) >= minDeadFraction:
+			reclaimed += compact_file(path)
+
+	elapsed = time.time() - start
+
+	print(f'[File] Compacted {filedir}: reclaimed {reclaimed/1e6:.2f} MB \
+in {elapsed:.2f} s.')
+
+	return (reclaimed, elapsed)
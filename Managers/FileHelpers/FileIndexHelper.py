@@ -0,0 +1,73 @@
+import numpy as np
+
+# Keeps the per voltage step index of an IV dataset. Each row of the
+# index says where the rows of one step are in the IV dataset, so a
+# step can be read by slicing instead of scanning the whole dataset.
+#
+# Rows arrive in order and carry their step index (IV_DTYPE 'Step'), a
+# step is open until its index changes or end_step is called. Only the
+# electrometer knows the voltage that was set, it is given at end_step.
+
+STEP_INDEX_DTYPE = np.dtype([ \
+	('Step', 		'<u2'), \
+	('SetVoltage', 	'<f4'), \
+	('StartRow', 	'<u8'), \
+	('Rows', 		'<u8'), \
+	('StartTime', 	'<f8'), \
+	('EndTime', 	'<f8')])
+
+# (start, end) of every group of consecutive rows with the same step.
+def step_segments(rows):
+	if len(rows) == 0:
+		return []
+
+	changes = np.flatnonzero(np.diff(rows['Step'])) + 1
+	starts = np.concatenate(([0], changes))
+	ends = np.concatenate((changes, [len(rows)]))
+
+	return zip(starts, ends)
+
+class StepIndexHelper:
+
+	# appender is the AppendHelper of the index dataset.
+	def __init__(self, appender):
+		self.appender = appender
+		self.current = None
+
+	# rows are the IV rows about to be saved starting at row startRow of
+	# the IV dataset.
+	def add(self, rows, startRow):
+		for start, end in step_segments(rows):
+			step = rows['Step'][start]
+
+			if self.current is not None and self.current['Step'] != step:
+				self.end_step()
+
+			if self.current is None:
+				self.current = { \
+					'Step' 		: step, \
+					'StartRow' 	: startRow + start, \
+					'Rows' 		: 0, \
+					'StartTime' : rows['Time'][start], \
+					'EndTime' 	: rows['Time'][start] }
+
+			self.current['Rows'] += end - start
+			self.current['EndTime'] = rows['Time'][end - 1]
+
+	# Closes the open step and adds it to the index.
+	def end_step(self, setVoltage=np.nan):
+		if self.current is None:
+			return
+
+		self.appender.append(np.array([( \
+			self.current['Step'], \
+			setVoltage, \
+			self.current['StartRow'], \
+			self.current['Rows'], \
+			self.current['StartTime'], \
+			self.current['EndTime'])], dtype=STEP_INDEX_DTYPE))
+
+		self.current = None
+
+	def finish(self):
+		self.end_step()
@@ -0,0 +1,212 @@
+import h5py
+import numpy as np
+import time
+import os
+import shutil
+import subprocess
+
+# Append-only journal of every row of a run, written before the rows
+# reach HDF5. It is a memory-mapped file of fixed-size records, so
+# adding rows is a copy into memory that survives the process crashing
+# (the OS keeps the pages). It is synced to disk every syncTime seconds
+# against power loss.
+#
+# The journal is deleted once the run is fully saved in HDF5. A journal
+# found when the secretary starts belongs to a run that did not finish,
+# sipmFileManager.recover_journals replays it into the run.
+#
+# Records are kept in order and are one of:
+#	- IV 		: an IV_DTYPE row of SiPM 'SiPM'.
+# 	- HT 		: an HT_DTYPE row.
+#	- END_STEP 	: end of a voltage step of SiPM 'SiPM', Value1 is the
+#				  set voltage.
+
+JOURNAL_IV 			= 0
+JOURNAL_HT 			= 1
+JOURNAL_END_STEP 	= 2
+
+JOURNAL_MAGIC = b'SIPMJRNL'
+
+JOURNAL_HEADER_DTYPE = np.dtype([ \
+	('Magic', 		'S8'), 	\
+	('Count', 		'<u8'), \
+	('NumSiPMs', 	'<u4'), \
+	('Name', 		'S236')])
+
+JOURNAL_DTYPE = np.dtype([ \
+	('Kind', 		'u1'), 	\
+	('SiPM', 		'u1'), 	\
+	('Step', 		'<u2'), \
+	('Range', 		'u1'), 	\
+	('Retries', 	'u1'), 	\
+	('Pad', 		'<u2'), \
+	('Time', 		'<f8'), \
+	('Value1', 		'<f4'), \
+	('Value2', 		'<f4')])
+
+class JournalHelper:
+
+	# Creates a new journal for run 'name'.
+	def __init__(self, path, name, numSiPMs, capacity=65536, syncTime=5.0):
+		self.path = path
+		self.syncTime = syncTime
+		self.lastSync = time.time()
+
+		with open(path, 'wb') as f:
+			f.truncate(JOURNAL_HEADER_DTYPE.itemsize)
+
+		self.capacity = 0
+		self.map(capacity)
+
+		self.header['Magic'] = JOURNAL_MAGIC
+		self.header['Count'] = 0
+		self.header['NumSiPMs'] = numSiPMs
+		self.header['Name'] = name.encode('utf-8')
+
+	# Maps the file with room for 'capacity' records.
+	def map(self, capacity):
+		size = JOURNAL_HEADER_DTYPE.itemsize + capacity*JOURNAL_DTYPE.itemsize
+
+		with open(self.path, 'r+b') as f:
+			f.truncate(size)
+
+		self.header = np.memmap(self.path, dtype=JOURNAL_HEADER_DTYPE, \
+			mode='r+', shape=(1,))
+		self.records = np.memmap(self.path, dtype=JOURNAL_DTYPE, mode='r+', \
+			offset=JOURNAL_HEADER_DTYPE.itemsize, shape=(capacity,))
+		self.capacity = capacity
+
+	def unmap(self):
+		self.header.flush()
+		self.records.flush()
+
+		del self.header
+		del self.records
+
+	def add(self, kind, rows, numSiPM=0):
+		count = int(self.header['Count'][0])
+		n = len(rows)
+
+		if count + n > self.capacity:
+			self.unmap()
+			self.map(max(2*self.capacity, count + n))
+
+		new = self.records[count:count + n]
+		new['Kind'] = kind
+		new['SiPM'] = numSiPM
+
+		if kind == JOURNAL_IV:
+			new['Time'] = rows['Time']
+			new['Value1'] = rows['Voltage']
+			new['Value2'] = rows['Current']
+			new['Step'] = rows['Step']
+			new['Range'] = rows['Range']
+			new['Retries'] = rows['Retries']
+		elif kind == JOURNAL_HT:
+			new['Time'] = rows['Time']
+			new['Value1'] = rows['Humidity']
+			new['Value2'] = rows['Temperature']
+		else:
+			new['Value1'] = rows['Value1']
+
+		# The count goes last, a crash in the middle leaves the
+		# journal as it was before this call.
+		self.header['Count'] = count + n
+
+	def add_IV(self, rows, numSiPM):
+		self.add(JOURNAL_IV, rows, numSiPM)
+
+	def add_HT(self, rows):
+		self.add(JOURNAL_HT, rows)
+
+	def end_step(self, numSiPM, setVoltage):
+		row = np.zeros(1, dtype=JOURNAL_DTYPE)
+		row['Value1'] = setVoltage
+
+		self.add(JOURNAL_END_STEP, row, numSiPM)
+
+	def sync(self, onlyExpired=False):
+		if onlyExpired and time.time() - self.lastSync < self.syncTime:
+			return
+
+		self.header.flush()
+		self.records.flush()
+		self.lastSync = time.time()
+
+	# Leaves the journal on disk, to be replayed the next time.
+	def close(self):
+		self.unmap()
+
+	# The run is safe in HDF5, the journal is not needed anymore.
+	def delete(self):
+		self.unmap()
+		os.remove(self.path)
+
+# Reads a journal left by a run that did not finish. Returns
+# (run name, number of SiPMs, records).
+def read_journal(path):
+	header = np.fromfile(path, dtype=JOURNAL_HEADER_DTYPE, count=1)
+
+	if len(header) == 0 or header['Magic'][0] != JOURNAL_MAGIC:
+		raise Exception(f'{path} is not a journal.')
+
+	count = int(header['Count'][0])
+	records = np.fromfile(path, dtype=JOURNAL_DTYPE, count=count, \
+		offset=JOURNAL_HEADER_DTYPE.itemsize)
+
+	return (header['Name'][0].decode('utf-8'), int(header['NumSiPMs'][0]), records)
+
+# Splits the records in groups of consecutive records of the same kind
+# and SiPM, in order. Returns (kind, SiPM, records) for each.
+def journal_segments(records):
+	if len(records) == 0:
+		return []
+
+	key = records['Kind'].astype(np.uint16)*256 + records['SiPM']
+	changes = np.flatnonzero(np.diff(key)) + 1
+	starts = np.concatenate(([0], changes))
+	ends = np.concatenate((changes, [len(records)]))
+
+	return [(int(records['Kind'][start]), int(records['SiPM'][start]), \
+		records[start:end]) for start, end in zip(starts, ends)]
+
+# Turns journal records of one kind into rows of dtype (IV_DTYPE or
+# HT_DTYPE). Value1 and Value2 go to the second and third fields.
+def journal_rows(records, dtype):
+	rows = np.zeros(len(records), dtype=dtype)
+	rows['Time'] = records['Time']
+	rows[dtype.names[1]] = records['Value1']
+	rows[dtype.names[2]] = records['Value2']
+
+	for field in ['Step', 'Range', 'Retries']:
+		if field in dtype.names:
+			rows[field] = records[field]
+
+	return rows
+
+# A file open for writing when the process died is left marked as open
+# and HDF5 refuses to open it again. The mark is cleared with h5clear of
+# the HDF5 tools, which also moves the end of file to the real size.
+# Does nothing (returns False) if the file opens.
+def clear_file_flags(path):
+	try:
+		with h5py.File(path, 'r'):
+			return False
+	except OSError:
+		pass
+
+	h5clear = shutil.which('h5clear')
+	if h5clear is None:
+		raise Exception(f'{path} was left open by a run that did not \
+finish and h5clear (HDF5 tools) was not found. Run \'h5clear -s --increment \
+{path}\' and start again.')
+
+	result = subprocess.run([h5clear, '-s', '--increment', path], \
+		capture_output=True, text=True)
+
+	if result.returncode != 0:
+		raise Exception(f'h5clear could not clear {path}: \
+{result.stderr.strip()}. Run \'h5clear -s --increment {path}\' by hand.')
+
+	print(f'[File] Cleared the open marks of {path}.')
+	return True
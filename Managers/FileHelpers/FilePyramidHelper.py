@@ -0,0 +1,100 @@
+import numpy as np
+
+# Decimated copies of a measurement dataset, to browse long runs without
+# reading every row. Level k (dataset <name>_level<k>) has one bin per
+# factor^k consecutive rows with the min, max and mean of each field,
+# so bin i of level k always covers rows [i*factor^k, (i + 1)*factor^k).
+# Only the last bin of a level can have fewer rows.
+#
+# The levels are built while the rows arrive, every level keeps less
+# than 'factor' bins waiting for the next one. finish() writes the last,
+# partial, bins and is called when the run ends.
+#
+# sipmFileReader.read_decimated picks the level to read.
+
+def pyramid_dtype(fields):
+	dtype = [ \
+		('StartTime', 	'<f8'), \
+		('EndTime', 	'<f8'), \
+		('Rows', 		'<u4')]
+
+	for field in fields:
+		dtype += [ \
+			(f'Min{field}', 	'<f4'), \
+			(f'Max{field}', 	'<f4'), \
+			(f'Mean{field}', 	'<f8')]
+
+	return np.dtype(dtype)
+
+# Rows as bins of one row.
+def to_bins(rows, fields, dtype):
+	bins = np.zeros(len(rows), dtype=dtype)
+	bins['StartTime'] = rows['Time']
+	bins['EndTime'] = rows['Time']
+	bins['Rows'] = 1
+
+	for field in fields:
+		bins[f'Min{field}'] = rows[field]
+		bins[f'Max{field}'] = rows[field]
+		bins[f'Mean{field}'] = rows[field]
+
+	return bins
+
+# Merges every 'factor' consecutive bins into one, the last group can
+# be shorter.
+def merge_bins(bins, factor, fields):
+	starts = np.arange(0, len(bins), factor)
+	ends = np.minimum(starts + factor, len(bins)) - 1
+
+	merged = np.zeros(len(starts), dtype=bins.dtype)
+	merged['StartTime'] = bins['StartTime'][starts]
+	merged['EndTime'] = bins['EndTime'][ends]
+	merged['Rows'] = np.add.reduceat(bins['Rows'], starts)
+
+	for field in fields:
+		merged[f'Min{field}'] = np.fmin.reduceat(bins[f'Min{field}'], starts)
+		merged[f'Max{field}'] = np.fmax.reduceat(bins[f'Max{field}'], starts)
+		merged[f'Mean{field}'] = np.add.reduceat( \
+			bins[f'Mean{field}']*bins['Rows'], starts)/merged['Rows']
+
+	return merged
+
+class PyramidHelper:
+
+	# appenders[k] writes level k + 1.
+	def __init__(self, appenders, factor, fields):
+		self.appenders = appenders
+		self.factor = factor
+		self.fields = fields
+		self.dtype = pyramid_dtype(fields)
+
+		# Bins of the level below waiting to complete a bin of each level.
+		self.pending = [np.zeros(0, dtype=self.dtype) for appender in appenders]
+
+	def add(self, rows):
+		bins = to_bins(rows, self.fields, self.dtype)
+
+		for level, appender in enumerate(self.appenders):
+			bins = np.concatenate((self.pending[level], bins))
+			full = len(bins) - len(bins) % self.factor
+
+			self.pending[level] = bins[full:]
+
+			if full == 0:
+				break
+
+			bins = merge_bins(bins[:full], self.factor, self.fields)
+			appender.append(bins)
+
+	def finish(self):
+		last = np.zeros(0, dtype=self.dtype)
+
+		for level, appender in enumerate(self.appenders):
+			bins = np.concatenate((self.pending[level], last))
+			self.pending[level] = np.zeros(0, dtype=self.dtype)
+
+			if len(bins) == 0:
+				continue
+
+			last = merge_bins(bins, self.factor, self.fields)
+			appender.append(last)
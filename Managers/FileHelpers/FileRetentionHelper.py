@@ -0,0 +1,145 @@
+import numpy as np
+
+from Managers.FileHelpers.FileIndexHelper import step_segments
+from Managers.FileHelpers.FileStatsHelper import RunningStats
+
+# Decides which IV rows are saved in IV_i. The step summaries always
+# get every row, so they stay exact whatever is thrown away here.
+# Policies:
+#	- all 		: every row.
+#	- every 	: one every 'every' rows of each step, starting with the
+#				  first one.
+#	- anomalies : the first 'window' rows of each step, the rows where
+#				  the picoammeter changed range or had to retry, and the
+#				  rows more than 'sigma' standard deviations away from
+#				  the mean of the step so far. Each of the last two with
+#				  the 'window' rows before and after them.
+#
+# The index of the IV dataset (FileIndexHelper) and the decimation
+# levels (FilePyramidHelper) describe the rows that were saved.
+
+RETENTION_POLICIES = ['all', 'every', 'anomalies']
+
+# Fields checked for anomalies and rows of a step needed before checking.
+ANOMALY_FIELDS = ['Voltage', 'Current']
+ANOMALY_MIN_ROWS = 10
+
+# True for the values more than sigma standard deviations away from the
+# mean of the values of the step before them (the ones in stats and the
+# ones before them in values).
+def outliers(values, stats, sigma):
+	values = np.asarray(values, dtype=np.float64)
+
+	# Shifted by the mean so far to keep the sums small.
+	reference = stats.mean if stats.n > 0 else values[0]
+	shifted = values - reference
+
+	n = stats.n + np.arange(len(values))
+	sums = np.concatenate(([0.0], np.cumsum(shifted)[:-1]))
+	squares = stats.M2 + np.concatenate(([0.0], np.cumsum(shifted**2)[:-1]))
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		mean = sums/n
+		variance = (squares - sums*mean)/(n - 1)
+		far = np.abs(shifted - mean) > sigma*np.sqrt(variance)
+
+	return far & (n >= ANOMALY_MIN_ROWS)
+
+class RetentionHelper:
+
+	def __init__(self, policy='all', every=10, sigma=5.0, window=10):
+		if policy not in RETENTION_POLICIES:
+			raise Exception(f'Unknown retention policy {policy}, use one of \
+{RETENTION_POLICIES}.')
+
+		self.policy = policy
+		self.every = every
+		self.sigma = sigma
+		self.window = window
+
+		self.step = None
+		self.stepRows = 0
+		self.stats = {}
+		self.lastRange = None
+
+		# Rows after the last anomaly and rows thrown away since the last
+		# row kept (only the last 'window'), for the rows around anomalies
+		# that span two batches.
+		self.sinceAnomaly = window + 1
+		self.dropped = None
+
+	# Attributes saved with the run.
+	def attributes(self):
+		return { \
+			'Retention' 		: self.policy, \
+			'RetentionEvery' 	: self.every, \
+			'RetentionSigma' 	: self.sigma, \
+			'RetentionWindow' 	: self.window }
+
+	# Returns the rows to save.
+	def filter(self, rows):
+		if self.policy == 'all' or len(rows) == 0:
+			return rows
+
+		keep = np.zeros(len(rows), dtype=bool)
+		anomaly = np.zeros(len(rows), dtype=bool)
+		dropped = self.dropped
+
+		for start, end in step_segments(rows):
+			step = rows['Step'][start]
+
+			if step != self.step:
+				self.step = step
+				self.stepRows = 0
+				self.stats = {field : RunningStats() for field in ANOMALY_FIELDS}
+
+				# Rows around anomalies do not go back to another step.
+				if start == 0:
+					dropped = None
+
+			position = self.stepRows + np.arange(end - start)
+			self.stepRows += end - start
+
+			if self.policy == 'every':
+				keep[start:end] = position % self.every == 0
+				continue
+
+			keep[start:end] = position < self.window
+
+			for field in ANOMALY_FIELDS:
+				values = rows[field][start:end]
+
+				anomaly[start:end] |= outliers(values, self.stats[field], self.sigma)
+				self.stats[field].add(values)
+
+		if self.policy == 'every':
+			return rows[keep]
+
+		lastRange = rows['Range'][0] if self.lastRange is None else self.lastRange
+		anomaly |= np.diff(rows['Range'].astype(int), prepend=lastRange) != 0
+		anomaly |= rows['Retries'] > 0
+		self.lastRange = rows['Range'][-1]
+
+		if dropped is not None:
+			rows = np.concatenate((dropped, rows))
+			keep = np.concatenate((np.zeros(len(dropped), dtype=bool), keep))
+			anomaly = np.concatenate((np.zeros(len(dropped), dtype=bool), anomaly))
+
+		index = np.arange(len(rows))
+
+		# Rows after an anomaly.
+		last = np.maximum.accumulate(np.where(anomaly, index, \
+			-1 - self.sinceAnomaly))
+		keep |= index - last <= self.window
+		self.sinceAnomaly = len(rows) - 1 - last[-1]
+
+		# Rows before an anomaly.
+		following = np.minimum.accumulate(np.where(anomaly, index, \
+			len(rows) + self.window + 1)[::-1])[::-1]
+		keep |= following - index <= self.window
+
+		kept = np.flatnonzero(keep)
+		lastKept = kept[-1] if len(kept) > 0 else -1
+		self.dropped = rows[max(lastKept + 1, len(rows) - self.window):]
+
+		return rows[keep]
@@ -0,0 +1,181 @@
+import numpy as np
+
+from Managers.FileHelpers.FileIndexHelper import step_segments
+
+# Running statistics of the measurements, computed as the rows arrive so
+# nobody has to go through the raw rows to get them:
+#	- StepSummaryHelper : mean, std, min and max of the voltage and
+#						  current of every voltage step (IV_i_summary).
+#	- WindowSummaryHelper : same for the humidity and temperature over
+#						  fixed time windows (HT_summary).
+
+STEP_SUMMARY_DTYPE = np.dtype([ \
+	('Step', 			'<u2'), \
+	('SetVoltage', 		'<f4'), \
+	('Rows', 			'<u8'), \
+	('StartTime', 		'<f8'), \
+	('EndTime', 		'<f8'), \
+	('MeanVoltage', 	'<f8'), \
+	('StdVoltage', 		'<f8'), \
+	('MinVoltage', 		'<f4'), \
+	('MaxVoltage', 		'<f4'), \
+	('MeanCurrent', 	'<f8'), \
+	('StdCurrent', 		'<f8'), \
+	('MinCurrent', 		'<f4'), \
+	('MaxCurrent', 		'<f4')])
+
+WINDOW_SUMMARY_DTYPE = np.dtype([ \
+	('StartTime', 		'<f8'), \
+	('EndTime', 		'<f8'), \
+	('Rows', 			'<u8'), \
+	('MeanHumidity', 	'<f8'), \
+	('StdHumidity', 	'<f8'), \
+	('MinHumidity', 	'<f4'), \
+	('MaxHumidity', 	'<f4'), \
+	('MeanTemperature', '<f8'), \
+	('StdTemperature', 	'<f8'), \
+	('MinTemperature', 	'<f4'), \
+	('MaxTemperature', 	'<f4')])
+
+# Welford's running mean and variance of a single variable. Batches are
+# merged with Chan's formula so adding an array costs one numpy pass.
+class RunningStats:
+
+	def __init__(self):
+		self.n = 0
+		self.mean = 0.0
+		self.M2 = 0.0
+		self.min = np.inf
+		self.max = -np.inf
+
+	def add(self, values):
+		values = np.asarray(values, dtype=np.float64)
+		nb = len(values)
+
+		if nb == 0:
+			return
+
+		meanb = values.mean()
+		M2b = np.sum((values - meanb)**2)
+
+		n = self.n + nb
+		delta = meanb - self.mean
+
+		self.mean += delta*nb/n
+		self.M2 += M2b + delta*delta*self.n*nb/n
+		self.n = n
+
+		self.min = min(self.min, values.min())
+		self.max = max(self.max, values.max())
+
+	# Sample standard deviation.
+	def std(self):
+		if self.n < 2:
+			return 0.0
+
+		return np.sqrt(self.M2/(self.n - 1))
+
+# Per voltage step statistics of an IV dataset, a row is added to the
+# summary when the step ends.
+class StepSummaryHelper:
+
+	# appender is the AppendHelper of the summary dataset.
+	def __init__(self, appender):
+		self.appender = appender
+		self.current = None
+
+	def add(self, rows):
+		for start, end in step_segments(rows):
+			step = rows['Step'][start]
+
+			if self.current is not None and self.current['Step'] != step:
+				self.end_step()
+
+			if self.current is None:
+				self.current = { \
+					'Step' 		: step, \
+					'StartTime' : rows['Time'][start], \
+					'EndTime' 	: rows['Time'][start], \
+					'Voltage' 	: RunningStats(), \
+					'Current' 	: RunningStats() }
+
+			self.current['Voltage'].add(rows['Voltage'][start:end])
+			self.current['Current'].add(rows['Current'][start:end])
+			self.current['EndTime'] = rows['Time'][end - 1]
+
+	def end_step(self, setVoltage=np.nan):
+		if self.current is None:
+			return
+
+		volt = self.current['Voltage']
+		curr = self.current['Current']
+
+		self.appender.append(np.array([( \
+			self.current['Step'], setVoltage, volt.n, \
+			self.current['StartTime'], self.current['EndTime'], \
+			volt.mean, volt.std(), volt.min, volt.max, \
+			curr.mean, curr.std(), curr.min, curr.max)], \
+			dtype=STEP_SUMMARY_DTYPE))
+
+		self.current = None
+
+	def finish(self):
+		self.end_step()
+
+# Statistics of the HT dataset over windows of 'window' seconds. Windows
+# are aligned to the first row of the run and only added to the summary
+# once a row past them arrives or the run ends.
+class WindowSummaryHelper:
+
+	def __init__(self, appender, window=60.0):
+		self.appender = appender
+		self.window = window
+
+		self.origin = None
+		self.current = None
+
+	def add(self, rows):
+		if len(rows) == 0:
+			return
+
+		if self.origin is None:
+			self.origin = rows['Time'][0]
+
+		windows = np.floor((rows['Time'] - self.origin)/self.window)
+		changes = np.flatnonzero(np.diff(windows)) + 1
+		starts = np.concatenate(([0], changes))
+		ends = np.concatenate((changes, [len(rows)]))
+
+		for start, end in zip(starts, ends):
+			if self.current is not None and self.current['Window'] != windows[start]:
+				self.end_window()
+
+			if self.current is None:
+				self.current = { \
+					'Window' 		: windows[start], \
+					'StartTime' 	: rows['Time'][start], \
+					'EndTime' 		: rows['Time'][start], \
+					'Humidity' 		: RunningStats(), \
+					'Temperature' 	: RunningStats() }
+
+			self.current['Humidity'].add(rows['Humidity'][start:end])
+			self.current['Temperature'].add(rows['Temperature'][start:end])
+			self.current['EndTime'] = rows['Time'][end - 1]
+
+	def end_window(self):
+		if self.current is None:
+			return
+
+		hum = self.current['Humidity']
+		temp = self.current['Temperature']
+
+		self.appender.append(np.array([( \
+			self.current['StartTime'], self.current['EndTime'], hum.n, \
+			hum.mean, hum.std(), hum.min, hum.max, \
+			temp.mean, temp.std(), temp.min, temp.max)], \
+			dtype=WINDOW_SUMMARY_DTYPE))
+
+		self.current = None
+
+	def finish(self):
+		self.end_window()
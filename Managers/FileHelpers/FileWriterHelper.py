@@ -0,0 +1,154 @@
+import threading
+import queue
+import time
+import traceback
+import sys
+
+# Runs the HDF5 writes of the secretary in their own thread so a slow
+# disk does not delay the routing of commands. Writes are handed over
+# through a bounded buffer of maxItems jobs. When the buffer is full the
+# secretary waits (backpressure), how often and for how long is kept in
+# the stats.
+#
+# Jobs run in the order they were submitted. If one fails the rest are
+# skipped and the error is raised in the secretary on the next submit(),
+# wait() or stop(). failed stays True from then on: some rows did not
+# reach the file and the run has to be recovered from its journal.
+#
+# With threaded=False jobs run right away in the caller, as before.
+#
+# background() is for long jobs that may fail without stopping the
+# secretary (compacting the runs that ended). They run in a thread of
+# their own, outside the writer queue, so the writes and the secretary
+# never wait for them. They must not touch what the writer writes. Their
+# errors are only printed.
+
+class WriterHelper:
+
+	def __init__(self, maxItems=256, threaded=True):
+		self.threaded = threaded
+		self.queue = queue.Queue(maxsize=maxItems)
+		self.error = None
+		self.failed = False
+
+		self.maxDepth = 0
+		self.blocked = 0
+		self.blockedTime = 0.0
+
+		# Thread of the last background() job.
+		self.backgroundThread = None
+
+		self.thread = None
+		if threaded:
+			self.thread = threading.Thread(target=self.run, name='Writer', \
+				daemon=True)
+			self.thread.start()
+
+	def run(self):
+		while True:
+			function, args, kwargs = self.queue.get()
+
+			try:
+				if function is None:
+					return
+
+				if self.error is None:
+					function(*args, **kwargs)
+			except Exception as err:
+				self.error = err
+				self.failed = True
+				traceback.print_exc(file=sys.stdout)
+			finally:
+				self.queue.task_done()
+
+	def raise_error(self):
+		if self.error is not None:
+			error = self.error
+			self.error = None
+			raise error
+
+	# Queues function(*args, **kwargs) to be run by the writer.
+	def submit(self, function, *args, **kwargs):
+		if not self.threaded:
+			try:
+				function(*args, **kwargs)
+			except Exception:
+				self.failed = True
+				raise
+
+			return
+
+		self.raise_error()
+
+		try:
+			self.queue.put_nowait((function, args, kwargs))
+		except queue.Full:
+			start = time.perf_counter()
+			self.queue.put((function, args, kwargs))
+
+			self.blocked += 1
+			self.blockedTime += time.perf_counter() - start
+
+		self.maxDepth = max(self.maxDepth, self.queue.qsize())
+
+	# Waits until every job submitted is done. After this the file can be
+	# used from the secretary thread until the next submit.
+	def wait(self):
+		if self.threaded:
+			self.queue.join()
+			self.raise_error()
+
+	# Runs function(*args, **kwargs) without waiting for it, one at a
+	# time. Errors are printed, never raised.
+	def background(self, function, *args, **kwargs):
+		def job():
+			try:
+				function(*args, **kwargs)
+			except Exception as err:
+				print(f'[File] Background job failed: {err}.')
+				traceback.print_exc(file=sys.stdout)
+
+		self.join_background()
+		self.backgroundThread = threading.Thread(target=job, \
+			name='Background', daemon=True)
+		self.backgroundThread.start()
+
+	# True while a background() job runs.
+	def busy(self):
+		return self.backgroundThread is not None and \
+			self.backgroundThread.is_alive()
+
+	def join_background(self):
+		if self.backgroundThread is not None:
+			self.backgroundThread.join()
+			self.backgroundThread = None
+
+	# Runs function in the caller once the writer is done with the rest.
+	def call(self, function, *args, **kwargs):
+		self.wait()
+		return function(*args, **kwargs)
+
+	def depth(self):
+		return self.queue.qsize()
+
+	# Returns (max depth, times blocked, seconds blocked) since the last
+	# call.
+	def stats(self):
+		stats = (self.maxDepth, self.blocked, self.blockedTime)
+
+		self.maxDepth = self.depth()
+		self.blocked = 0
+		self.blockedTime = 0.0
+
+		return stats
+
+	# Finishes the jobs left (background ones too) and ends the thread.
+	def stop(self):
+		self.join_background()
+
+		if self.thread is None or not self.thread.is_alive():
+			return
+
+		self.queue.put((None, (), {}))
+		self.thread.join()
+		self.raise_error()
@@ -1,9 +1,24 @@
 import h5py
+import numpy as np
 import time
 import os
 import datetime
 from enum import Enum
 
+from Managers.FileHelpers.FileAppendHelper import AppendHelper
+from Managers.FileHelpers.FileIndexHelper import (StepIndexHelper, \
+	STEP_INDEX_DTYPE)
+from Managers.FileHelpers.FileStatsHelper import (StepSummaryHelper, \
+	WindowSummaryHelper, STEP_SUMMARY_DTYPE, WINDOW_SUMMARY_DTYPE)
+from Managers.FileHelpers.FileCatalogHelper import CatalogHelper
+from Managers.FileHelpers.FileCompactionHelper import compact_database
+from Managers.FileHelpers.FilePyramidHelper import (PyramidHelper, \
+	pyramid_dtype)
+from Managers.FileHelpers.FileRetentionHelper import RetentionHelper
+from Managers.FileHelpers.FileJournalHelper import (JournalHelper, \
+	read_journal, journal_segments, journal_rows, clear_file_flags, \
+	JOURNAL_IV, JOURNAL_HT, JOURNAL_END_STEP)
+
 # Processes enum
 class Process(Enum):
 	NONE = 1
@@ -13,29 +28,300 @@ class Process(Enum):
 	SECRETARY = 5
 	ALL = 6
 
+# Row of an I-V measurement. Step is the index of the voltage step of
+# the SiPM, Range the picoammeter range (0 = lowest) and Retries the
+# number of range changes needed to get the reading.
+IV_DTYPE = np.dtype([ \
+	('Time', 		'<f8'), \
+	('Voltage', 	'<f4'), \
+	('Current', 	'<f4'), \
+	('Step', 		'<u2'), \
+	('Range', 		'u1'), 	\
+	('Retries', 	'u1')])
+
+# Row of a humidity/temperature measurement.
+HT_DTYPE = np.dtype([ \
+	('Time', 		'<f8'), \
+	('Humidity', 	'<f4'), \
+	('Temperature', '<f4')])
+
+# Rows given one at a time to add_IV are handed to add_IV_batch in
+# groups of this size, the helpers of the run cost the same for one row
+# as for a batch.
+IV_ROW_GROUP = 256
+
+# Fields of IV_i and HT kept in their decimation levels.
+IV_PYRAMID_FIELDS = ['Voltage', 'Current']
+HT_PYRAMID_FIELDS = ['Humidity', 'Temperature']
+
+# Turns the measurements into an array of rows with the given dtype.
+# meas can be an array of rows, a list of arrays of rows or a list of
+# tuples/lists with one value per field.
+def to_records(meas, dtype):
+	if isinstance(meas, np.ndarray) and meas.dtype == dtype:
+		return meas
+
+	if len(meas) > 0 and isinstance(meas[0], np.ndarray) \
+		and meas[0].dtype == dtype:
+		return np.concatenate(meas)
+
+	return np.array([tuple(row) for row in meas], dtype=dtype)
+
+# Reads an option from the [FILE] section of the config, if the config
+# or the key are missing the default is used. The type of the default
+# decides how the value is parsed.
+def read_option(config, key, default):
+	if config is None or key not in config:
+		return default
+
+	if isinstance(default, bool):
+		return config.getboolean(key)
+
+	return type(default)(config[key])
+
+# Folder of the journals of database filedir, see FileJournalHelper.
+def journal_folder(filedir):
+	return os.path.join(os.path.dirname(filedir), \
+		os.path.splitext(os.path.basename(filedir))[0] + '_journal')
+
+# Journals of runs that did not finish in folder journalDir.
+def journals_in(journalDir):
+	if not os.path.isdir(journalDir):
+		return []
+
+	return [os.path.join(journalDir, entry) \
+		for entry in sorted(os.listdir(journalDir)) \
+		if entry.endswith('.journal')]
+
+# A run that did not finish leaves the database marked as open and it
+# can not be opened again until the mark is cleared (clear_file_flags).
+# To be called before opening the database with sipmFileManager, only
+# does something if there are journals left and the database does not
+# open. Run files of sharded databases are cleared by recover_journals.
+def clear_unfinished_database(filedir, config=None):
+	if not read_option(config, 'Journal', False) or \
+		not journals_in(journal_folder(filedir)) or \
+		not os.path.isfile(filedir):
+		return False
+
+	return clear_file_flags(filedir)
+
 class sipmFileManager:
 
-	def __init__(self, filedir, numSiPMs = 1):
+	def __init__(self, filedir, numSiPMs = 1, config = None):
 		self.filedir = filedir
 		self.database_name = ''
-		self.HTsize = 0
-		self.IVsize = 0
 		self.TotalPreCooling = 0
 		self.TotalPostCooling = 0
 		self.NumSiPMs = numSiPMs
 
-		if os.path.isfile(filedir):
-			print(f'[File] Opening database {filedir} in append mode.')
+		# Append engine options. See FileAppendHelper for more info.
+		self.chunkRows = read_option(config, 'ChunkRows', 1024)
+		self.flushRows = read_option(config, 'FlushRows', 1024)
+		self.flushTime = read_option(config, 'FlushTime', 5.0)
+		self.flushOnStep = read_option(config, 'FlushOnStep', True)
+		self.growth = read_option(config, 'Growth', 'geometric')
+
+		# Dataset layout. Compression can be none, gzip or lzf,
+		# CompressionLevel is only used by gzip (0-9).
+		self.compression = read_option(config, 'Compression', 'none')
+		self.compressionLevel = read_option(config, 'CompressionLevel', 4)
+		self.shuffle = read_option(config, 'Shuffle', False)
+
+		# Length in seconds of the windows of HT_summary.
+		self.HTSummaryWindow = read_option(config, 'HTSummaryWindow', 60.0)
+
+		# Decimation levels of IV_i and HT, see FilePyramidHelper.
+		self.pyramid = read_option(config, 'Pyramid', False)
+		self.pyramidFactor = read_option(config, 'PyramidFactor', 16)
+		self.pyramidLevels = read_option(config, 'PyramidLevels', 3)
+
+		# Which raw IV rows are saved, see FileRetentionHelper.
+		self.retention = read_option(config, 'Retention', 'all')
+		self.retentionEvery = read_option(config, 'RetentionEvery', 10)
+		self.retentionSigma = read_option(config, 'RetentionSigma', 5.0)
+		self.retentionWindow = read_option(config, 'RetentionWindow', 10)
+
+		# Single writer/multiple reader mode. The file switches to SWMR
+		# when the first row of a run is written. From then on nothing
+		# can be created in the file, so attributes are kept in memory
+		# until the run ends. See FileReader for the reader side.
+		self.swmr = read_option(config, 'SWMR', False)
+		self.swmrActive = False
+		self.pendingAttrs = {}
+
+		# Each run in its own file (DBName_runs/<run>.hdf5), linked from
+		# the database with an external link. The database is only open
+		# while runs are created or deleted, the run file is the one
+		# written (and the one in SWMR mode).
+		self.sharding = read_option(config, 'Sharding', False)
+		self.shard_dir = os.path.splitext(os.path.basename(filedir))[0] + '_runs'
+		self.run_path = filedir
 
-			self.file = h5py.File(filedir, 'a', libver='latest')
+		# Crash-safe journal of the run being written, in the
+		# DBName_journal folder. See FileJournalHelper.
+		self.journal = read_option(config, 'Journal', False)
+		self.journal_dir = journal_folder(filedir)
+		self.run_journal = None
+
+		self.config = config
+		self.curr_meas = None
+		self.IV_appenders = []
+		self.HT_appender = None
+		self.step_indexes = []
+		self.step_summaries = []
+		self.HT_summary = None
+		self.pyramids = {}
+		self.retentions = []
+		self.pendingIV = []
+
+		self.open_file()
+		self.run_file = self.file
+
+		# Sidecar run catalog, see FileCatalogHelper.
+		self.catalog = None
+		if read_option(config, 'Catalog', False):
+			self.catalog = CatalogHelper(f'{filedir}.catalog.sqlite')
+
+			if not self.catalog.matches(self.sipm_group):
+				self.catalog.rebuild(self.sipm_group)
+
+		self.release_database()
+
+	def open_file(self, locking=None):
+		if os.path.isfile(self.filedir):
+			print(f'[File] Opening database {self.filedir} in append mode.')
+
+			self.file = h5py.File(self.filedir, 'a', libver='latest', \
+				locking=locking)
 			self.sipm_group = self.file['SiPMs Measurements']
 
 		else:
 			print('[File] Database does not exist. Creating...')
-			self.file = h5py.File(filedir, 'w', libver='latest')
+			self.file = h5py.File(self.filedir, 'w', libver='latest', \
+				locking=locking)
 			self.sipm_group = self.file.create_group('SiPMs Measurements')
 
-		# self.file.swmr_mode = True
+	# Only used with sharding, opens the database to add or remove runs
+	# and closes it after so readers can open it. As in end_swmr, open
+	# readers must not block the writer.
+	def acquire_database(self):
+		if self.sharding and not self.file:
+			self.open_file(locking=False if self.swmr else None)
+
+	def release_database(self):
+		if self.sharding and self.file:
+			self.file.close()
+
+	def open_run_file(self, mode, locking=None):
+		self.run_file = h5py.File(self.run_path, mode, libver='latest', \
+			locking=locking)
+		self.curr_meas = self.run_file['/']
+
+	def start_swmr(self):
+		if self.swmr and not self.swmrActive:
+			print('[File] Starting SWMR mode. The database can be read now.')
+			self.run_file.swmr_mode = True
+			self.swmrActive = True
+
+	# HDF5 only allows leaving SWMR mode by closing the file, so it is
+	# reopened and the attributes added during the run are saved.
+	# Readers may still have the file open, file locking is disabled so
+	# the reopen does not fail. Readers see the changes after reopen().
+	def end_swmr(self):
+		if not self.swmrActive:
+			return
+
+		self.trim_datasets()
+
+		names = self.detach_run()
+		self.swmrActive = False
+		self.attach_run(names, locking=False)
+
+		for key, value in self.pendingAttrs.items():
+			self.curr_meas.attrs[key] = value
+		self.pendingAttrs = {}
+
+	# Closes the file of the current run, the datasets are cut to their
+	# real length first. Returns what attach_run needs to open it again.
+	def detach_run(self):
+		for appender in self.appenders():
+			appender.trim()
+
+		names = [appender.dataset.name for appender in self.appenders()]
+		self.run_file.close()
+
+		return names
+
+	# Reopens the file of the current run and points every dataset of
+	# the run to it again.
+	def attach_run(self, names, locking=None):
+		if self.sharding:
+			self.open_run_file('a', locking=locking)
+		else:
+			self.open_file(locking=locking)
+			self.run_file = self.file
+
+			if self.curr_meas is not None:
+				self.curr_meas = self.sipm_group[self.database_name]
+
+		for appender, name in zip(self.appenders(), names):
+			appender.dataset = self.run_file[name]
+
+		self.IV_measurements = [appender.dataset for appender in self.IV_appenders]
+		if self.HT_appender is not None:
+			self.HT_measurements = self.HT_appender.dataset
+
+	# Rewrites the database without the space left by deleted and
+	# restarted runs, see FileCompactionHelper. Files with less than
+	# minDeadFraction of dead bytes are left alone. Not possible in SWMR
+	# mode as the file can not be closed in the middle of a run.
+	# Compacting is only a cleanup, if it fails the error is printed and
+	# the database stays as it was.
+	def compact(self, minDeadFraction=0.0):
+		if self.swmrActive:
+			print('[File] Can not compact the database in SWMR mode.')
+			return (0, 0.0)
+
+		if self.sharding:
+			# Only the run being written is open.
+			return self.try_compact(minDeadFraction, \
+				skip=[self.run_path] if self.run_file else [])
+
+		names = self.detach_run() if self.run_file else None
+		if self.file:
+			self.file.close()
+
+		try:
+			return self.try_compact(minDeadFraction)
+		finally:
+			if names is not None:
+				self.attach_run(names)
+			else:
+				self.open_file()
+
+	# Compacts the files of the runs that ended (Sharding) but not the
+	# ones in skip, files_in_use() when it is called. Nothing else touches
+	# them, so it can run in a thread of its own while the run is written.
+	def compact_runs(self, minDeadFraction=0.0, skip=[]):
+		if not self.sharding:
+			print('[File] Only the runs of a sharded database can be \
+compacted while writing.')
+			return (0, 0.0)
+
+		return self.try_compact(minDeadFraction, skip=skip)
+
+	# Files written while a run goes on: the database (runs are created
+	# and deleted in it) and the file of the run.
+	def files_in_use(self):
+		return [self.filedir] + ([self.run_path] if self.run_file else [])
+
+	def try_compact(self, minDeadFraction, skip=[]):
+		try:
+			return compact_database(self.filedir, minDeadFraction, skip=skip)
+		except Exception as err:
+			print(f'[File] Could not compact the database: {err}.')
+			return (0, 0.0)
 
 	def add_options(self, options):
 		if self.curr_meas:
@@ -43,7 +329,14 @@ class sipmFileManager:
 
 	def add_attribute(self, key, value):
 		if self.curr_meas:
-			self.curr_meas.attrs[key] = value
+			if self.swmrActive:
+				self.pendingAttrs[key] = value
+			else:
+				self.curr_meas.attrs[key] = value
+
+			if self.catalog is not None and key in ['Comment', 'Error']:
+				self.catalog.update_run(self.database_name, \
+					**{key.lower() : str(value)})
 		
 			print(f'[File] Adding key \'{key}\' with value \'{value}\' to database.')
 		else:
@@ -69,50 +362,552 @@ class sipmFileManager:
 				i += 1
 
 
+	# Creates the run in its own file and links it from the database.
+	def create_shard(self, name):
+		self.acquire_database()
+
+		# Same renaming as rename_and_save but for links.
+		i = 0
+		new_name = name
+		while self.sipm_group.get(new_name, getlink=True) is not None:
+			new_name = f'{name}_{str(i).zfill(2)}'
+			i += 1
+
+		if new_name != name:
+			print(f'[File] File renamed to {new_name}.')
+
+		self.database_name = new_name
+
+		# Links are relative to the folder of the database.
+		link = f'{self.shard_dir}/{new_name}.hdf5'
+		folder = os.path.dirname(self.filedir)
+		os.makedirs(os.path.join(folder, self.shard_dir), exist_ok=True)
+
+		self.run_path = os.path.join(folder, link)
+		self.open_run_file('w')
+
+		self.sipm_group[new_name] = h5py.ExternalLink(link, '/')
+		self.release_database()
+
+	# Closes the file of the last run when sharding.
+	def close_run_file(self):
+		if self.run_file is not self.file and self.run_file:
+			self.run_file.close()
+
 	def create_dataset(self, dbName, n=1):
+		# The catalog knows the next free name without probing the file.
+		if self.catalog is not None:
+			dbName = self.catalog.allocate_name(dbName)
+
 		self.database_name = dbName
 
 		print(f'[File] Creating group with name {dbName}.')
 
-		# Trying to create file with this name.
-		try:
-			self.curr_meas = self.sipm_group.create_group(dbName)
-		except ValueError as err:
-			# If fails to create file with this name rename it by adding _XX until it succeds
-			# maybe not the most efficient way to do it.
-			print('[File] File with that name already exists. Renaming.')
-			self.rename_and_save(dbName)
+		if self.sharding:
+			self.close_run_file()
+			self.create_shard(dbName)
+		else:
+			# Trying to create file with this name.
+			try:
+				self.curr_meas = self.sipm_group.create_group(dbName)
+			except ValueError as err:
+				# If fails to create file with this name rename it by adding _XX until it succeds
+				# maybe not the most efficient way to do it.
+				print('[File] File with that name already exists. Renaming.')
+				self.rename_and_save(dbName)
 			
 		self.curr_meas.attrs['Date'] = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
 		self.curr_meas.attrs['Author'] = 'Queens SiPM Group'
 
+		if self.catalog is not None:
+			self.catalog.add_run(self.database_name, \
+				self.curr_meas.attrs['Date'], self.NumSiPMs, self.config)
+
+		self.bind_run(self.NumSiPMs, self.create_measurement)
+		self.HT_summary.appender.dataset.attrs['Window'] = self.HTSummaryWindow
+		self.curr_meas.attrs.update(self.retentions[0].attributes())
+
+		if self.journal:
+			os.makedirs(self.journal_dir, exist_ok=True)
+			self.run_journal = JournalHelper(os.path.join(self.journal_dir, \
+				f'{self.database_name}.journal'), self.database_name, \
+				self.NumSiPMs, syncTime=self.flushTime)
+
+	# Creates the appenders and helpers of every dataset of the current
+	# run. measurement(name, dtype) returns the dataset to use. retention
+	# is (policy, every, sigma, window), the config one if None.
+	def bind_run(self, numSiPMs, measurement, retention=None):
 		# Create an array of IV measurements 1 item for each SiPM
-		self.IVsize = [n for i in range(1, self.NumSiPMs + 1)]
-		self.IV_measurements = [self.curr_meas.create_dataset(f'IV_{i}', (n, 3), maxshape=(None, 3)) \
-			for i in range(1, self.NumSiPMs + 1)]
+		self.IV_measurements = [measurement(f'IV_{i}', IV_DTYPE) \
+			for i in range(1, numSiPMs + 1)]
 
 		# All the SiPMs share the HT measurements
-		self.HT_measurements = self.curr_meas.create_dataset('HT', (1, 3), maxshape=(None, 3))
+		self.HT_measurements = measurement('HT', HT_DTYPE)
+
+		self.IV_appenders = [self.new_appender(dataset) \
+			for dataset in self.IV_measurements]
+		self.HT_appender = self.new_appender(self.HT_measurements)
+
+		# Where each voltage step is in IV_i, see FileIndexHelper.
+		self.step_indexes = [StepIndexHelper(self.new_appender( \
+			measurement(f'IV_{i}_index', STEP_INDEX_DTYPE))) \
+			for i in range(1, numSiPMs + 1)]
+
+		# Running statistics per step and per HT window, see FileStatsHelper.
+		self.step_summaries = [StepSummaryHelper(self.new_appender( \
+			measurement(f'IV_{i}_summary', STEP_SUMMARY_DTYPE))) \
+			for i in range(1, numSiPMs + 1)]
+
+		self.HT_summary = WindowSummaryHelper(self.new_appender( \
+			measurement('HT_summary', WINDOW_SUMMARY_DTYPE)), \
+			window=self.HTSummaryWindow)
+
+		if retention is None:
+			retention = (self.retention, self.retentionEvery, \
+				self.retentionSigma, self.retentionWindow)
+
+		policy, every, sigma, window = retention
+		self.retentions = [RetentionHelper(policy, every=every, sigma=sigma, \
+			window=window) for i in range(0, numSiPMs)]
+		self.pendingIV = [[] for i in range(0, numSiPMs)]
+
+		# Created with the run as nothing can be added in SWMR mode.
+		self.pyramids = {}
+		if self.pyramid:
+			for i in range(1, numSiPMs + 1):
+				self.pyramids[f'IV_{i}'] = self.new_pyramid(f'IV_{i}', \
+					IV_PYRAMID_FIELDS, measurement)
+
+			self.pyramids['HT'] = self.new_pyramid('HT', HT_PYRAMID_FIELDS, \
+				measurement)
+
+	# Decimation levels <name>_level1... of dataset 'name'.
+	def new_pyramid(self, name, fields, measurement):
+		appenders = []
+
+		for level in range(1, self.pyramidLevels + 1):
+			dataset = measurement(f'{name}_level{level}', pyramid_dtype(fields))
+			dataset.attrs['Factor'] = self.pyramidFactor
+			dataset.attrs['RowsPerBin'] = self.pyramidFactor**level
+
+			appenders.append(self.new_appender(dataset))
+
+		return PyramidHelper(appenders, self.pyramidFactor, fields)
+
+	# Creates an empty extendable dataset with the chunk and compression
+	# options of this run, and saves those options as attributes.
+	def create_measurement(self, name, dtype):
+		compression = None
+		compressionLevel = None
 
+		if self.compression == 'gzip':
+			compression = 'gzip'
+			compressionLevel = self.compressionLevel
+		elif self.compression == 'lzf':
+			compression = 'lzf'
+		elif self.compression != 'none':
+			raise Exception(f'Unknown compression {self.compression}.')
+
+		dataset = self.curr_meas.create_dataset(name, (0,), \
+			maxshape=(None,), chunks=(self.chunkRows,), dtype=dtype, \
+			compression=compression, compression_opts=compressionLevel, \
+			shuffle=self.shuffle)
+
+		dataset.attrs['ChunkRows'] = self.chunkRows
+		dataset.attrs['Compression'] = self.compression
+		dataset.attrs['CompressionLevel'] = self.compressionLevel \
+			if compression == 'gzip' else 0
+		dataset.attrs['Shuffle'] = self.shuffle
+
+		return dataset
+
+	# Existing dataset of the current run emptied to be written again.
+	# Created if the run does not have it.
+	def reuse_measurement(self, name, dtype):
+		if name not in self.curr_meas:
+			return self.create_measurement(name, dtype)
+
+		dataset = self.curr_meas[name]
+		dataset.resize((0,))
+
+		return dataset
+
+	# In SWMR mode readers take the dataset length as the number of valid
+	# rows, so datasets grow exactly to the data.
+	def new_appender(self, dataset):
+		return AppendHelper(dataset, flushRows=self.flushRows, \
+			flushTime=self.flushTime, \
+			growth='exact' if self.swmr else self.growth, swmr=self.swmr)
+
+	# Rows are kept until IV_ROW_GROUP of them are waiting, the end of
+	# the step or a flush, and are journaled then.
 	def add_IV(self, meas, numSiPM=0):
-		self.IVsize[numSiPM] += 1
-		newSize = self.IVsize[numSiPM]
+		pending = self.pendingIV[numSiPM]
+		pending.append(meas)
+
+		if len(pending) >= IV_ROW_GROUP:
+			self.hand_pending_IV(numSiPM)
 
-		self.IV_measurements[numSiPM].resize((newSize, 3))
-		self.IV_measurements[numSiPM][ newSize - 1 ] = meas
+	# Hands the rows waiting from add_IV to add_IV_batch, of one SiPM or
+	# of all of them if numSiPM is None.
+	def hand_pending_IV(self, numSiPM=None):
+		numSiPMs = range(len(self.pendingIV)) if numSiPM is None else [numSiPM]
+
+		for i in numSiPMs:
+			if i < len(self.pendingIV) and self.pendingIV[i]:
+				pending = self.pendingIV[i]
+				self.pendingIV[i] = []
+				self.add_IV_batch(pending, numSiPM=i)
 
 	def add_HT(self, meas):
-		self.HTsize += 1
-		self.HT_measurements.resize((self.HTsize,3))
-		self.HT_measurements[self.HTsize - 1] = meas
+		self.add_HT_batch([meas])
+
+	# Journal side of add_IV_batch, add_HT_batch and end_step. They are
+	# called by those unless journaled=True, for when the rows were
+	# already journaled by another thread (see WriterHelper).
+	def journal_IV(self, rows, numSiPM=0):
+		if self.run_journal is not None:
+			self.run_journal.add_IV(rows, numSiPM)
+
+	def journal_HT(self, rows):
+		if self.run_journal is not None:
+			self.run_journal.add_HT(rows)
+
+	def journal_end_step(self, numSiPM=0, setVoltage=np.nan):
+		if self.run_journal is not None:
+			self.run_journal.end_step(numSiPM, setVoltage)
+
+	# Syncs the journal to disk. If onlyExpired is True only if it has
+	# not been synced for FlushTime.
+	def sync_journal(self, onlyExpired=False):
+		if self.run_journal is not None:
+			self.run_journal.sync(onlyExpired)
+
+	# Rows are buffered and written in blocks, see FileAppendHelper.
+	# IV rows are expected as IV_DTYPE arrays, HT rows can also be
+	# [time, humidity, temperature] lists.
+	def add_IV_batch(self, meas, numSiPM=0, journaled=False):
+		self.hand_pending_IV(numSiPM)
+		rows = to_records(meas, IV_DTYPE)
+
+		if not journaled:
+			self.journal_IV(rows, numSiPM)
+
+		self.start_swmr()
+		appender = self.IV_appenders[numSiPM]
+
+		# The summaries see every row, the rest only the ones kept.
+		self.step_summaries[numSiPM].add(rows)
+		rows = self.retentions[numSiPM].filter(rows)
+
+		self.step_indexes[numSiPM].add(rows, len(appender))
+		appender.append(rows)
+
+		if self.pyramids:
+			self.pyramids[f'IV_{numSiPM + 1}'].add(rows)
+
+	def add_HT_batch(self, meas, journaled=False):
+		rows = to_records(meas, HT_DTYPE)
+
+		if not journaled:
+			self.journal_HT(rows)
+
+		self.start_swmr()
+
+		self.HT_summary.add(rows)
+		self.HT_appender.append(rows)
+
+		if self.pyramids:
+			self.pyramids['HT'].add(rows)
+
+	# Called when the electrometer finishes a voltage step.
+	def end_step(self, numSiPM=0, setVoltage=np.nan, journaled=False):
+		self.hand_pending_IV(numSiPM)
+
+		index = self.step_indexes[numSiPM]
+		summary = self.step_summaries[numSiPM]
+
+		if not journaled:
+			self.journal_end_step(numSiPM, setVoltage)
+
+		index.end_step(setVoltage)
+		summary.end_step(setVoltage)
+
+		if self.flushOnStep:
+			self.IV_appenders[numSiPM].flush()
+			self.HT_appender.flush()
+			index.appender.flush()
+			summary.appender.flush()
+
+			for name in [f'IV_{numSiPM + 1}', 'HT']:
+				if name in self.pyramids:
+					for appender in self.pyramids[name].appenders:
+						appender.flush()
+
+	# Writes the buffered rows. If onlyExpired is True only the buffers
+	# older than FlushTime are written.
+	def flush(self, onlyExpired=False):
+		self.hand_pending_IV()
+
+		for appender in self.appenders():
+			if not onlyExpired or appender.expired():
+				appender.flush()
+
+	# Index and statistics helpers of the run.
+	def helpers(self):
+		helpers = self.step_indexes + self.step_summaries
+
+		if self.HT_summary is not None:
+			helpers.append(self.HT_summary)
+
+		return helpers
+
+	def appenders(self):
+		appenders = self.IV_appenders + \
+			[helper.appender for helper in self.helpers()]
+
+		for pyramid in self.pyramids.values():
+			appenders += pyramid.appenders
+
+		if self.HT_appender is not None:
+			appenders.append(self.HT_appender)
+
+		return appenders
+
+	# Writes everything left and cuts the datasets to their real length.
+	# Steps and windows still open are closed, the set voltage of the
+	# last step is unknown.
+	def trim_datasets(self):
+		self.hand_pending_IV()
+
+		for helper in self.helpers():
+			helper.finish()
+
+		for pyramid in self.pyramids.values():
+			pyramid.finish()
+
+		for appender in self.appenders():
+			appender.trim()
+
+	# Journals of runs that did not finish.
+	def journal_paths(self):
+		if not self.journal:
+			return []
+
+		return journals_in(self.journal_dir)
+
+	# Called when the run could not be fully saved in HDF5.
+	def keep_journal(self):
+		if self.run_journal is not None:
+			print(f'[File] Keeping the journal of run {self.database_name}, \
+it will be recovered the next time.')
+			self.run_journal.close()
+			self.run_journal = None
+
+	# Called once the run is fully saved in HDF5.
+	def end_journal(self):
+		if self.run_journal is not None:
+			self.run_journal.delete()
+			self.run_journal = None
+
+	# Replays the journals of runs that did not finish (the software
+	# crashed or the computer lost power) into their datasets. The
+	# journal has every row of the run, so the datasets and their index
+	# and summaries are written again from it.
+	def recover_journals(self):
+		for path in self.journal_paths():
+			try:
+				name, numSiPMs, records = read_journal(path)
+				self.recover_run(name, numSiPMs, records)
+				os.remove(path)
+			except Exception as err:
+				print(f'[File] Could not recover {path}: {err}.')
+
+	# Makes run 'name' the current run to write it again after it ended.
+	# Returns False if the run is not in the database.
+	def open_run(self, name):
+		self.acquire_database()
+		link = self.sipm_group.get(name, getlink=True)
+		self.release_database()
+
+		if link is None:
+			return False
+
+		self.database_name = name
+		if self.sharding:
+			self.run_path = os.path.join(os.path.dirname(self.filedir), \
+				link.filename)
+			clear_file_flags(self.run_path)
+			self.open_run_file('a')
+		else:
+			self.curr_meas = self.sipm_group[name]
+
+		return True
+
+	def close_run(self):
+		self.close_run_file()
+		self.IV_appenders = []
+		self.HT_appender = None
+		self.step_indexes = []
+		self.step_summaries = []
+		self.HT_summary = None
+		self.pyramids = {}
+		self.retentions = []
+		self.pendingIV = []
+		self.curr_meas = None
+
+	def recover_run(self, name, numSiPMs, records):
+		if not self.open_run(name):
+			print(f'[File] Run {name} of the journal is not in the database.')
+			return
+
+		print(f'[File] Recovering {len(records)} rows of run {name}.')
+
+		# Written as a normal file, not SWMR, and not journaled again.
+		# With the retention the run was started with, the config may
+		# have changed since.
+		swmr = self.swmr
+		self.swmr = False
+		self.bind_run(numSiPMs, self.reuse_measurement, \
+			retention=self.run_retention())
+
+		for kind, numSiPM, segment in journal_segments(records):
+			if kind == JOURNAL_IV:
+				self.add_IV_batch(journal_rows(segment, IV_DTYPE), numSiPM)
+			elif kind == JOURNAL_HT:
+				self.add_HT_batch(journal_rows(segment, HT_DTYPE))
+			elif kind == JOURNAL_END_STEP:
+				for setVoltage in segment['Value1']:
+					self.end_step(numSiPM, setVoltage)
+
+		self.trim_datasets()
+		self.curr_meas.attrs['Recovered'] = True
+		self.catalog_run('recovered')
+		self.swmr = swmr
+
+		self.close_run()
+
+	# Retention recorded in the attributes of the current run, the
+	# config one for what is missing.
+	def run_retention(self):
+		attrs = self.curr_meas.attrs
+
+		return (str(attrs.get('Retention', self.retention)), \
+			int(attrs.get('RetentionEvery', self.retentionEvery)), \
+			float(attrs.get('RetentionSigma', self.retentionSigma)), \
+			int(attrs.get('RetentionWindow', self.retentionWindow)))
+
+	# Builds the decimation levels of run 'name' from its IV_i and HT
+	# datasets, for runs saved without them or with other options. The
+	# secretary must not be writing the run.
+	def build_pyramids(self, name, chunkRows=65536):
+		if not self.open_run(name):
+			print(f'[File] Run {name} is not in the database.')
+			return
+
+		print(f'[File] Building the decimation levels of run {name}.')
+
+		for dataset_name in list(self.curr_meas.keys()):
+			if dataset_name == 'HT':
+				fields = HT_PYRAMID_FIELDS
+			elif dataset_name.startswith('IV_') and dataset_name[3:].isdigit():
+				fields = IV_PYRAMID_FIELDS
+			else:
+				continue
+
+			dataset = self.curr_meas[dataset_name]
+			if dataset.dtype.names is None:
+				print(f'[File] {dataset_name} is from an older format. Skipping.')
+				continue
+
+			level = 1
+			while f'{dataset_name}_level{level}' in self.curr_meas:
+				del self.curr_meas[f'{dataset_name}_level{level}']
+				level += 1
+
+			pyramid = self.new_pyramid(dataset_name, fields, \
+				self.create_measurement)
+
+			for start in range(0, dataset.shape[0], chunkRows):
+				pyramid.add(dataset[start:start + chunkRows])
+
+			pyramid.finish()
+			for appender in pyramid.appenders:
+				appender.trim()
+
+		self.close_run()
+
+	# Saves the final sample counts and status of the run in the catalog.
+	def catalog_run(self, status):
+		if self.catalog is None or self.curr_meas is None:
+			return
+
+		self.catalog.update_run(self.database_name, status=status, \
+			iv_rows=sum(len(appender) for appender in self.IV_appenders), \
+			ht_rows=len(self.HT_appender) if self.HT_appender is not None else 0)
 
 	def reset(self):
 		print('[File] Resetting database.')
+		self.end_swmr()
+		self.trim_datasets()
+		self.catalog_run('restarted')
+		self.end_journal()
 		self.create_dataset(self.database_name)
 
-	def close(self):
-		self.file.close()
+	# failed is True if some rows never reached the datasets (a write
+	# failed). The run is then marked as failed and its journal is kept,
+	# so the rows are recovered (recover_journals) the next time.
+	def close(self, failed=False):
+		if self.run_file:
+			self.end_swmr()
+			self.trim_datasets()
+
+			if failed:
+				self.catalog_run('failed')
+				self.keep_journal()
+			else:
+				self.catalog_run('finished')
+				self.end_journal()
+
+		self.close_run_file()
+
+		if self.file:
+			self.file.close()
+
+		if self.catalog is not None:
+			self.catalog.close()
 
 	def delete_dataset(self):
+		self.pendingIV = []
+
+		for appender in self.appenders():
+			appender.discard()
+
+		for helper in self.helpers():
+			helper.current = None
+
+		self.end_swmr()
+		self.end_journal()
+
+		self.IV_appenders = []
+		self.HT_appender = None
+		self.step_indexes = []
+		self.step_summaries = []
+		self.HT_summary = None
+		self.pyramids = {}
+		self.retentions = []
+		self.pendingIV = []
+
 		if self.curr_meas and self.database_name is not None:
+			if self.sharding:
+				self.close_run_file()
+				os.remove(self.run_path)
+
+			self.acquire_database()
 			del self.sipm_group[self.database_name]
+			self.release_database()
+
+			if self.catalog is not None:
+				self.catalog.update_run(self.database_name, status='deleted')
+
+			self.curr_meas = None
@@ -0,0 +1,250 @@
+import h5py
+import numpy as np
+import os
+
+from Managers.FileHelpers.FilePyramidHelper import (to_bins, merge_bins)
+
+# Read only access to the database written by sipmFileManager. If the
+# secretary runs with SWMR=True this can be used from any other process
+# while the run is being written, ex. to analyze or plot the data
+# without going through the grapher queue:
+#
+#	reader = sipmFileReader('SiPM_Characterization.hdf5')
+#	reader.open_run()
+#	while True:
+#		newRows = reader.tail('IV_1')
+#
+# tail returns only the rows written since the last call. New runs
+# are not visible to a SWMR reader, reopen() has to be called first.
+# Runs saved in their own file (Sharding=True) are opened directly so
+# they can be read in SWMR mode too.
+#
+# read_step uses the IV_i_index datasets to slice the rows of a single
+# voltage step directly:
+#
+#	rows = reader.read_step(1, 12)
+#
+# read_decimated uses the decimation levels (see FilePyramidHelper) to
+# read a time range with about as many points as pixels to draw:
+#
+#	level, rows = reader.read_decimated('IV_1', start=0, end=3600, width=800)
+#
+# level 0 are the rows of IV_1, otherwise bins with the min/max/mean of
+# each field. While the run goes on the levels lag behind the rows, the
+# rows past the last bin written are binned here the same way.
+
+class sipmFileReader:
+
+	def __init__(self, filedir, swmr=True):
+		self.filedir = filedir
+		self.swmr = swmr
+
+		self.run = None
+		self.run_name = None
+		self.run_file = None
+		self.positions = {}
+
+		self.open_file()
+
+	def open_file(self):
+		self.file = h5py.File(self.filedir, 'r', libver='latest', swmr=self.swmr)
+		self.sipm_group = self.file['SiPMs Measurements']
+
+	def reopen(self):
+		self.close()
+		self.open_file()
+
+		if self.run_name is not None and self.run_name in self.sipm_group:
+			self.run = self.get_run(self.run_name)
+
+	# Group of the run. If the run is in its own file, that file is
+	# opened instead of following the external link.
+	def get_run(self, name):
+		link = self.sipm_group.get(name, getlink=True)
+
+		if isinstance(link, h5py.ExternalLink):
+			if self.run_file is not None:
+				self.run_file.close()
+
+			path = os.path.join(os.path.dirname(self.filedir), link.filename)
+			self.run_file = h5py.File(path, 'r', libver='latest', swmr=self.swmr)
+
+			return self.run_file[link.path]
+
+		return self.sipm_group[name]
+
+	def runs(self):
+		return list(self.sipm_group.keys())
+
+	# Name of the most recent run, by its 'Date' attribute.
+	def latest_run(self):
+		names = self.runs()
+
+		if not names:
+			return None
+
+		return max(names, key=lambda name: \
+			(self.sipm_group[name].attrs.get('Date', ''), name))
+
+	# Selects the run to read, the latest if no name is given. Tailing
+	# starts from the beginning of its datasets.
+	def open_run(self, name=None):
+		if name is None:
+			name = self.latest_run()
+
+		self.run = self.get_run(name)
+		self.run_name = name
+		self.positions = {}
+
+		return self.run
+
+	# Names of the IV_i and HT datasets of the run.
+	def datasets(self):
+		return [name for name in self.run.keys() \
+			if name == 'HT' or (name.startswith('IV_') and name[3:].isdigit())]
+
+	# Rows added to the dataset since the last call.
+	def tail(self, name):
+		dataset = self.run[name]
+
+		if self.swmr:
+			dataset.refresh()
+
+		start = self.positions.get(name, 0)
+		end = dataset.shape[0]
+
+		if end <= start:
+			return dataset[0:0]
+
+		self.positions[name] = end
+
+		return dataset[start:end]
+
+	# tail for every IV_i and HT dataset of the run.
+	def tail_all(self):
+		return {name : self.tail(name) for name in self.datasets()}
+
+	# Step index of SiPM numSiPM (1 based as the dataset names), one row
+	# per finished step. See FileIndexHelper.
+	def steps(self, numSiPM):
+		return self.read_all(f'IV_{numSiPM}_index')
+
+	# Rows of voltage step 'step' of SiPM numSiPM.
+	def read_step(self, numSiPM, step):
+		steps = self.steps(numSiPM)
+		found = np.flatnonzero(steps['Step'] == step)
+
+		if len(found) == 0:
+			raise Exception(f'Step {step} not found in IV_{numSiPM}.')
+
+		start = int(steps['StartRow'][found[0]])
+		end = start + int(steps['Rows'][found[0]])
+
+		return self.run[f'IV_{numSiPM}'][start:end]
+
+	# Per step statistics of SiPM numSiPM, enough to plot the I-V curve.
+	# See FileStatsHelper.
+	def summary(self, numSiPM):
+		return self.read_all(f'IV_{numSiPM}_summary')
+
+	# Humidity/temperature statistics per time window.
+	def HT_summary(self):
+		return self.read_all('HT_summary')
+
+	# Decimation levels of dataset 'name', finest first.
+	def levels(self, name):
+		levels = []
+
+		while f'{name}_level{len(levels) + 1}' in self.run:
+			dataset = self.run[f'{name}_level{len(levels) + 1}']
+
+			if self.swmr:
+				dataset.refresh()
+
+			levels.append(dataset)
+
+		return levels
+
+	# Rows (level 0) or bins of the finest level with at most 'width'
+	# points between times start and end (None for the start or end of
+	# the run). Returns (level, rows). The rows not in a bin of the level
+	# yet (the end of a run being written) are read and binned.
+	def read_decimated(self, name, start=None, end=None, width=1000):
+		dataset = self.run[name]
+
+		if self.swmr:
+			dataset.refresh()
+
+		levels = self.levels(name)
+		factor = int(levels[0].attrs['Factor']) if levels else 1
+
+		# Rows of dataset in the time range, found with the coarsest
+		# level that has data. Its bins cover a fixed number of rows.
+		first, last = 0, dataset.shape[0]
+		for level in reversed(range(1, len(levels) + 1)):
+			bins = levels[level - 1][:]
+
+			if len(bins) == 0:
+				continue
+
+			if start is not None:
+				first = int(np.searchsorted(bins['EndTime'], start, \
+					side='left'))*factor**level
+
+			# Rows after the last bin are not in a bin yet.
+			if end is not None:
+				found = int(np.searchsorted(bins['StartTime'], end, side='right'))
+				if found < len(bins):
+					last = min(last, found*factor**level)
+
+			break
+
+		level = 0
+		while level < len(levels) and -(-(last - first)//factor**level) > width:
+			level += 1
+
+		if level == 0:
+			rows = dataset[first:last]
+			startTimes = endTimes = rows['Time']
+		else:
+			size = factor**level
+			bins = levels[level - 1]
+
+			# Rows in the bins written, the last bin of a finished run can
+			# cover fewer than size rows.
+			covered = min(len(bins)*size, dataset.shape[0])
+			rows = bins[first//size:-(-min(last, covered)//size)]
+
+			# Bins start every size rows, so do the ones made here.
+			tailStart = max(covered, first//size*size)
+			if last > tailStart:
+				fields = [field[3:] for field in bins.dtype.names \
+					if field.startswith('Min')]
+				tail = to_bins(dataset[tailStart:last], fields, bins.dtype)
+				rows = np.concatenate((rows, merge_bins(tail, size, fields)))
+
+			startTimes = rows['StartTime']
+			endTimes = rows['EndTime']
+
+		inRange = np.ones(len(rows), dtype=bool)
+		if start is not None:
+			inRange &= endTimes >= start
+		if end is not None:
+			inRange &= startTimes <= end
+
+		return (level, rows[inRange])
+
+	def read_all(self, name):
+		dataset = self.run[name]
+
+		if self.swmr:
+			dataset.refresh()
+
+		return dataset[:]
+
+	def close(self):
+		if self.run_file is not None:
+			self.run_file.close()
+			self.run_file = None
+
+		self.file.close()
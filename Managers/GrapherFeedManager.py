@@ -0,0 +1,143 @@
+from queue import Full
+
+import numpy as np
+import time
+
+# What the secretary sends to the grapher. The grapher only takes a
+# message every frame, so the queue between them is bounded ([MAIN]
+# GrapherQueueSize) and the secretary never waits for it. A batch that
+# does not fit waits here until there is room, and the batches sent
+# meanwhile are dealt with by the policy:
+#	- coalesce 	: they are merged with the one waiting. If one kind of
+#				  rows ('IV' or 'HT') gets over maxRows, it is thinned to
+#				  maxRows rows evenly spread over the batch (the same
+#				  ones of 'IV' and 'SiPM').
+#	- latest 	: they replace the one waiting, only the newest is sent.
+#
+# Commands (close, restart...) are never dropped or merged, they are
+# sent before the batch waiting. If the queue is full the secretary
+# waits up to commandTimeout seconds for the grapher to make room, a
+# grapher that does not take its 'close' would never end. close() sends
+# the commands still waiting and drops the batch.
+#
+# stats() returns how many rows were dropped (thrown away) and coalesced
+# (merged into a batch waiting) since it was last called.
+
+FEED_POLICIES = ['coalesce', 'latest']
+
+# Number of rows of a batch, {'IV' : IV_DTYPE rows, 'SiPM' : SiPM of
+# each IV row, 'HT' : HT_DTYPE rows} with IV or HT missing.
+def batch_rows(batch):
+	return sum([len(batch[kind]) for kind in ['IV', 'HT'] if kind in batch])
+
+# maxRows rows evenly spread over rows, the first and last included.
+def thin(rows, maxRows):
+	if len(rows) <= maxRows:
+		return rows
+
+	return rows[np.linspace(0, len(rows) - 1, maxRows).astype(np.int64)]
+
+class GrapherFeed:
+
+	def __init__(self, queue, policy='coalesce', maxRows=100000, \
+		commandTimeout=5.0):
+		if policy not in FEED_POLICIES:
+			raise Exception(f'Unknown grapher feed policy {policy}, use one of \
+{FEED_POLICIES}.')
+
+		self.queue = queue
+		self.policy = policy
+		self.maxRows = maxRows
+		self.commandTimeout = commandTimeout
+
+		self.commands = []
+		self.batch = None
+
+		self.dropped = 0
+		self.coalesced = 0
+
+	# Sends a command.
+	def put(self, command):
+		if self.queue is None:
+			return
+
+		self.commands.append(command)
+		self.send_commands(self.commandTimeout)
+		self.flush()
+
+	# Sends a batch of rows.
+	def send(self, batch):
+		if self.queue is None:
+			return
+
+		if self.batch is None:
+			self.batch = batch
+
+		elif self.policy == 'latest':
+			self.dropped += batch_rows(self.batch)
+			self.batch = batch
+
+		else:
+			self.coalesced += batch_rows(batch)
+
+			for kind, rows in batch.items():
+				if kind in self.batch:
+					rows = np.concatenate((self.batch[kind], rows))
+
+				if kind in ['IV', 'HT']:
+					self.dropped += max(len(rows) - self.maxRows, 0)
+
+				self.batch[kind] = thin(rows, self.maxRows)
+
+		self.flush()
+
+	# Sends what is waiting, if the grapher made room for it.
+	def flush(self):
+		try:
+			while self.commands:
+				self.queue.put_nowait(self.commands[0])
+				self.commands.pop(0)
+
+			if self.batch is not None:
+				self.queue.put_nowait(self.batch)
+				self.batch = None
+
+		except Full:
+			pass
+
+	# Sends the commands waiting, waiting up to timeout seconds in total
+	# for room. Returns False if some could not be sent.
+	def send_commands(self, timeout):
+		deadline = time.time() + timeout
+
+		try:
+			while self.commands:
+				self.queue.put(self.commands[0], \
+					timeout=max(deadline - time.time(), 0.0))
+				self.commands.pop(0)
+
+		except Full:
+			print(f'[File] The grapher did not take {len(self.commands)} \
+commands in {timeout} s.')
+			return False
+
+		return True
+
+	# Last delivery, when the secretary ends.
+	def close(self):
+		if self.queue is None:
+			return
+
+		if self.batch is not None:
+			self.dropped += batch_rows(self.batch)
+			self.batch = None
+
+		self.send_commands(self.commandTimeout)
+
+	# Returns (dropped, coalesced) and starts counting again.
+	def stats(self):
+		dropped, coalesced = self.dropped, self.coalesced
+		self.dropped = 0
+		self.coalesced = 0
+
+		return (dropped, coalesced)
@@ -29,6 +29,9 @@ class IVEquipmentManager:
 
 		# Max is 8 but the 2mA range is not calibrated, dont use
 		self.maxPicorange = 7
+
+		# Number of range changes needed by the last measurement.
+		self.lastRetries = 0
 		self.startTime = time.time()
 		self.measTime = time.time()
 
@@ -188,6 +191,7 @@ class IVEquipmentManager:
 	def MeasurementRoutine(self):
 
 		time, volt, curr = 0.0, 0.0, 0.0
+		self.lastRetries = 0
 
 		try:
 			while True:
@@ -203,6 +207,8 @@ class IVEquipmentManager:
 				else:
 					break
 
+				self.lastRetries += 1
+
 			return time, volt, curr
 		except Exception as e:
 			raise e
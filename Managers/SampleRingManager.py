@@ -0,0 +1,222 @@
+from Managers.FileManager import IV_DTYPE
+
+from multiprocessing import shared_memory
+
+import time
+import numpy as np
+
+# Ring buffer of I-V samples in shared memory. The electrometer writes
+# the samples (one producer) and the secretary and grapher read them
+# (many consumers) by index, without pickling them through a queue:
+#
+#	ring = SampleRing(create=True)				# iv-control.py
+#	ring = SampleRing(name)						# every process
+#	ring.put(rows, numSiPM)						# electrometer
+#	for rows in ring.read(RING_SECRETARY): ...	# secretary and grapher
+#
+# The end of a voltage step goes through the ring too (end_step, a row
+# of Kind RING_END_STEP with the set voltage as Voltage), so it always
+# arrives after the samples of the step. A queue would not guarantee it.
+#
+# read() yields numpy views of the shared memory. They are only valid
+# until release() is called, rows kept after that have to be copied.
+#
+# The shared memory starts with a header of int64 values:
+#	[written, capacity, consumers, read cursor of each consumer,
+#	1 if the consumer is lossless for each consumer]
+# and is followed by 'capacity' RING_DTYPE records. Row i is in record
+# i % capacity. The producer writes the records first and then moves
+# 'written', consumers only read rows before 'written' and only they
+# move their own read cursor, so no lock is needed.
+#
+# The producer waits for lossless consumers (the secretary) before
+# overwriting rows they did not read. Lossy consumers (the grapher) are
+# never waited for, if they fall behind by more than 'capacity' rows
+# they skip to the oldest row still in the ring.
+
+RING_DTYPE = np.dtype(IV_DTYPE.descr + [('SiPM', 'u1'), ('Kind', 'u1')])
+
+RING_SAMPLE = 0
+RING_END_STEP = 1
+
+RING_SECRETARY = 0
+RING_GRAPHER = 1
+
+HEADER_WRITTEN = 0
+HEADER_CAPACITY = 1
+HEADER_CONSUMERS = 2
+HEADER_SIZE = 3
+
+class SampleRing:
+
+	def __init__(self, name=None, create=False, capacity=1048576, \
+		lossless=[True, False], timeout=10.0):
+
+		consumers = len(lossless)
+		self.timeout = timeout
+		self.owner = create
+
+		if create:
+			size = 8*(HEADER_SIZE + 2*consumers) + capacity*RING_DTYPE.itemsize
+			self.shm = shared_memory.SharedMemory(name=name, create=True, \
+				size=size)
+		else:
+			# Processes started by iv-control.py share its resource tracker,
+			# which removes the memory if the creator did not unlink it.
+			self.shm = shared_memory.SharedMemory(name=name)
+
+		self.name = self.shm.name
+
+		if create:
+			header = np.ndarray(HEADER_SIZE, dtype='<i8', buffer=self.shm.buf)
+			header[:] = [0, capacity, consumers]
+		else:
+			header = np.ndarray(HEADER_SIZE, dtype='<i8', buffer=self.shm.buf)
+			capacity, consumers = int(header[1]), int(header[2])
+
+		self.capacity = capacity
+		self.consumers = consumers
+
+		self.header = np.ndarray(HEADER_SIZE + 2*consumers, dtype='<i8', \
+			buffer=self.shm.buf)
+		self.cursors = self.header[HEADER_SIZE:HEADER_SIZE + consumers]
+		self.lossless = self.header[HEADER_SIZE + consumers:]
+
+		if create:
+			self.cursors[:] = 0
+			self.lossless[:] = lossless
+
+		self.records = np.ndarray(capacity, dtype=RING_DTYPE, \
+			buffer=self.shm.buf, offset=self.header.nbytes)
+
+		# Views to write IV_DTYPE rows, their SiPM and kind in one go each.
+		self.IV_records = self.records[list(IV_DTYPE.names)]
+		self.SiPMs = self.records['SiPM']
+		self.kinds = self.records['Kind']
+
+		# The producer can write up to this row without checking the
+		# consumers again.
+		self.losslessConsumers = [i for i in range(0, consumers) \
+			if self.lossless[i] != 0]
+		self.limit = 0
+
+		# Rows a lossy consumer skipped because it fell behind.
+		self.lost = 0
+
+	# Rows written since the ring was created.
+	def written(self):
+		return int(self.header[HEADER_WRITTEN])
+
+	# Read cursor of the slowest lossless consumer.
+	def slowest(self):
+		if not self.losslessConsumers:
+			return self.written()
+
+		return min([int(self.cursors[i]) for i in self.losslessConsumers])
+
+	# Adds RING_DTYPE rows (or IV_DTYPE samples of SiPM numSiPM). Waits up
+	# to timeout seconds for the lossless consumers to make room.
+	def put(self, rows, numSiPM=None):
+		written = self.written()
+		numRows = len(rows)
+
+		if numRows > self.capacity:
+			raise Exception(f'Can not put {numRows} rows in a sample ring of \
+{self.capacity} rows.')
+
+		start = time.time()
+		while written + numRows > self.limit:
+			self.limit = self.slowest() + self.capacity
+
+			if written + numRows <= self.limit:
+				break
+
+			if time.time() - start > self.timeout:
+				raise Exception('Sample ring full, the secretary is not reading \
+the samples.')
+
+			time.sleep(1e-4)
+
+		first = written % self.capacity
+		end = min(first + numRows, self.capacity)
+
+		self.write(first, end, rows[:end - first], numSiPM)
+
+		# What did not fit before the end of the records goes at the start.
+		if end - first < numRows:
+			self.write(0, numRows - end + first, rows[end - first:], numSiPM)
+
+		# Only now the rows can be seen by the consumers.
+		self.header[HEADER_WRITTEN] = written + numRows
+
+	def write(self, first, end, rows, numSiPM):
+		if numSiPM is None:
+			self.records[first:end] = rows
+		else:
+			self.IV_records[first:end] = rows
+			self.SiPMs[first:end] = numSiPM
+			self.kinds[first:end] = RING_SAMPLE
+
+	# The electrometer finished voltage step 'step' of SiPM numSiPM.
+	def end_step(self, numSiPM, step, setVoltage):
+		row = np.zeros(1, dtype=RING_DTYPE)
+		row['Voltage'] = setVoltage
+		row['Step'] = step
+		row['SiPM'] = numSiPM
+		row['Kind'] = RING_END_STEP
+
+		self.put(row)
+
+	# Yields the rows the consumer has not read as views of the ring (two
+	# at most, if they wrap around). Each view is released when the next
+	# one is asked for.
+	def read(self, consumer):
+		while True:
+			rows = self.peek(consumer)
+
+			if len(rows) == 0:
+				return
+
+			yield rows
+
+			self.release(consumer, len(rows))
+
+	# Rows the consumer has not read, up to the end of the records, as a
+	# view of the ring. Call release after using them.
+	def peek(self, consumer):
+		written = self.written()
+		cursor = int(self.cursors[consumer])
+
+		if written - cursor > self.capacity:
+			self.lost += written - self.capacity - cursor
+			cursor = written - self.capacity
+			self.cursors[consumer] = cursor
+
+		first = cursor % self.capacity
+		end = min(first + written - cursor, self.capacity)
+
+		return self.records[first:end]
+
+	# Moves the consumer past numRows rows. Returns False if the producer
+	# may have overwritten them while they were being read (only possible
+	# for lossy consumers).
+	def release(self, consumer, numRows):
+		cursor = int(self.cursors[consumer]) + numRows
+		self.cursors[consumer] = cursor
+
+		return self.written() - self.capacity <= cursor - numRows
+
+	def close(self):
+		# The views have to go before the memory can be closed.
+		self.header = None
+		self.cursors = None
+		self.lossless = None
+		self.records = None
+		self.IV_records = None
+		self.SiPMs = None
+		self.kinds = None
+
+		self.shm.close()
+
+		if self.owner:
+			self.shm.unlink()
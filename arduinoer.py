@@ -1,6 +1,7 @@
 from Managers import ArduinoManager
 from Managers.LoggerManager import Logger
 from Managers.FileManager import Process
+from Managers.ControlManager import ControlChannel
 
 from multiprocessing import Queue
 from queue import Empty
@@ -108,11 +109,13 @@ def run_measurements(*, status, err):
 # Listen to the secretary commands
 def listen_to_secretary(*, status, err):
 	man = status['Manager']
-	inQueue = status['InQueue']
-	outQueue = status['OutQueue']
+	channel = status['Channel']
 
 	try:
-		response = inQueue.get_nowait()
+		response = channel.receive()
+
+		if response is None:
+			return (status, err)
 
 		if response['close']:
 			print('[Arduino] Closing.')
@@ -137,7 +140,7 @@ def listen_to_secretary(*, status, err):
 				err = f'{err} {man.retrieveError()}.'
 				man.resetError()
 
-				outQueue.put({\
+				channel.send({\
 					'Data' : None,
 					'Error' : f'{err}', \
 					'FatalError' : False,
@@ -168,8 +171,6 @@ def listen_to_secretary(*, status, err):
 
 		return (status, err)
 
-	except Empty:
-		return (status, err)
 	except Exception as error:
 		print(f'[Arduino] Error while listening to boss: {error}.')
 		traceback.print_exc(file=sys.stdout)
@@ -188,7 +189,7 @@ def loop(*, status, commErr):
 	HUMIDITY_THRESHOLD = int(status['Config']['HumidityThreshold'])
 	T_AMBIENT = float(status['Config']['TAmbient'])
 
-	outQueue = status['OutQueue']
+	channel = status['Channel']
 
 	while True:
 
@@ -263,7 +264,7 @@ def loop(*, status, commErr):
 				'cmd' 				: '_temperatureReady', \
 				'value'				: ''}
 
-			outQueue.put({\
+			channel.send({\
 					'Data' 			: None, \
 					'Error' 		: None, \
 					'FatalError' 	: None,
@@ -309,7 +310,7 @@ def loop(*, status, commErr):
 					'cmd' 				: '_postcooling', \
 					'value'				: ''}
 
-				outQueue.put({\
+				channel.send({\
 					'Data' 			: None, \
 					'Error' 		: None, \
 					'FatalError' 	: None,
@@ -344,16 +345,24 @@ def loop(*, status, commErr):
 #
 # NOTE: the * at the begginning forces the function to be of the form:
 # arduino_process_main(inQueue=smth, outQueue=other)
-def arduino_process_main(*, inQueue, outQueue):
+#
+# Commands, errors and replies to the secretary go through ctrlQueue
+# (see ControlManager), or outQueue if None. The measurements always go
+# through outQueue.
+def arduino_process_main(*, inQueue, outQueue, ctrlQueue=None):
 
 	# Makes sure all output gets written to a log and console.
 	sys.stdout = Logger()
 
+	channel = ControlChannel(ctrlQueue if ctrlQueue is not None else outQueue, \
+		inQueue)
+
 	status = {
 		'Manager' : None,
 		'Config' : None,
 		'InQueue' : inQueue,
 		'OutQueue' : outQueue,
+		'Channel' : channel,
 
 		# Loop related items
 		'State' : STATES.SETUP,
@@ -389,7 +398,7 @@ def arduino_process_main(*, inQueue, outQueue):
 	# Runs if any fatal error is seen.
 	except Exception as err:
 		print(f'[Arduino] Fatal Error: {err}.')
-		outQueue.put({\
+		channel.send({\
 			'Data' : None,
 			'Error' : f'{commulativeError} {err}.', \
 			'FatalError' : True,
@@ -399,7 +408,7 @@ def arduino_process_main(*, inQueue, outQueue):
 	# No fatal errors, send any errors if present.
 	else:
 		print(f'[Arduino] Closing with error: {commulativeError}')
-		outQueue.put( {\
+		channel.send( {\
 			'Data' 			: None, 					\
 			'Error' 		: f'{commulativeError}.', 	\
 			'FatalError' 	: False, 					\
@@ -0,0 +1,868 @@
+from secretary import file_process_main
+from electrometer import (measure_and_send, send_end_step)
+from grapher import (Renderer, SeriesBuffer, read_queue, \
+	grapher_process_main)
+from Managers import FileManager
+from Managers.FileHelpers.FileJournalHelper import JournalHelper
+from Managers.FileHelpers.FileWriterHelper import WriterHelper
+from Managers.FileExporter import sipmFileExporter
+from Managers.FileReader import sipmFileReader
+from Managers.SampleRingManager import (SampleRing, RING_SECRETARY, \
+	RING_GRAPHER)
+from Managers.ControlManager import ControlChannel
+from Managers.GrapherFeedManager import (GrapherFeed, FEED_POLICIES)
+
+from multiprocessing import (Process, Queue)
+from queue import (Empty, Full)
+
+import h5py
+import matplotlib.pyplot as plt
+import numpy as np
+import time
+import configparser
+import tempfile
+import tracemalloc
+import statistics
+import os
+import sys
+
+# Benchmarks for the data path of the software. They do not touch any
+# of the instruments and run inside a temporary folder so the real
+# database is never modified.
+#
+# Usage:
+#	python benchmark.py [latency] [append] [compression] [journal] [writer]
+#		[export] [retention] [ring] [batch] [control] [grapher] [render]
+#		[buffers] [headless] [failure] [live]
+#
+# latency 	: Median time between a command given to the boss queue and
+# 			  the secretary relaying it to the arduinoer, for each of the
+# 			  secretary WakeupMode.
+# append 	: Rows per second saved by sipmFileManager.add_IV compared to
+# 			  the old one resize and one write per row.
+# compression : Write and read throughput, and file size, of a synthetic
+# 			  1M rows run for different chunk and compression options.
+# journal 	: Cost per sample of writing it to the journal compared to
+# 			  the old one resize and one write per row.
+# writer 	: Same as latency but with the electrometer sending data and
+# 			  slow (gzip 9, 64k rows) flushes, with and without the writer
+# 			  thread.
+# export 	: Peak memory (tracemalloc) of exporting runs of growing size
+# 			  to CSV, and Parquet/Arrow if pyarrow is installed. It should
+# 			  not grow with the run. tracemalloc slows the export down, the
+# 			  rates are only to compare the formats.
+# retention : Size of a synthetic 1M rows run, with a few range changes,
+# 			  for each Retention policy.
+# ring 		: Cost per sample of sending the I-V samples one by one from
+# 			  the electrometer to the secretary and grapher through the
+# 			  queues (the secretary relaying them) and through the
+# 			  shared memory sample ring.
+# batch 	: Cost per sample of the electrometer messages to the secretary
+# 			  for different [ELECTROMETER] BatchTime, with an instrument
+# 			  that answers right away.
+# control 	: Time for a command of the electrometer to reach the arduino
+# 			  with a backlog of measurements waiting in front of it, with
+# 			  and without the control queues.
+# grapher 	: How far behind the grapher is after a fast sweep it can not
+# 			  keep up with, through an unbounded queue and through the
+# 			  GrapherFeed policies.
+# render 	: Time to draw a grapher frame (Agg) as the run grows, for the
+# 			  old frames that made the figure again and for Renderer.
+# buffers 	: Memory (tracemalloc) the grapher uses to keep the time,
+# 			  voltage and current of a run, in lists and in SeriesBuffer
+# 			  with and without [GRAPHER] Window.
+# headless 	: CPU used by the grapher in [GRAPHER] Headless mode, with
+# 			  10000 I-V rows/s coming in, for different SnapshotInterval.
+# 			  POSIX only, skipped on Windows.
+# failure 	: Not a benchmark, checks that no rows are lost when a write of
+# 			  the writer fails: the run is closed as the secretary does
+# 			  and recovered from its journal. Raises if rows are missing.
+# live 		: Not a benchmark either, checks that read_decimated returns
+# 			  every row of a run being written (SWMR), the same bins as
+# 			  once the run is closed. Raises if they differ.
+
+# Writes a file.cfg copy in the current folder with the keys of section
+# ([FILE] by default) overwritten by the ones given.
+def write_config(src, section='FILE', **keys):
+	config = configparser.ConfigParser()
+	config.optionxform = str
+
+	with open(src) as f:
+		config.read_file(f)
+
+	config['FILE']['DBName'] = 'benchmark.hdf5'
+	config['FILE']['NumSiPMsToTest'] = '1'
+
+	for key, value in keys.items():
+		config[section][key] = str(value)
+
+	with open('file.cfg', 'w') as f:
+		config.write(f)
+
+def measure_latency(wakeupMode, numCMDs=200, rowsPerCMD=0, **keys):
+	bossQueue = Queue()
+	graQueue = Queue()
+	ardOutQueue = Queue()
+	ardInQueue = Queue()
+	ivOutQueue = Queue() if rowsPerCMD > 0 else None
+	ivInQueue = Queue() if rowsPerCMD > 0 else None
+
+	write_config(CONFIG_FILE, WakeupMode=wakeupMode, **keys)
+	rows = synthetic_rows(rowsPerCMD)
+
+	file_process = Process(target = file_process_main, \
+		kwargs={'bossQueue' : bossQueue, 'graQueue' : graQueue, \
+		'ardOutQueue' : ardOutQueue, 'ardInQueue' : ardInQueue, \
+		'ivOutQueue' : ivOutQueue, 'ivInQueue' : ivInQueue })
+	file_process.start()
+
+	# Let the secretary open the database.
+	time.sleep(2)
+
+	latencies = []
+	for i in range(0, numCMDs):
+		if rowsPerCMD > 0:
+			ivInQueue.put({'Data' : [rows, 0], 'Error' : None, \
+				'FatalError' : None, 'CMD' : None})
+
+		start = time.perf_counter()
+		bossQueue.put(['ARDUINO', 'benchmark'])
+		ardOutQueue.get(timeout=10)
+		latencies.append(time.perf_counter() - start)
+
+		# Commands do not arrive in sync with the secretary wakeups.
+		time.sleep(0.0137)
+
+	bossQueue.put(['close'])
+	ardOutQueue.get(timeout=10)
+	ardInQueue.put({'Data' : None, 'Error' : None, 'FatalError' : False, \
+		'CMD' : None})
+
+	if ivOutQueue is not None:
+		ivOutQueue.get(timeout=10)
+		ivInQueue.put({'Data' : None, 'Error' : None, 'FatalError' : False, \
+			'CMD' : None})
+
+	# The secretary can not end until everything it sent is read.
+	while file_process.is_alive():
+		try:
+			graQueue.get(timeout=0.1)
+		except Empty:
+			pass
+
+	file_process.join()
+
+	return latencies
+
+def latency_benchmark():
+	for wakeupMode in ['poll', 'event']:
+		latencies = measure_latency(wakeupMode)
+
+		print(f'[Benchmark] WakeupMode={wakeupMode}: median command-to-relay \
+time {1e3*statistics.median(latencies):.3f} ms, max \
+{1e3*max(latencies):.3f} ms.', file=sys.__stdout__)
+
+def writer_benchmark():
+	for writerThread in [False, True]:
+		latencies = sorted(measure_latency('event', rowsPerCMD=2000, \
+			WriterThread=writerThread, Journal=False, Compression='gzip', \
+			CompressionLevel=9, Shuffle=False, ChunkRows=65536, FlushRows=65536))
+
+		print(f'[Benchmark] WriterThread={writerThread}, 2000 rows per command: \
+median command-to-relay time {1e3*statistics.median(latencies):.3f} ms, p99 \
+{1e3*latencies[int(0.99*len(latencies))]:.3f} ms, max {1e3*latencies[-1]:.3f} ms.', \
+			file=sys.__stdout__)
+
+# Fake I-V rows, 1000 per voltage step.
+def synthetic_rows(numRows):
+	rows = np.zeros(numRows, dtype=FileManager.IV_DTYPE)
+	rows['Time'] = np.arange(numRows)*0.05
+	rows['Voltage'] = 53.5 + 1e-4*np.random.randn(numRows)
+	rows['Current'] = 1e-9*(1 + 0.01*np.random.randn(numRows))
+	rows['Step'] = np.arange(numRows)//1000
+
+	return rows
+
+# How sipmFileManager.add_IV used to save the rows: one resize and one
+# single row write of time, voltage and current per sample.
+def legacy_add_rows(dataset, rows):
+	size = dataset.shape[0]
+
+	for row in rows:
+		size += 1
+		dataset.resize((size, 3))
+		dataset[size - 1] = (row['Time'], row['Voltage'], row['Current'])
+
+def append_benchmark(numRows=50000):
+	rows = synthetic_rows(numRows)
+
+	with h5py.File('legacy.hdf5', 'w', libver='latest') as f:
+		dataset = f.create_dataset('IV_1', (0, 3), maxshape=(None, 3), \
+			dtype='f4')
+
+		start = time.perf_counter()
+		legacy_add_rows(dataset, rows)
+		legacyTime = time.perf_counter() - start
+
+	file = FileManager.sipmFileManager('append.hdf5')
+	file.create_dataset('benchmark')
+
+	start = time.perf_counter()
+	for row in rows:
+		file.add_IV(row)
+	file.close()
+	newTime = time.perf_counter() - start
+
+	# Same but the way the secretary hands them, in batches.
+	file = FileManager.sipmFileManager('append_batch.hdf5')
+	file.create_dataset('benchmark')
+
+	start = time.perf_counter()
+	for i in range(0, numRows, 100):
+		file.add_IV_batch(rows[i:i + 100])
+	file.close()
+	batchTime = time.perf_counter() - start
+
+	print(f'[Benchmark] Per row resize: {numRows/legacyTime:.0f} rows/s. \
+Append engine: {numRows/newTime:.0f} rows/s ({numRows/batchTime:.0f} rows/s \
+in batches of 100).', file=sys.__stdout__)
+
+# [FILE] section with the given options, as the secretary would read it.
+def file_config(**keys):
+	config = configparser.ConfigParser()
+	config.optionxform = str
+	config.read_dict({'FILE' : {key : str(value) for key, value in keys.items()}})
+
+	return config['FILE']
+
+def compression_benchmark(numRows=1000000):
+	rows = synthetic_rows(numRows)
+
+	options = [ \
+		{'Compression' : 'none'}, \
+		{'Compression' : 'lzf'}, \
+		{'Compression' : 'lzf', 'Shuffle' : True}, \
+		{'Compression' : 'gzip', 'CompressionLevel' : 4}, \
+		{'Compression' : 'gzip', 'CompressionLevel' : 4, 'Shuffle' : True}, \
+		{'Compression' : 'gzip', 'CompressionLevel' : 4, 'Shuffle' : True, \
+			'ChunkRows' : 16384, 'FlushRows' : 16384}]
+
+	for i, option in enumerate(options):
+		name = f'compression_{i}.hdf5'
+
+		file = FileManager.sipmFileManager(name, config=file_config(**option))
+		file.create_dataset('benchmark')
+
+		start = time.perf_counter()
+		for j in range(0, numRows, 1000):
+			file.add_IV_batch(rows[j:j + 1000])
+		file.close()
+		writeTime = time.perf_counter() - start
+
+		start = time.perf_counter()
+		with h5py.File(name, 'r') as f:
+			f['SiPMs Measurements/benchmark/IV_1'][:]
+		readTime = time.perf_counter() - start
+
+		print(f'[Benchmark] {option}: write {numRows/writeTime/1e6:.2f} M rows/s, \
+read {numRows/readTime/1e6:.2f} M rows/s, size {os.path.getsize(name)/1e6:.2f} MB.', \
+			file=sys.__stdout__)
+
+def journal_benchmark(numRows=50000):
+	rows = synthetic_rows(numRows)
+
+	with h5py.File('legacy.hdf5', 'w', libver='latest') as f:
+		dataset = f.create_dataset('IV_1', (0, 3), maxshape=(None, 3), \
+			dtype='f4')
+
+		start = time.perf_counter()
+		legacy_add_rows(dataset, rows)
+		legacyTime = time.perf_counter() - start
+
+	journal = JournalHelper('benchmark.journal', 'benchmark', 1)
+
+	start = time.perf_counter()
+	for i in range(0, numRows):
+		journal.add_IV(rows[i:i + 1], 0)
+	journal.sync()
+	journalTime = time.perf_counter() - start
+
+	journal.delete()
+
+	print(f'[Benchmark] Per row resize: {1e6*legacyTime/numRows:.2f} us/sample. \
+Journal: {1e6*journalTime/numRows:.2f} us/sample.', file=sys.__stdout__)
+
+def export_benchmark(sizes=[1000000, 4000000]):
+	formats = ['csv']
+
+	try:
+		import pyarrow
+		formats += ['parquet', 'arrow']
+	except ImportError:
+		print('[Benchmark] pyarrow is not installed, only CSV is exported.', \
+			file=sys.__stdout__)
+
+	rows = synthetic_rows(1000000)
+
+	for numRows in sizes:
+		name = f'export_{numRows}.hdf5'
+
+		file = FileManager.sipmFileManager(name)
+		file.create_dataset('benchmark')
+
+		for i in range(0, numRows, len(rows)):
+			block = rows.copy()
+			block['Time'] += i*0.05
+			file.add_IV_batch(block)
+			file.add_HT_batch([[i*0.05, 40.0, 15.0]])
+		file.close()
+
+		for fileFormat in formats:
+			exporter = sipmFileExporter(name)
+
+			tracemalloc.start()
+			start = time.perf_counter()
+			exporter.export(f'export.{fileFormat}')
+			exportTime = time.perf_counter() - start
+			peak = tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+
+			exporter.close()
+
+			print(f'[Benchmark] {numRows} rows ({os.path.getsize(name)/1e6:.0f} MB) \
+to {fileFormat}: {numRows/exportTime/1e6:.2f} M rows/s, peak memory \
+{peak/1e6:.1f} MB, output {os.path.getsize(f"export.{fileFormat}")/1e6:.0f} MB.', \
+				file=sys.__stdout__)
+
+			os.remove(f'export.{fileFormat}')
+
+		os.remove(name)
+
+def retention_benchmark(numRows=1000000):
+	rows = synthetic_rows(numRows)
+
+	# The picoammeter changes range a few times during the run.
+	rows['Range'] = (np.arange(numRows)//150000) % 2
+
+	for policy in ['all', 'every', 'anomalies']:
+		name = f'retention_{policy}.hdf5'
+
+		file = FileManager.sipmFileManager(name, \
+			config=file_config(Retention=policy, Pyramid=False))
+		file.create_dataset('benchmark')
+
+		start = time.perf_counter()
+		for i in range(0, numRows, 1000):
+			file.add_IV_batch(rows[i:i + 1000])
+		file.close()
+		writeTime = time.perf_counter() - start
+
+		with h5py.File(name, 'r') as f:
+			savedRows = f['SiPMs Measurements/benchmark/IV_1'].shape[0]
+
+		print(f'[Benchmark] Retention={policy}: {savedRows} rows saved, \
+size {os.path.getsize(name)/1e6:.2f} MB, write {numRows/writeTime/1e6:.2f} M rows/s.', \
+			file=sys.__stdout__)
+
+		os.remove(name)
+
+# The electrometer, secretary and grapher of the ring benchmark, with
+# queues and with the sample ring.
+def queue_producer(ivQueue, numRows, times):
+	rows = synthetic_rows(numRows)
+
+	start = time.perf_counter()
+	for i in range(0, numRows):
+		ivQueue.put({'Data' : [rows[i:i + 1], 0], 'Error' : None, \
+			'FatalError' : None, 'CMD' : None})
+	times.put(time.perf_counter() - start)
+
+def queue_secretary(ivQueue, graQueue, numRows):
+	for i in range(0, numRows):
+		rows, numSiPM = ivQueue.get()['Data']
+
+		for row in rows:
+			graQueue.put([float(row['Time']), None, float(row['Voltage']), \
+				float(row['Current']), None, None])
+
+def queue_grapher(graQueue, numRows):
+	for i in range(0, numRows):
+		graQueue.get()
+
+def ring_producer(name, numRows, times):
+	ring = SampleRing(name)
+	rows = synthetic_rows(numRows)
+
+	start = time.perf_counter()
+	for i in range(0, numRows):
+		ring.put(rows[i:i + 1], numSiPM=0)
+	times.put(time.perf_counter() - start)
+
+	ring.close()
+
+def ring_consumer(name, consumer, numRows):
+	ring = SampleRing(name)
+	numRead = 0
+
+	while numRead + ring.lost < numRows:
+		for rows in ring.read(consumer):
+			# The secretary keeps a copy, the grapher its values.
+			if consumer == RING_SECRETARY:
+				rows[list(FileManager.IV_DTYPE.names)].astype(FileManager.IV_DTYPE)
+			else:
+				rows['Current'].tolist()
+
+			numRead += len(rows)
+
+		time.sleep(1e-3)
+
+	ring.close()
+
+# Picoammeter that measures as fast as Python can ask.
+class InstantElectrometer:
+	currentPicoRange = 0
+	lastRetries = 0
+
+	def MeasurementRoutine(self):
+		return (time.perf_counter(), 53.5, 1e-9)
+
+# The electrometer loop, 1000 measurements per voltage step.
+def batch_producer(ivQueue, numRows, batchTime):
+	status = { \
+		'Manager' 		: InstantElectrometer(), \
+		'OutQueue' 		: ivQueue, \
+		'Ring' 			: None, \
+		'Steps' 		: [0], \
+		'Batch' 		: {}, \
+		'BatchStart' 	: 0.0, \
+		'BatchTime' 	: batchTime }
+
+	for step in range(0, numRows//1000):
+		for i in range(0, 1000):
+			measure_and_send(status, 0)
+
+		send_end_step(status, 0, 53.5)
+
+def batch_benchmark(numRows=200000):
+	for batchTime in [0.0, 0.01, 0.1]:
+		ivQueue = Queue()
+		producer = Process(target=batch_producer, \
+			args=(ivQueue, numRows, batchTime))
+
+		start = time.perf_counter()
+		producer.start()
+
+		numMessages = 0
+		numRead = 0
+		while numRead < numRows:
+			items = ivQueue.get()
+			numMessages += 1
+
+			if items['Data'] is not None:
+				numRead += len(items['Data'][0])
+
+		elapsed = time.perf_counter() - start
+		producer.join()
+
+		print(f'[Benchmark] BatchTime={batchTime}: {numMessages} messages, \
+{1e6*elapsed/numRows:.2f} us/sample.', file=sys.__stdout__)
+
+def ring_benchmark(numRows=100000):
+	times = Queue()
+
+	ivQueue = Queue()
+	graQueue = Queue()
+	processes = [ \
+		Process(target=queue_producer, args=(ivQueue, numRows, times)), \
+		Process(target=queue_secretary, args=(ivQueue, graQueue, numRows)), \
+		Process(target=queue_grapher, args=(graQueue, numRows))]
+
+	start = time.perf_counter()
+	for process in processes:
+		process.start()
+	for process in processes:
+		process.join()
+	queueTime = time.perf_counter() - start
+	queuePutTime = times.get()
+
+	ring = SampleRing(create=True, capacity=numRows)
+	processes = [ \
+		Process(target=ring_producer, args=(ring.name, numRows, times)), \
+		Process(target=ring_consumer, args=(ring.name, RING_SECRETARY, numRows)), \
+		Process(target=ring_consumer, args=(ring.name, RING_GRAPHER, numRows))]
+
+	start = time.perf_counter()
+	for process in processes:
+		process.start()
+	for process in processes:
+		process.join()
+	ringTime = time.perf_counter() - start
+	ringPutTime = times.get()
+
+	ring.close()
+
+	print(f'[Benchmark] Queues: {1e6*queuePutTime/numRows:.2f} us/sample to send, \
+{1e6*queueTime/numRows:.2f} us/sample to the grapher. Sample ring: \
+{1e6*ringPutTime/numRows:.2f} us/sample to send, {1e6*ringTime/numRows:.2f} \
+us/sample to the grapher.', file=sys.__stdout__)
+
+def measure_control_latency(useControl, numMessages=500, rowsPerMessage=1000):
+	bossQueue = Queue()
+	graQueue = Queue()
+	ardOutQueue = Queue()
+	ardInQueue = Queue()
+	ivOutQueue = Queue()
+	ivInQueue = Queue()
+	ardCtrlQueue = Queue() if useControl else None
+	ivCtrlQueue = Queue() if useControl else None
+
+	write_config(CONFIG_FILE, WakeupMode='event', WriterThread=False, \
+		Journal=False)
+
+	file_process = Process(target = file_process_main, \
+		kwargs={'bossQueue' : bossQueue, 'graQueue' : graQueue, \
+		'ardOutQueue' : ardOutQueue, 'ardInQueue' : ardInQueue, \
+		'ivOutQueue' : ivOutQueue, 'ivInQueue' : ivInQueue, \
+		'ardCtrlQueue' : ardCtrlQueue, 'ivCtrlQueue' : ivCtrlQueue })
+	file_process.start()
+
+	# The arduinoer and electrometer sides.
+	ardChannel = ControlChannel(ardCtrlQueue if useControl else ardInQueue, \
+		ardOutQueue)
+	ivChannel = ControlChannel(ivCtrlQueue if useControl else ivInQueue, \
+		ivOutQueue)
+
+	# Let the secretary open the database.
+	time.sleep(2)
+
+	rows = synthetic_rows(rowsPerMessage)
+	for i in range(0, numMessages):
+		ivInQueue.put({'Data' : [rows, 0], 'Error' : None, \
+			'FatalError' : None, 'CMD' : None})
+
+	start = time.perf_counter()
+	ivChannel.send({'Data' : None, 'Error' : None, 'FatalError' : None, \
+		'CMD' : {'process' : FileManager.Process.ARDUINO, 'close' : False, \
+		'cmd' : '_donePreCoolingSiPMs', 'value' : ''}})
+	ardChannel.receive(timeout=60)
+	latency = time.perf_counter() - start
+
+	# With the control queues the secretary can close before reading all
+	# the data, which is then left in the queue.
+	ivInQueue.cancel_join_thread()
+
+	bossQueue.put(['close'])
+	for channel in [ardChannel, ivChannel]:
+		channel.receive(timeout=60)
+		channel.send({'Data' : None, 'Error' : None, 'FatalError' : False, \
+			'CMD' : None})
+
+	# The secretary can not end until everything it sent is read.
+	while file_process.is_alive():
+		try:
+			graQueue.get(timeout=0.1)
+		except Empty:
+			pass
+
+	file_process.join()
+
+	return latency
+
+def control_benchmark():
+	for useControl in [False, True]:
+		latency = measure_control_latency(useControl)
+
+		print(f'[Benchmark] Control queues {useControl}: electrometer to \
+arduino command in {1e3*latency:.1f} ms behind 500 messages of 1000 rows.', \
+			file=sys.__stdout__)
+
+# Takes one message every frame seconds, like the grapher, and returns
+# how old the newest row of the last message was when it got it.
+def slow_grapher(graQueue, duration, frame, lags):
+	end = time.time() + duration
+	lag = 0.0
+
+	while time.time() < end:
+		time.sleep(frame)
+
+		try:
+			items = graQueue.get_nowait()
+		except Empty:
+			continue
+
+		lag = time.time() - items['IV']['Time'][-1]
+
+	lags.put(lag)
+
+	# The secretary side can not end until everything it sent is read.
+	while True:
+		try:
+			graQueue.get(timeout=0.5)
+		except Empty:
+			break
+
+def grapher_benchmark(duration=3.0, frame=0.05, rowsPerBatch=1000):
+	for policy in [None] + FEED_POLICIES:
+		graQueue = Queue() if policy is None else Queue(maxsize=4)
+		feed = None if policy is None else GrapherFeed(graQueue, policy=policy)
+		lags = Queue()
+
+		grapher = Process(target=slow_grapher, \
+			args=(graQueue, duration, frame, lags))
+		grapher.start()
+
+		# A batch every secretary wakeup, five times faster than the
+		# grapher takes them.
+		end = time.time() + duration
+		while time.time() < end:
+			rows = synthetic_rows(rowsPerBatch)
+			rows['Time'] = time.time()
+
+			if feed is None:
+				graQueue.put({'IV' : rows})
+			else:
+				feed.send({'IV' : rows})
+
+			time.sleep(frame/5)
+
+		lag = lags.get()
+		grapher.join()
+
+		dropped, coalesced = feed.stats() if feed is not None else (0, 0)
+
+		print(f'[Benchmark] Grapher feed {policy or "unbounded"}: {lag:.2f} s \
+behind, {dropped} rows dropped, {coalesced} rows coalesced.', file=sys.__stdout__)
+
+# How the grapher used to draw a frame: everything made again.
+def legacy_frame(fig, vals):
+	fig.clf()
+
+	ht_ax = fig.add_subplot(2, 2, 3, label='H-T')
+	ht_ax.plot(vals[1], vals[4], color='tab:blue', label='Humidity')
+	ax_2 = ht_ax.twinx()
+	ax_2.plot(vals[1], vals[5], color='tab:red', label='Temperature')
+	ht_ax.legend()
+	ax_2.legend(loc=0)
+
+	fig.add_subplot(2, 2, 1, label='I-V').plot(vals[2], vals[3], 'ro')
+	fig.add_subplot(2, 2, 2, label='V').plot(vals[0], vals[3])
+	fig.add_subplot(2, 2, 4, label='I').plot(vals[0], vals[2])
+
+	fig.tight_layout()
+	fig.canvas.draw()
+
+def render_benchmark(sizes=[10000, 100000, 1000000], rowsPerFrame=1000, \
+	numFrames=5):
+	plt.switch_backend('Agg')
+
+	for name in ['legacy', 'Renderer']:
+		vals = [SeriesBuffer() if name == 'Renderer' else [] for i in range(0, 8)]
+		fig = plt.figure()
+		renderer = Renderer(fig, vals) if name == 'Renderer' else None
+
+		graQueue = Queue()
+		times = []
+		for size in sizes:
+			rows = synthetic_rows(size - len(vals[0]))
+			rows['Time'] += vals[0][-1] if len(vals[0]) > 0 else 0.0
+
+			# The run up to the last frames, then the median of them.
+			frames = [rows[:-numFrames*rowsPerFrame]] + \
+				np.split(rows[-numFrames*rowsPerFrame:], numFrames)
+
+			frameTimes = []
+			for frame in frames:
+				graQueue.put({'IV' : frame})
+				time.sleep(0.05)
+
+				start = time.perf_counter()
+				read_queue(graQueue, vals)
+
+				if renderer is not None:
+					renderer.update()
+				else:
+					legacy_frame(fig, vals)
+
+				frameTimes.append(time.perf_counter() - start)
+
+			times.append(f'{1e3*statistics.median(frameTimes[1:]):.1f} ms at \
+{size} rows')
+
+		plt.close(fig)
+
+		print(f'[Benchmark] {name} frame: {", ".join(times)}.', file=sys.__stdout__)
+
+def buffers_benchmark(numRows=1000000, rowsPerBatch=1000, window=100000):
+	rows = synthetic_rows(rowsPerBatch)
+
+	for name in ['lists', 'SeriesBuffer', f'SeriesBuffer Window={window}']:
+		tracemalloc.start()
+
+		if name == 'lists':
+			vals = [[], [], []]
+		else:
+			vals = [SeriesBuffer(window if 'Window' in name else 0) \
+				for i in range(0, 3)]
+
+		for i in range(0, numRows, rowsPerBatch):
+			for j, field in enumerate(['Time', 'Voltage', 'Current']):
+				vals[j].extend(rows[field].tolist())
+
+		size, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+		print(f'[Benchmark] {name}: {size/1e6:.1f} MB for {numRows} rows (peak \
+{peak/1e6:.1f} MB).', file=sys.__stdout__)
+
+def headless_benchmark(duration=20.0, rowsPerBatch=1000):
+	# CPU time of the child processes, only on POSIX.
+	try:
+		import resource
+	except ImportError:
+		print('[Benchmark] headless needs the resource module (not on \
+Windows), skipped.', file=sys.__stdout__)
+		return
+
+	for interval in [1.0, 5.0]:
+		write_config(CONFIG_FILE, section='GRAPHER', Headless=True, \
+			SnapshotInterval=interval, SnapshotFile='benchmark.png')
+
+		graQueue = Queue(maxsize=4)
+		grapher = Process(target=grapher_process_main, args=(graQueue,))
+
+		before = resource.getrusage(resource.RUSAGE_CHILDREN)
+		grapher.start()
+
+		# Batches of 1000 rows every 0.1 s, 10 steps of 5 s.
+		start = time.time()
+		while time.time() - start < duration:
+			rows = synthetic_rows(rowsPerBatch)
+			rows['Time'] = time.time() + 1e-4*np.arange(rowsPerBatch)
+			rows['Step'] = int(time.time() - start)//5
+
+			try:
+				graQueue.put_nowait({'IV' : rows, \
+					'SiPM' : np.zeros(rowsPerBatch, dtype='u1')})
+			except Full:
+				pass
+
+			time.sleep(0.1)
+
+		graQueue.put({'process' : FileManager.Process.ALL, 'close' : True, \
+			'cmd' : 'close', 'value' : ''})
+		grapher.join()
+
+		after = resource.getrusage(resource.RUSAGE_CHILDREN)
+		cpu = after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+
+		print(f'[Benchmark] Headless grapher, SnapshotInterval={interval}: \
+{100*cpu/duration:.1f}% of a CPU (startup included).', file=sys.__stdout__)
+
+def failure_benchmark(numRows=300, batchRows=100):
+	rows = synthetic_rows(numRows)
+	config = file_config(Journal=True, Catalog=True)
+
+	def fail(*args, **kwargs):
+		raise Exception('Write failed on purpose.')
+
+	file = FileManager.sipmFileManager('failure.hdf5', config=config)
+	file.create_dataset('failure')
+	writer = WriterHelper()
+
+	# The second batch fails and the writer skips the ones after it.
+	for i in range(0, numRows, batchRows):
+		batch = rows[i:i + batchRows]
+		file.journal_IV(batch)
+		writer.submit(fail if i == batchRows else file.add_IV_batch, batch, \
+			journaled=True)
+
+	try:
+		writer.stop()
+	except Exception as err:
+		print(f'[Benchmark] Writer error: {err}', file=sys.__stdout__)
+
+	file.close(failed=writer.failed)
+
+	with h5py.File('failure.hdf5', 'r') as f:
+		writtenRows = len(f['SiPMs Measurements/failure/IV_1'])
+
+	file = FileManager.sipmFileManager('failure.hdf5', config=config)
+	status = file.catalog.query(name='failure')[0]['status']
+	file.recover_journals()
+	file.close()
+
+	with h5py.File('failure.hdf5', 'r') as f:
+		savedRows = f['SiPMs Measurements/failure/IV_1'][:]
+
+	print(f'[Benchmark] Failed write: {writtenRows} of {numRows} rows written, \
+run {status}, {len(savedRows)} rows after recovering the journal.', \
+		file=sys.__stdout__)
+
+	if status != 'failed' or not np.array_equal(savedRows, rows):
+		raise Exception('Rows were lost after a failed write.')
+
+def live_benchmark(numRows=1500, stepRows=750, widths=[50, 100, 2000]):
+	rows = synthetic_rows(numRows)
+
+	file = FileManager.sipmFileManager('live.hdf5', \
+		config=file_config(SWMR=True, Pyramid=True))
+	file.create_dataset('live')
+
+	for i in range(0, numRows, stepRows):
+		file.add_IV_batch(rows[i:i + stepRows])
+		file.end_step(0, float(i))
+
+	reader = sipmFileReader('live.hdf5')
+	reader.open_run('live')
+	live = [reader.read_decimated('IV_1', width=width) for width in widths]
+	reader.close()
+
+	file.close()
+
+	reader = sipmFileReader('live.hdf5', swmr=False)
+	reader.open_run('live')
+	finished = [reader.read_decimated('IV_1', width=width) for width in widths]
+	reader.close()
+
+	for width, (level, bins), (finishedLevel, finishedBins) in \
+		zip(widths, live, finished):
+		liveRows = bins['Rows'].sum() if level > 0 else len(bins)
+
+		print(f'[Benchmark] Live run, width {width}: level {level}, {len(bins)} \
+points with {liveRows} of {numRows} rows.', file=sys.__stdout__)
+
+		if level != finishedLevel or not np.array_equal(bins, finishedBins):
+			raise Exception(f'read_decimated of a live run differs from the \
+finished run for width {width}.')
+
+BENCHMARKS = {
+	'latency' 	: latency_benchmark, \
+	'append' 	: append_benchmark, \
+	'compression' : compression_benchmark, \
+	'journal' 	: journal_benchmark, \
+	'writer' 	: writer_benchmark, \
+	'export' 	: export_benchmark, \
+	'retention' : retention_benchmark, \
+	'ring' 		: ring_benchmark, \
+	'batch' 	: batch_benchmark, \
+	'control' 	: control_benchmark, \
+	'grapher' 	: grapher_benchmark, \
+	'render' 	: render_benchmark, \
+	'buffers' 	: buffers_benchmark, \
+	'headless' 	: headless_benchmark, \
+	'failure' 	: failure_benchmark, \
+	'live' 		: live_benchmark }
+
+CONFIG_FILE = os.path.abspath('file.cfg')
+
+def main():
+	names = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHMARKS)
+
+	with tempfile.TemporaryDirectory() as folder:
+		os.chdir(folder)
+
+		for name in names:
+			BENCHMARKS[name]()
+
+if __name__ == '__main__':
+	main()
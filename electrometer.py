@@ -1,5 +1,7 @@
 from Managers import IVEquipmentManager
-from Managers.FileManager import Process 
+from Managers.FileManager import (Process, IV_DTYPE)
+from Managers.SampleRingManager import SampleRing
+from Managers.ControlManager import ControlChannel
 
 from multiprocessing import Queue
 from queue import Empty
@@ -42,11 +44,13 @@ def read_config():
 # Listen to the secretary commands
 def listen_to_secretary(*, status, err):
 	man = status['Manager']
-	inQueue = status['InQueue']
-	outQueue = status['OutQueue']
+	channel = status['Channel']
 
 	try:
-		response = inQueue.get_nowait()
+		response = channel.receive()
+
+		if response is None:
+			return (status, err)
 
 		if response['close']:
 			print('[Electrometer] Closing.')
@@ -75,13 +79,16 @@ def listen_to_secretary(*, status, err):
 				err = f'{err} {man.retrieveError()}.'
 				man.resetError()
 
-				outQueue.put({\
+				channel.send({\
 					'Data' 			: None, 	\
 					'Error' 		: err, 		\
 					'FatalError' 	: False, 	\
 					'CMD' 			: None })
 				err = ''
 
+				# The secretary starts a new run, steps start again.
+				status['Steps'] = [0 for step in status['Steps']]
+
 		# Command -> 'next'
 		# Allows to move to the next SiPM if the arduinoer authorized it.
 		elif response['cmd'] == 'next':
@@ -107,8 +114,6 @@ def listen_to_secretary(*, status, err):
 
 		return (status, err)
 
-	except Empty:
-		return (status, err)
 	except Exception as error:
 		print(f'[Electrometer] Error while listening to boss: {error}.')
 		err = f'{err} {error}.'
@@ -117,10 +122,68 @@ def listen_to_secretary(*, status, err):
 		return (status, err)
 
 
+# Sends the measurements waiting in the batch to the secretary, as one
+# array of IV_DTYPE rows (see FileManager) per SiPM.
+def send_batch(status):
+	for numSiPM, rows in status['Batch'].items():
+		status['OutQueue'].put({ \
+				'Data' 			: [np.array(rows, dtype=IV_DTYPE), numSiPM], \
+				'Error' 		: None, \
+				'FatalError' 	: None,
+				'CMD' 			: None })
+
+	status['Batch'] = {}
+
+# Takes a measurement and adds it to the batch for the secretary along
+# with the SiPM number. The batch is sent once it is BatchTime seconds
+# old or the voltage step ends. With the sample ring the measurement
+# goes to the ring instead.
+def measure_and_send(status, numSiPM):
+	man = status['Manager']
+
+	t, volt, curr = man.MeasurementRoutine()
+	row = (t, volt, curr, status['Steps'][numSiPM], man.currentPicoRange, \
+		man.lastRetries)
+
+	if status['Ring'] is not None:
+		status['Ring'].put(np.array([row], dtype=IV_DTYPE), numSiPM=numSiPM)
+		return
+
+	if not status['Batch']:
+		status['BatchStart'] = time.time()
+
+	status['Batch'].setdefault(numSiPM, []).append(row)
+
+	if time.time() - status['BatchStart'] >= status['BatchTime']:
+		send_batch(status)
+
+# Lets the secretary know the measurements of a voltage step of the
+# SiPM numSiPM, taken at setVoltage, are done so it can save them and
+# index them. Then moves to the next step index.
+# With the sample ring it goes through the ring, after the samples.
+def send_end_step(status, numSiPM, setVoltage):
+	endStepCMD = {\
+		'process'	: Process.SECRETARY,	\
+		'close' 	: False,				\
+		'cmd' 		: '_endStep',			\
+		'value' 	: [numSiPM, setVoltage]}
+
+	if status['Ring'] is not None:
+		status['Ring'].end_step(numSiPM, status['Steps'][numSiPM], setVoltage)
+	else:
+		send_batch(status)
+		status['OutQueue'].put({\
+			'Data' 			: None, \
+			'Error' 		: None, \
+			'FatalError' 	: None,
+			'CMD' 			: endStepCMD })
+
+	status['Steps'][numSiPM] += 1
+
 def loop(*, status, err):
 	
 	numSiPMsTested = 0
-	outQueue = status['OutQueue']
+	channel = status['Channel']
 
 	# Voltage routine constants #
 	NUM_SIPMS_TEST = int(status['Config']['NumSiPMsToTest'])
@@ -142,6 +205,9 @@ def loop(*, status, err):
 	TOTAL_TAU = np.sqrt(SIPM_TAU*SIPM_TAU + SYST_TAU*SYST_TAU)
 	#	
 
+	# Voltage step index of each SiPM, saved with every measurement.
+	status['Steps'] = [0 for i in range(0, NUM_SIPMS_TEST)]
+
 	while True:
 
 		state = status['State']
@@ -165,12 +231,9 @@ the electrometer and arduinoer.')
 			time.sleep(5)
 
 			for i in range(0, 10):
-				t, volt, curr = status['Manager'].MeasurementRoutine()
-				status['OutQueue'].put({ \
-						'Data' 			: [t, volt, curr, numSiPMsTested], \
-						'Error' 		: None, \
-						'FatalError' 	: None,
-						'CMD' 			: None })
+				measure_and_send(status, numSiPMsTested)
+
+			send_end_step(status, numSiPMsTested, 53.5)
 
 			# Set the power supply to standby
 			status['Manager'].SetVoltage(0.0)
@@ -190,7 +253,7 @@ all SiPMs.')
 					'cmd' 		: '_donePreCoolingSiPMs',	\
 					'value' 	: ''}
 
-				outQueue.put({\
+				channel.send({\
 					'Data' 			: None, \
 					'Error' 		: None, \
 					'FatalError' 	: None,
@@ -227,17 +290,13 @@ is blocking.')
 				# Take measurements for the given voltage.
 				while ni < NUM_MEAS_PER_DV:
 					
-					t, volt, curr = status['Manager'].MeasurementRoutine()
-					status['OutQueue'].put({ \
-							'Data' 			: [t, volt, curr, numSiPMsTested], \
-							'Error' 		: None, \
-							'FatalError' 	: None,
-							'CMD' 			: None })
+					measure_and_send(status, numSiPMsTested)
 					
 					ni += 1
 					total += 1
 				# Once voltages are finished, raise voltage level
-				
+				send_end_step(status, numSiPMsTested, Vi)
+
 				ni = 0
 				Vi += DIFF_VOLT
 			
@@ -267,7 +326,7 @@ is blocking.')
 					'cmd' 		: '_doneMeasuringSiPMs',	\
 					'value' 	: ''}
 
-				outQueue.put({\
+				channel.send({\
 					'Data' 			: None, \
 					'Error' 		: None, \
 					'FatalError' 	: None,
@@ -290,12 +349,9 @@ the electrometer.')
 			time.sleep(5)
 
 			for i in range(0, 10):
-				t, volt, curr = status['Manager'].MeasurementRoutine()
-				status['OutQueue'].put({ \
-						'Data' 			: [t, volt, curr, numSiPMsTested], \
-						'Error' 		: None, \
-						'FatalError' 	: None,
-						'CMD' 			: None })
+				measure_and_send(status, numSiPMsTested)
+
+			send_end_step(status, numSiPMsTested, 53.5)
 
 			# Set the power supply to standby
 			status['Manager'].SetVoltage(53.5, limit=True)
@@ -330,28 +386,48 @@ all SiPMs.')
 			status['EndFlag'] = False
 			break
 
-def electrometer_process_main(*, inQueue, outQueue):
+# Commands, errors and replies to the secretary go through ctrlQueue
+# (see ControlManager), or outQueue if None.
+# ivRing is the name of the sample ring (see SampleRingManager) the
+# measurements are sent to, if None they are sent through outQueue.
+def electrometer_process_main(*, inQueue, outQueue, ctrlQueue=None, \
+	ivRing=None):
+
+	channel = ControlChannel(ctrlQueue if ctrlQueue is not None else outQueue, \
+		inQueue)
 
 	status = {
 		'Manager' 	: None,
 		'Config' 	: None,
 		'InQueue' 	: inQueue,
 		'OutQueue' 	: outQueue,
+		'Channel' 	: channel,
+		'Ring' 		: None,
 
 		# Loop related items
 		'State' 	: STATES.SETUP,
 		'EndFlag' 	: False, # If code should end or not.
 		'Debug' 	: False, # If in debug mode or not.
 		'TemperatureReady'		: False, # Ready flag to start SiPM measurements.
-		'PostCoolingReady'		: False  # Ready flag to allow post-cooling measurements.
+		'PostCoolingReady'		: False, # Ready flag to allow post-cooling measurements.
+		'Steps'					: None,  # Voltage step index of each SiPM.
+
+		# Measurements waiting to be sent, by SiPM, since BatchStart.
+		'Batch' 		: {},
+		'BatchStart' 	: 0.0,
+		'BatchTime' 	: 0.0
 	}
 
 	status['Manager'] = None
 	commulativeError = ''
 
 	status['Config'] = read_config()
+	status['BatchTime'] = status['Config'].getfloat('BatchTime', fallback=0.0)
 
 	try:
+		if ivRing is not None:
+			status['Ring'] = SampleRing(ivRing)
+
 		print('[Electrometer] Initializing electrometer.')
 		status['Manager'] = IVEquipmentManager.IVEquipmentManager(\
 			status['Config'])
@@ -368,7 +444,8 @@ def electrometer_process_main(*, inQueue, outQueue):
 	except Exception as err:
 		
 		print(f'[Electrometer] Fatal Error: {err}.')
-		outQueue.put( {\
+		send_batch(status)
+		channel.send( {\
 			'Data' 			: None, 						\
 			'Error' 		: f'{commulativeError} {err}.', \
 			'FatalError' 	: True, 						\
@@ -379,7 +456,8 @@ def electrometer_process_main(*, inQueue, outQueue):
 	# No fatal errors, send any errors if present.
 	else:
 		print(f'[Electrometer] Closing with error: {commulativeError}')
-		outQueue.put( {\
+		send_batch(status)
+		channel.send( {\
 			'Data' 			: None, 					\
 			'Error' 		: f'{commulativeError}', 	\
 			'FatalError' 	: False, 					\
@@ -389,3 +467,6 @@ def electrometer_process_main(*, inQueue, outQueue):
 		if status['Manager'] is not None:
 			status['Manager'].Close()
 
+		if status['Ring'] is not None:
+			status['Ring'].close()
+
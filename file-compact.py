@@ -0,0 +1,29 @@
+from Managers.FileHelpers.FileCompactionHelper import compact_database
+
+import configparser
+import sys
+
+# Compacts the database (see FileCompactionHelper). The secretary must
+# not be running.
+# Usage:
+#	python file-compact.py [database]
+# If no database is given, DBName from file.cfg is used.
+
+def read_config():
+	config = configparser.ConfigParser()
+
+	with open('file.cfg') as f:
+		config.read_file(f)
+
+	return config['FILE']
+
+def main():
+	if len(sys.argv) > 1:
+		db_name = sys.argv[1]
+	else:
+		db_name = read_config()['DBName']
+
+	compact_database(db_name)
+
+if __name__ == '__main__':
+	main()
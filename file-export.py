@@ -0,0 +1,42 @@
+from Managers.FileExporter import sipmFileExporter
+
+import configparser
+import sys
+
+# Exports a run of the database to CSV, Parquet or Arrow (see
+# FileExporter). The format comes from the extension of the output.
+# Usage:
+#	python file-export.py output.[csv|parquet|arrow] [run] [database]
+# If no run is given the latest one is exported. If no database is
+# given, DBName from file.cfg is used.
+
+def read_config():
+	config = configparser.ConfigParser()
+
+	with open('file.cfg') as f:
+		config.read_file(f)
+
+	return config['FILE']
+
+def main():
+	if len(sys.argv) < 2:
+		print('Usage: python file-export.py output.[csv|parquet|arrow] [run] [database]')
+		return
+
+	path = sys.argv[1]
+	name = sys.argv[2] if len(sys.argv) > 2 else None
+
+	if len(sys.argv) > 3:
+		db_name = sys.argv[3]
+	else:
+		db_name = read_config()['DBName']
+
+	exporter = sipmFileExporter(db_name)
+
+	try:
+		exporter.export(path, name=name)
+	finally:
+		exporter.close()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,43 @@
+from Managers import FileManager
+
+import configparser
+import sys
+
+# Builds the decimation levels (see FilePyramidHelper) of runs saved
+# without them. The secretary must not be running.
+# Usage:
+#	python file-pyramid.py [run] [database]
+# If no run is given every run without levels is done. If no database
+# is given, DBName from file.cfg is used. The options (PyramidFactor,
+# PyramidLevels, Compression...) are read from file.cfg.
+
+def read_config():
+	config = configparser.ConfigParser()
+
+	with open('file.cfg') as f:
+		config.read_file(f)
+
+	return config['FILE']
+
+def main():
+	config = read_config()
+	db_name = sys.argv[2] if len(sys.argv) > 2 else config['DBName']
+
+	file = FileManager.sipmFileManager(db_name, config=config)
+
+	try:
+		if len(sys.argv) > 1:
+			names = [sys.argv[1]]
+		else:
+			file.acquire_database()
+			names = [name for name in file.sipm_group \
+				if 'HT_level1' not in file.sipm_group[name]]
+			file.release_database()
+
+		for name in names:
+			file.build_pyramids(name)
+	finally:
+		file.close()
+
+if __name__ == '__main__':
+	main()
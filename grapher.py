@@ -1,137 +1,622 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import time
+import configparser
+import os
 
 from queue import Empty
-from matplotlib.animation import FuncAnimation
 from multiprocessing import Process, Queue
+from matplotlib.collections import LineCollection
 
-def animate_all(i, file_queue, vals):
-	try:
-		items = file_queue.get_nowait()
-		# item[0] -> time1
-		# item[1] -> time2
-		# item[2] -> voltage
-		# item[3] -> current
-		# item[4] -> humidity
-		# item[5] -> temperature
+from Managers.SampleRingManager import (SampleRing, RING_GRAPHER, \
+	RING_SAMPLE)
+from Managers.FileHelpers.FileStatsHelper import RunningStats
+from Managers.FileManager import (IV_DTYPE, HT_DTYPE)
 
-		if len(items) == 6:
-			for j in range(0, 6):
-				if items[j] is not None:
-					vals[j].append(items[j])
+# Seconds between two reads of the queue and sample ring.
+FRAME_TIME = 0.3
 
-			onGoing = items[5]
+# Values of one series of the grapher (times, voltages...) in a numpy
+# array. Without a window the array doubles in size when it is full.
+# With a window only the last 'window' values are kept, in an array of
+# twice that size: when it is full the values kept are moved back to
+# its start, so they are always in one piece and the memory used never
+# changes.
+class SeriesBuffer:
 
-			plt.clf()
+	def __init__(self, window=0, size=65536):
+		self.window = window
+		self.data = np.zeros(2*window if window > 0 else size)
 
-			if vals[1]:
+		self.start = 0
+		self.end = 0
 
-				ht_ax = plt.subplot(2, 2, 3, label='H-T')
-				ht_ax.plot(vals[1], vals[4], color='tab:blue', label='Humidity')
-				ht_ax.set_xlabel('time (s)')
-				ht_ax.set_ylabel('Humidity (%)')
+		# Values added since the beginning, including the ones dropped.
+		self.added = 0
 
-				ax_2 = ht_ax.twinx()
-				bb = ax_2.plot(vals[1], vals[5], color='tab:red', label='Temperature')
-				ax_2.set_ylabel('Temperature (C)')
+	def __len__(self):
+		return self.end - self.start
 
-				ht_ax.legend()
-				ax_2.legend(loc=0)
+	def __getitem__(self, index):
+		return self.values()[index]
 
-			if vals[0]:
-				iv_ax = plt.subplot(2, 2, 1, label='I-V')
-				iv_ax.plot(vals[2], vals[3], 'ro')
-				iv_ax.set_ylabel('Current (A)')
-				iv_ax.set_xlabel('Voltage (V)')
+	def __array__(self, dtype=None, copy=None):
+		return np.asarray(self.values(), dtype=dtype)
 
-				v_ax = plt.subplot(2, 2, 2, label='V')
-				v_ax.plot(vals[0], vals[3])
-				v_ax.set_xlabel('time (s)')
-				v_ax.set_ylabel('Current (A)')
+	def values(self):
+		return self.data[self.start:self.end]
 
-				i_ax = plt.subplot(2, 2, 4, label='I')
-				i_ax.plot(vals[0], vals[2])
-				i_ax.set_xlabel('time (s)')
-				i_ax.set_ylabel('Voltage (V)')
+	# Number (counting from the first value ever added) of the first
+	# value still kept.
+	def first(self):
+		return self.added - len(self)
 
-			plt.tight_layout()
+	def append(self, value):
+		self.extend([value])
 
-	except Empty as err:
-		pass
-	except Exception as err:
-		print('[Grapher] Error in the grapher: %s.' % err)
+	def extend(self, values):
+		values = np.asarray(values, dtype=np.float64)
+		self.added += len(values)
+
+		if self.window > 0:
+			values = values[len(values) - min(len(values), self.window):]
 
-def animate_humidity(i, file_queue, vals):
-	try:
-		items = file_queue.get_nowait()
-		# item[0] -> time1
-		# item[1] -> time2
-		# item[2] -> voltage
-		# item[3] -> current
-		# item[4] -> humidity
-		# item[5] -> temperature
+			if self.end + len(values) > len(self.data):
+				keep = min(self.window - len(values), len(self))
+				self.data[:keep] = self.data[self.end - keep:self.end]
+				self.start, self.end = 0, keep
+
+		elif self.end + len(values) > len(self.data):
+			data = np.zeros(max(2*len(self.data), self.end + len(values)))
+			data[:self.end] = self.data[:self.end]
+			self.data = data
+
+		self.data[self.end:self.end + len(values)] = values
+		self.end += len(values)
+
+		if self.window > 0:
+			self.start = max(self.start, self.end - self.window)
+
+def read_config():
+	config = configparser.ConfigParser()
+
+	with open('file.cfg') as f:
+		config.read_file(f)
+
+	return config['GRAPHER']
+
+# Adds IV_DTYPE rows (see FileManager) of the SiPMs SiPMs (one per row,
+# all 0 if None) to vals.
+def add_IV_rows(rows, vals, SiPMs=None):
+	vals[0].extend(rows['Time'])
+	vals[2].extend(rows['Voltage'])
+	vals[3].extend(rows['Current'])
+	vals[6].extend(rows['Step'])
+	vals[7].extend(SiPMs if SiPMs is not None else np.zeros(len(rows)))
+
+# Adds a batch sent by the secretary, {'IV' : IV_DTYPE rows, 'SiPM' :
+# SiPM of each IV row, 'HT' : HT_DTYPE rows} with IV or HT missing, to
+# vals. Returns False if items is not a batch.
+def add_batch(items, vals):
+	if not isinstance(items, dict) or not ('IV' in items or 'HT' in items):
+		return False
+
+	if 'IV' in items:
+		add_IV_rows(items['IV'], vals, items.get('SiPM'))
+
+	if 'HT' in items:
+		rows = items['HT']
+		vals[1].extend(rows['Time'])
+		vals[4].extend(rows['Humidity'])
+		vals[5].extend(rows['Temperature'])
+
+	return True
+
+# Adds the I-V rows of the sample ring the grapher has not read to vals.
+# The grapher does not hold the electrometer back, rows overwritten
+# before they were read are skipped. Returns the number of rows added.
+def read_ring(ring, vals):
+	numRows = 0
+
+	if ring is None:
+		return numRows
+
+	while True:
+		rows = ring.peek(RING_GRAPHER)
+
+		if len(rows) == 0:
+			return numRows
+
+		# A copy, the rows can be overwritten until released.
+		samples = rows[rows['Kind'] == RING_SAMPLE]
+
+		if ring.release(RING_GRAPHER, len(rows)):
+			add_IV_rows(samples, vals, samples['SiPM'])
+			numRows += len(samples)
+
+# Adds everything waiting in file_queue to vals. Returns the number of
+# messages read and True if one of them was the close command.
+def read_queue(file_queue, vals):
+	numItems = 0
+	closing = False
+
+	while True:
+		try:
+			items = file_queue.get_nowait()
+		except Empty:
+			return (numItems, closing)
+
+		numItems += 1
+
+		# Only close matters of the commands relayed by the secretary.
+		if not add_batch(items, vals) and isinstance(items, dict):
+			closing |= bool(items.get('close'))
+
+# Limits (low, high) that include the values from lo to hi. If the
+# current ones do not, they grow by half of the new range on the side
+# that went out, so they change a few times during a run and not
+# every frame.
+def expand_limits(limits, lo, hi):
+	if limits is None:
+		low, high = lo, hi
+		margin = 0.05*(high - low) or 0.05*abs(high) or 1.0
+
+		return (low - margin, high + margin)
+
+	low, high = limits
+	if low <= lo and hi <= high:
+		return limits
+
+	margin = 0.5*(max(high, hi) - min(low, lo))
+
+	return (min(low, lo - margin), max(high, hi + margin))
+
+# Indices of the points to draw of a time series y(x), x sorted, in
+# 'width' pixel columns from low to high: the min and max of each
+# column, in the order they were measured. Peaks and dropouts are kept,
+# what is thrown away would have been drawn over them anyway.
+def minmax_decimate(x, y, low, high, width):
+	columns = ((x - low)/(high - low)*width).astype(np.int64)
+	starts = np.flatnonzero(np.diff(columns, prepend=-1))
+
+	if len(x) <= 2*len(starts):
+		return np.arange(len(x))
+
+	column = np.repeat(np.arange(len(starts)), np.diff(starts, append=len(x)))
+	keep = []
+
+	for reduce in [np.fmin, np.fmax]:
+		found = np.flatnonzero(y == reduce.reduceat(y, starts)[column])
+		keep.append(found[np.unique(column[found], return_index=True)[1]])
+
+	return np.union1d(keep[0], keep[1])
+
+# A time series of a panel, drawing vals[x] and vals[y] (SeriesBuffer)
+# decimated (minmax_decimate) to the pixel columns of its axes. The
+# columns only change with the limits or the size of the axes, so the
+# points of the columns already complete are kept and only the new ones
+# are decimated every frame.
+class Series:
+
+	def __init__(self, line, x, y):
+		self.line = line
+		self.x = x
+		self.y = y
+
+		# Values (SeriesBuffer.added) already used to set the limits.
+		self.used = 0
+
+		# Decimated points of the values before number 'done', for the
+		# limits and width in columns.
+		self.columns = None
+		self.done = 0
+		self.xs = np.zeros(0)
+		self.ys = np.zeros(0)
+
+	def points(self, vals):
+		xs, ys = vals[self.x], vals[self.y]
+
+		if len(xs) == 0:
+			return (xs.values(), ys.values())
+
+		ax = self.line.axes
+		low, high = ax.get_xlim()
+		width = max(int(ax.bbox.width), 1)
+
+		if self.columns != (low, high, width):
+			self.columns = (low, high, width)
+			self.done = xs.first()
+			self.xs = np.zeros(0)
+			self.ys = np.zeros(0)
+
+		# With a window, values not decimated yet may be gone.
+		self.done = max(self.done, xs.first())
+		x = xs[self.done - xs.first():]
+		y = ys[self.done - ys.first():]
+
+		# The last column can still get points.
+		columns = ((x - low)/(high - low)*width).astype(np.int64)
+		last = np.searchsorted(columns, columns[-1])
+
+		keep = minmax_decimate(x[:last], y[:last], low, high, width)
+		self.xs = np.concatenate((self.xs, x[:last][keep]))
+		self.ys = np.concatenate((self.ys, y[:last][keep]))
+		self.done += last
+
+		keep = minmax_decimate(x[last:], y[last:], low, high, width)
+
+		return (np.concatenate((self.xs, x[last:][keep])), \
+			np.concatenate((self.ys, y[last:][keep])))
+
+# I-V panel: the mean current of every voltage step of each SiPM
+# against its mean voltage, with the standard deviation as error bars,
+# on a log current axis. The statistics are kept as the rows arrive, so
+# only the steps that got new rows are computed again. Error bars that
+# would go below zero stop three decades under the mean.
+class StepView:
+
+	def __init__(self, ax):
+		self.ax = ax
+		ax.set_yscale('log')
+		ax.set_ylabel('|Current| (A)')
+		ax.set_xlabel('Voltage (V)')
+
+		# Values (SeriesBuffer.added) already added to the statistics.
+		self.used = 0
+
+		# SiPM -> {step : index of the step in points}
+		self.steps = {}
+
+		# SiPM -> [[mean voltage, |mean current|, low, high] of each step,
+		# (voltage RunningStats, current RunningStats) of each step]
+		self.points = {}
+
+		# SiPM -> (marker line, error bars)
+		self.artists = {}
+
+		# 'x' and 'y' (log10 of the current) limits.
+		self.limits = {}
+
+	def add_SiPM(self, SiPM):
+		line, = self.ax.plot([], [], 'o', markersize=4, animated=True, \
+			label=f'SiPM {SiPM}')
+		bars = LineCollection([], colors=line.get_color(), animated=True)
+		self.ax.add_collection(bars)
+		self.ax.legend()
+
+		self.artists[SiPM] = (line, bars)
+		self.steps[SiPM] = {}
+		self.points[SiPM] = [np.zeros((0, 4)), []]
+
+	def draw(self):
+		for line, bars in self.artists.values():
+			self.ax.draw_artist(bars)
+			self.ax.draw_artist(line)
+
+	# Adds the rows of vals not added yet. Returns True if the panel has
+	# to be drawn again.
+	def update(self, vals):
+		voltages, currents, steps, SiPMs = vals[2], vals[3], vals[6], vals[7]
+
+		if voltages.added == self.used or len(voltages) == 0:
+			return False
+
+		new = max(self.used - voltages.first(), 0)
+		self.used = voltages.added
+
+		v, c = voltages[new:], currents[new:]
+		st, sp = steps[new:], SiPMs[new:]
+
+		changes = np.flatnonzero((np.diff(st) != 0) | (np.diff(sp) != 0)) + 1
+		starts = np.concatenate(([0], changes))
+		ends = np.concatenate((changes, [len(v)]))
+
+		redraw = False
+		updated = set()
+
+		for start, end in zip(starts, ends):
+			SiPM, step = int(sp[start]), int(st[start])
+
+			if SiPM not in self.artists:
+				self.add_SiPM(SiPM)
+				redraw = True
+
+			# The steps start again with a new run.
+			if self.steps[SiPM] and step < max(self.steps[SiPM]):
+				self.steps[SiPM] = {}
+				self.points[SiPM] = [np.zeros((0, 4)), []]
+
+			redraw |= self.add_rows(SiPM, step, v[start:end], c[start:end])
+			updated.add(SiPM)
+
+		for SiPM in updated:
+			points = self.points[SiPM][0]
+			line, bars = self.artists[SiPM]
+
+			line.set_data(points[:, 0], points[:, 1])
+			bars.set_segments(np.stack(( \
+				np.column_stack((points[:, 0], points[:, 2])), \
+				np.column_stack((points[:, 0], points[:, 3]))), axis=1))
 
-		if len(items) == 6:
-			for j in range(0, 6):
-				if items[j] is not None:
-					vals[j].append(items[j])
+		return redraw
 
-			onGoing = items[5]
+	# Adds rows of a step to its statistics. Returns True if the limits
+	# changed.
+	def add_rows(self, SiPM, step, voltages, currents):
+		points, stats = self.points[SiPM]
 
-			plt.clf()
+		if step not in self.steps[SiPM]:
+			self.steps[SiPM][step] = len(stats)
+			stats.append((RunningStats(), RunningStats()))
+			points = np.concatenate((points, np.zeros((1, 4))))
+			self.points[SiPM][0] = points
 
-			if vals[1]:
+		index = self.steps[SiPM][step]
+		voltage, current = stats[index]
+		voltage.add(voltages)
+		current.add(currents)
 
-				ht_ax = plt.subplot(1, 1, 1, label='H-T')
-				ht_ax.plot(vals[1], vals[4], color='tab:blue', label='Humidity')
-				ht_ax.set_xlabel('time (s)')
-				ht_ax.set_ylabel('Humidity (%)')
+		mean = abs(current.mean)
+		points[index] = [voltage.mean, mean, \
+			max(mean - current.std(), 1e-3*mean), mean + current.std()]
 
-				ax_2 = ht_ax.twinx()
-				bb = ax_2.plot(vals[1], vals[5], color='tab:red', label='Temperature')
-				ax_2.set_ylabel('Temperature (C)')
+		if mean <= 0:
+			return False
 
-				ht_ax.legend()
-				ax_2.legend(loc=0)
+		changed = False
+		for axis, lo, hi in [('x', voltage.mean, voltage.mean), \
+			('y', np.log10(points[index, 2]), np.log10(points[index, 3]))]:
 
-			
-			plt.tight_layout()
+			limits = expand_limits(self.limits.get(axis), lo, hi)
+
+			if limits != self.limits.get(axis):
+				self.limits[axis] = limits
+				changed = True
+
+				if axis == 'x':
+					self.ax.set_xlim(limits)
+				else:
+					self.ax.set_ylim(10**limits[0], 10**limits[1])
+
+		return changed
+
+# Draws the panels of the grapher. The axes and lines are made once and
+# only the data of the lines changes. Every frame the lines are drawn on
+# top of a saved background of the figure (blitting), the whole figure
+# is only drawn again when an axis has to grow or the window changes.
+class Renderer:
+
+	def __init__(self, fig, vals, humidity_only=False):
+		self.fig = fig
+		self.canvas = fig.canvas
+		self.vals = vals
+
+		self.lines = []
+		self.limits = {}
+		self.steps = None
+
+		if humidity_only:
+			self.add_HT(fig.add_subplot(1, 1, 1, label='H-T'))
+		else:
+			self.steps = StepView(fig.add_subplot(2, 2, 1, label='I-V'))
+
+			v_ax = fig.add_subplot(2, 2, 2, label='V')
+			self.add_line(v_ax, 0, 3)
+			v_ax.set_xlabel('time (s)')
+			v_ax.set_ylabel('Current (A)')
+
+			self.add_HT(fig.add_subplot(2, 2, 3, label='H-T'))
+
+			i_ax = fig.add_subplot(2, 2, 4, label='I')
+			self.add_line(i_ax, 0, 2)
+			i_ax.set_xlabel('time (s)')
+			i_ax.set_ylabel('Voltage (V)')
+
+		fig.set_layout_engine('tight')
+
+		self.background = None
+		self.canvas.mpl_connect('draw_event', self.on_draw)
+
+	def add_HT(self, ht_ax):
+		self.add_line(ht_ax, 1, 4, color='tab:blue', label='Humidity')
+		ht_ax.set_xlabel('time (s)')
+		ht_ax.set_ylabel('Humidity (%)')
+
+		ax_2 = ht_ax.twinx()
+		self.add_line(ax_2, 1, 5, color='tab:red', label='Temperature')
+		ax_2.set_ylabel('Temperature (C)')
+
+		ht_ax.legend()
+		ax_2.legend(loc=0)
+
+	def add_line(self, ax, x, y, *args, **kwargs):
+		line, = ax.plot([], [], *args, animated=True, **kwargs)
+		self.lines.append(Series(line, x, y))
+
+	# The whole figure was drawn, without the lines (they are animated).
+	# The size of the axes may have changed, the lines are decimated
+	# again.
+	def on_draw(self, event):
+		if self.canvas.supports_blit:
+			self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+		self.set_lines()
+		self.draw_lines()
+
+	def set_lines(self):
+		for series in self.lines:
+			series.line.set_data(*series.points(self.vals))
+
+	def draw_lines(self):
+		for series in self.lines:
+			series.line.axes.draw_artist(series.line)
+
+		if self.steps is not None:
+			self.steps.draw()
+
+	# Grows the limits of the axes of a line to include the new points.
+	# With a window, the time axis starts again from the oldest value
+	# kept once more than half of it is empty. Returns True if they
+	# changed.
+	def fit(self, series):
+		xs, ys = self.vals[series.x], self.vals[series.y]
+
+		if xs.added == series.used or len(xs) == 0:
+			return False
+
+		new = max(series.used - xs.first(), 0)
+		series.used = xs.added
+		changed = False
+
+		for axis, values in [('x', xs), ('y', ys)]:
+			key = (series.line.axes, axis)
+			limits = self.limits.get(key)
+
+			if axis == 'x' and limits is not None and \
+				values[0] - limits[0] > 0.5*(limits[1] - limits[0]):
+				limits = expand_limits(None, values[0], values[-1])
+			else:
+				limits = expand_limits(limits, np.nanmin(values[new:]), \
+					np.nanmax(values[new:]))
+
+			if limits != self.limits.get(key):
+				self.limits[key] = limits
+				changed = True
+
+				if axis == 'x':
+					series.line.axes.set_xlim(limits)
+				else:
+					series.line.axes.set_ylim(limits)
+
+		return changed
+
+	# Takes the new values of vals, and draws them if draw.
+	def update(self, draw=True):
+		redraw = self.background is None
+
+		for series in self.lines:
+			redraw |= self.fit(series)
+
+		if self.steps is not None:
+			redraw |= self.steps.update(self.vals)
+
+		if not draw:
+			return
+
+		if redraw:
+			self.canvas.draw_idle()
+		else:
+			self.set_lines()
+			self.canvas.restore_region(self.background)
+			self.draw_lines()
+			self.canvas.blit(self.fig.bbox)
+
+	# Draws the whole figure to a PNG file. It is written next to it and
+	# then renamed over it, so whoever reads it never gets half a file.
+	def snapshot(self, path):
+		temporary = f'{path}.tmp'
+
+		self.fig.savefig(temporary, format='png')
+		os.replace(temporary, path)
+
+# Takes everything the secretary sent since the last frame and draws it.
+# A timer callback, the timer drops it if it returns False (or 0).
+def animate(renderer, file_queue, vals, ring=None):
+	read_all(renderer, file_queue, vals, ring)
+
+# Takes everything the secretary sent since the last frame and draws it
+# if draw. Returns True once the secretary sent the close command.
+def read_all(renderer, file_queue, vals, ring=None, draw=True):
+	try:
+		# With the sample ring the I-V rows do not come through the queue.
+		newRows = read_ring(ring, vals)
+		newItems, closing = read_queue(file_queue, vals)
+
+		if newRows + newItems > 0:
+			renderer.update(draw)
+
+		return closing
 
-	except Empty as err:
-		pass
 	except Exception as err:
 		print('[Grapher] Error in the grapher: %s.' % err)
 
+	return False
+
+# Without a window: the data is read every frame as usual but the figure
+# is only drawn every 'interval' seconds, to a PNG file at 'path', and
+# once more when the secretary closes.
+def headless_loop(renderer, file_queue, vals, ring, path, interval):
+	print(f'[Grapher] Saving the plots to {path} every {interval} s.')
+
+	lastSnapshot = time.time()
+	closing = False
+
+	while not closing:
+		time.sleep(FRAME_TIME)
+
+		closing = read_all(renderer, file_queue, vals, ring, draw=False)
+
+		if closing or time.time() - lastSnapshot >= interval:
+			lastSnapshot = time.time()
+
+			try:
+				renderer.snapshot(path)
+			except Exception as err:
+				print('[Grapher] Error saving the plots: %s.' % err)
+
 # file_queue -> Queue
-def grapher_process_main(file_queue, humidity_only=False):
+# ivRing -> name of the sample ring (see SampleRingManager), if None
+# the I-V rows come through file_queue.
+def grapher_process_main(file_queue, humidity_only=False, ivRing=None):
+
+	config = read_config()
+	window = config.getint('Window', fallback=0)
+	headless = config.getboolean('Headless', fallback=False)
+
+	# time1, time2, voltage, current, humidity, temperature, step, SiPM
+	vals = [SeriesBuffer(window) for i in range(0, 8)]
 
-	time_vals 		= []
-	time2_vals		= []
-	voltage_vals 	= []
-	current_vals 	= []
-	humidity_vals 	= []
-	temperature_vals= []
+	ring = SampleRing(ivRing) if ivRing is not None else None
+
+	if headless:
+		plt.switch_backend('Agg')
 
 	plt.style.use('ggplot')
 
-	if not humidity_only:
-		anim = FuncAnimation(plt.gcf(), animate_all, \
-			fargs=(file_queue, [time_vals, time2_vals, voltage_vals, current_vals, humidity_vals, temperature_vals]), \
-			interval=300)
+	renderer = Renderer(plt.figure(), vals, humidity_only)
+
+	if headless:
+		headless_loop(renderer, file_queue, vals, ring, \
+			config.get('SnapshotFile', fallback='grapher.png'), \
+			config.getfloat('SnapshotInterval', fallback=60.0))
 	else:
-		anim = FuncAnimation(plt.gcf(), animate_humidity, \
-			fargs=(file_queue, [time_vals, time2_vals, voltage_vals, current_vals, humidity_vals, temperature_vals]), \
-			interval=300)
+		timer = renderer.canvas.new_timer(interval=int(1e3*FRAME_TIME))
+		timer.add_callback(animate, renderer, file_queue, vals, ring)
+		timer.start()
+
+		plt.show()
 
-	plt.show()
+	if ring is not None:
+		ring.close()
 
 
 # For testing purposes only:
 def test_process(queue):
 	for i in range(0, 100):
 		time.sleep(2)
-		queue.put([i, 1, i*i, 1/(i+1), 3*i, True])
+
+		rows = np.zeros(10, dtype=IV_DTYPE)
+		rows['Time'] = 2*i + 0.2*np.arange(10)
+		rows['Voltage'] = 50 + 0.25*i
+		rows['Current'] = 1e-9*np.exp(0.25*i)*(1 + 0.05*np.random.randn(10))
+		rows['Step'] = i
+
+		ht = np.zeros(1, dtype=HT_DTYPE)
+		ht['Time'] = 2*i
+		ht['Humidity'] = 3*i
+		ht['Temperature'] = 20 - 0.1*i
+
+		queue.put({'IV' : rows, 'SiPM' : np.zeros(10, dtype='u1'), 'HT' : ht})
 
 def main():
 	q = Queue()
@@ -3,6 +3,7 @@ from secretary import file_process_main
 from arduinoer import arduino_process_main
 from electrometer import electrometer_process_main
 from Managers.LoggerManager import Logger
+from Managers.SampleRingManager import SampleRing
 
 from multiprocessing import (Process, Queue)
 from queue import Empty
@@ -42,6 +43,8 @@ def read_config():
 	return config['MAIN']
 
 def main():
+	ring = None
+
 	try:
 
 		# Makes sure all output gets written to a log and console.
@@ -49,34 +52,52 @@ def main():
 
 		config = read_config()
 
+		# The electrometer sends the I-V samples to the secretary and
+		# grapher through shared memory instead of ivInQueue.
+		ivRing = None
+		if config.getboolean('SampleRing', fallback=False):
+			ring = SampleRing(create=True, \
+				capacity=config.getint('SampleRingSize', fallback=1048576))
+			ivRing = ring.name
+
 		ivInQueue = Queue()
 		ivOutQueue = Queue()
-		graQueue = Queue()
+		graQueue = Queue(maxsize=config.getint('GrapherQueueSize', fallback=4))
 		consoleQueue = Queue()
 		ardOutQueue = Queue()
 		ardInQueue = Queue()
 
+		# Errors, commands and replies of the arduino and electrometer,
+		# apart from their measurements.
+		ardCtrlQueue = Queue()
+		ivCtrlQueue = Queue()
+
 		# Arduino code that measures the humidity/temperature measurements
 		# and controls the peltier.
 		humtemp_process = Process(target = arduino_process_main, \
-			kwargs={'inQueue' : ardOutQueue, 'outQueue' : ardInQueue })
+			kwargs={'inQueue' : ardOutQueue, 'outQueue' : ardInQueue, \
+			'ctrlQueue' : ardCtrlQueue })
 
 		# Secretary (file/comm Manager)
 		file_process = Process(target = file_process_main, \
 			kwargs={'bossQueue' : consoleQueue, 'graQueue' : graQueue, \
 			'ardOutQueue' : ardOutQueue, 'ardInQueue' : ardInQueue, \
-			'ivOutQueue' : ivOutQueue, 'ivInQueue' : ivInQueue })
+			'ivOutQueue' : ivOutQueue, 'ivInQueue' : ivInQueue, \
+			'ardCtrlQueue' : ardCtrlQueue, 'ivCtrlQueue' : ivCtrlQueue, \
+			'ivRing' : ivRing })
 
 		# Code that plots every data avaliable.
 		gra_process = Process(target = grapher_process_main, \
-			args=(graQueue,), kwargs={'humidity_only' : False})
+			args=(graQueue,), kwargs={'humidity_only' : False, \
+			'ivRing' : ivRing})
 
 		# Reads commands and parses them.
 		boss_thread = Thread(target = loop, args = (consoleQueue,))
 
 		# Electrometer manager.
 		iv_thread = Thread(target = electrometer_process_main, \
-			kwargs={'inQueue' : ivOutQueue, 'outQueue' : ivInQueue })
+			kwargs={'inQueue' : ivOutQueue, 'outQueue' : ivInQueue, \
+			'ctrlQueue' : ivCtrlQueue, 'ivRing' : ivRing })
 		
 		boss_thread.start()
 		humtemp_process.start()
@@ -93,7 +114,8 @@ def main():
 		
 
 	finally:
-		pass
+		if ring is not None:
+			ring.close()
 
 if __name__ == '__main__':
     main()
@@ -1,14 +1,21 @@
 from Managers import FileManager
 from Managers.LoggerManager import Logger
 from Managers.FileManager import Process
+from Managers.FileHelpers.FileWriterHelper import WriterHelper
+from Managers.SampleRingManager import (SampleRing, RING_SECRETARY, \
+	RING_END_STEP)
+from Managers.ControlManager import ControlChannel
+from Managers.GrapherFeedManager import GrapherFeed
 
 from multiprocessing import Queue
+from multiprocessing.connection import wait
 from queue import Empty
 from enum import Enum
 
 import time
 import configparser
 import os
+import numpy as np
 
 import sys, traceback
 
@@ -79,33 +86,178 @@ def listen_to_queue(*, queue, err):
 	except Exception as error:
 		raise error
 
+# Grabs every item waiting in the queue (up to maxItems so a flooding
+# process cannot starve the rest of the loop) and returns them as a list.
+def drain_queue(*, queue, err, maxItems=10000):
+	allItems = []
+
+	if queue is None:
+		return (allItems, err)
+
+	while len(allItems) < maxItems:
+		items, err = listen_to_queue(queue=queue, err=err)
+
+		if items is None:
+			break
+
+		allItems.append(items)
+
+	return (allItems, err)
+
+# Blocks until any of the queues has something to read or the timeout
+# passes. A multiprocessing queue is backed by a pipe, so waiting on its
+# reading end wakes the secretary as soon as a message is put in it.
+def wait_for_queues(queues, timeout):
+	readers = [queue._reader for queue in queues if queue is not None]
+
+	if readers:
+		wait(readers, timeout)
+	else:
+		time.sleep(timeout)
+
+# Number of items waiting in the queue. Some platforms (macOS) do not
+# implement qsize, -1 is returned in that case.
+def queue_depth(queue):
+	if queue is None:
+		return 0
+
+	try:
+		return queue.qsize()
+	except NotImplementedError:
+		return -1
+
+# Saves the samples of the sample ring the secretary has not read, and
+# the ends of step between them. Returns the number of samples. They
+# are copied as the ring reuses its memory.
+def read_ring(file, writer, ring):
+	numRows = 0
+	ivBatch = {}
+
+	if ring is None:
+		return numRows
+
+	names = list(FileManager.IV_DTYPE.names)
+
+	for rows in ring.read(RING_SECRETARY):
+		ends = np.flatnonzero(rows['Kind'] == RING_END_STEP)
+		start = 0
+
+		for end in list(ends) + [len(rows)]:
+			samples = rows[start:end]
+
+			for numSiPM in np.unique(samples['SiPM']):
+				sipmRows = samples[samples['SiPM'] == numSiPM]
+				ivBatch.setdefault(int(numSiPM), []).append( \
+					sipmRows[names].astype(FileManager.IV_DTYPE))
+
+			numRows += len(samples)
+
+			if end < len(rows):
+				save_IV_batch(file, writer, ivBatch)
+				save_end_step(file, writer, int(rows['SiPM'][end]), \
+					float(rows['Voltage'][end]))
+
+			start = end + 1
+
+	save_IV_batch(file, writer, ivBatch)
+
+	return numRows
+
+# Saves the IV rows collected in a wakeup, one batch per SiPM.
+# The rows are journaled here and written to HDF5 by the writer.
+def save_IV_batch(file, writer, ivBatch):
+	for numSiPM, rows in ivBatch.items():
+		rows = FileManager.to_records(rows, FileManager.IV_DTYPE)
+
+		file.journal_IV(rows, numSiPM=numSiPM)
+		writer.submit(file.add_IV_batch, rows, numSiPM=numSiPM, \
+			journaled=True)
+
+	ivBatch.clear()
+
+def save_HT_batch(file, writer, htBatch):
+	rows = FileManager.to_records(htBatch, FileManager.HT_DTYPE)
+
+	file.journal_HT(rows)
+	writer.submit(file.add_HT_batch, rows, journaled=True)
+
+def save_end_step(file, writer, numSiPM, setVoltage):
+	file.journal_end_step(numSiPM=numSiPM, setVoltage=setVoltage)
+	writer.submit(file.end_step, numSiPM=numSiPM, setVoltage=setVoltage, \
+		journaled=True)
+
+# Commands sent by the other processes to the secretary itself.
+# Command -> '_endStep'
+# The electrometer finished a voltage step. 'value' is
+# [SiPM number, voltage set during the step].
+def secretary_command(file, writer, cmd):
+	if cmd['cmd'] == '_endStep':
+		numSiPM, setVoltage = cmd['value']
+
+		save_end_step(file, writer, numSiPM, setVoltage)
+
 # Grabs the response or command and relays to the
 # other processes.
 def relay_message(*, response, queues):
-	ardOutQueue = queues['ArduinoOut']
-	ivOutQueue = queues['ElectrometerOut']
-	graQueue = queues['Grapher']
+	ardChannel = queues['Arduino']
+	ivChannel = queues['Electrometer']
+	graFeed = queues['Grapher']
 
 	if response is not None:
 		if response['process'] == Process.ARDUINO:
-			if ardOutQueue is not None:
-				ardOutQueue.put(response)
+			if ardChannel is not None:
+				ardChannel.send(response)
 		elif response['process'] == Process.IV:
-			if ivOutQueue is not None:
-				ivOutQueue.put(response)
+			if ivChannel is not None:
+				ivChannel.send(response)
 		elif response['process'] == Process.GRAPHER:
-			graQueue.put(response)
+			graFeed.put(response)
 		elif response['process'] == Process.SECRETARY:
 			pass # What to do here
 		elif response['process'] == Process.ALL:
-			graQueue.put(response)
-			if ardOutQueue is not None:
-				ardOutQueue.put(response)
-			if ivOutQueue is not None:
-				ivOutQueue.put(response)
+			graFeed.put(response)
+			if ardChannel is not None:
+				ardChannel.send(response)
+			if ivChannel is not None:
+				ivChannel.send(response)
+
+# Errors and commands sent by the electrometer or arduino ('name'),
+# through their control or data queue.
+def control_message(items, name, queues, commErr):
+	if items['Error'] is not None:
+		commErr = f'{commErr} {name} returned error: {items["Error"]}'
+
+	if items['FatalError'] is not None:
+		if items['FatalError']:
+			# If a fatal error is present in any of the
+			# other threads. We close. 
+			raise Exception(f'{name} returned with a fatal error.')
+
+	if items['CMD'] is not None:
+		relay_message(response = items['CMD'], queues = queues)
 
-def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
-	ivInQueue, commErr):
+	return commErr
+
+# Commands to a process go through outQueue, its replies through
+# ctrlQueue or, if None, with its data in inQueue.
+def new_channel(outQueue, ctrlQueue, inQueue):
+	if outQueue is None:
+		return None
+
+	return ControlChannel(outQueue, \
+		ctrlQueue if ctrlQueue is not None else inQueue)
+
+# Message read from the data queue of a process. If the process has no
+# control queue its acknowledgements and control messages come with the
+# data and go through the channel (None for acknowledgements).
+def accept_message(channel, items):
+	if channel is None:
+		return items
+
+	return channel.accept(items)
+
+def loop(file, writer, graFeed, bossQueue, ardChannel, ardInQueue, \
+	ivChannel, ivInQueue, ring, commErr):
 	### Saving data to file while-loop ###
 	print('[File] Starting listening.')
 	onGoing = True
@@ -118,25 +270,96 @@ def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 	startTime = time.time()
 	endTime = float(config['EndRunTime'])
 
+	# Max number of messages taken from one queue per wakeup, and how
+	# often (in seconds) the ingestion rate is reported.
+	MAX_BATCH = config.getint('MaxBatch', fallback=10000)
+	STATS_INTERVAL = config.getfloat('StatsInterval', fallback=60.0)
+
+	stats = { \
+		'Samples' 		: 0, 			\
+		'LastReport' 	: time.time(), 	\
+		'LastIV' 		: time.time(), 	\
+		'Compacted' 	: False }
+
+	# Compacts the files of the runs that ended once every time no I-V
+	# rows arrive for CompactIdleTime seconds, see FileManager.compact_runs.
+	# Only with Sharding, without it the file being written would have
+	# to be closed.
+	COMPACT_WHEN_IDLE = config.getboolean('CompactWhenIdle', fallback=False)
+	if COMPACT_WHEN_IDLE and not file.sharding:
+		print('[File] CompactWhenIdle needs Sharding, the database will not \
+be compacted while idle.')
+		COMPACT_WHEN_IDLE = False
+
+	COMPACT_IDLE_TIME = config.getfloat('CompactIdleTime', fallback=600.0)
+	COMPACT_MIN_DEAD = config.getfloat('CompactMinDeadFraction', fallback=0.2)
+
+	# 'poll' wakes up at ~100 Hz, 'event' sleeps until the boss, electrometer
+	# or arduino sends something (or WakeupTimeout passes).
+	EVENT_WAKEUP = config.get('WakeupMode', fallback='poll') == 'event'
+	WAKEUP_TIMEOUT = config.getfloat('WakeupTimeout', fallback=1.0)
+
+	# Nothing is sent through a queue when a sample is put in the ring,
+	# so the ring is checked at least every RingPollTime seconds.
+	if ring is not None:
+		WAKEUP_TIMEOUT = min(WAKEUP_TIMEOUT, \
+			config.getfloat('RingPollTime', fallback=0.01))
+
+	# Control queues, the ones that are not also data queues.
+	controls = [(name, channel) for name, channel, dataQueue in \
+		[('Electrometer', ivChannel, ivInQueue), ('Arduino', ardChannel, ardInQueue)] \
+		if channel is not None and channel.inQueue is not dataQueue]
+
+	# Control messages that took longer than this (in seconds) to arrive
+	# are reported right away.
+	CONTROL_LATENCY_WARNING = config.getfloat('ControlLatencyWarning', \
+		fallback=0.1)
+
+	queues = { \
+		'Arduino' : ardChannel, \
+		'Electrometer' : ivChannel, \
+		'Grapher' : graFeed }
+
 	while onGoing:
-		# Run at ~100 Hz
-		time.sleep(1.0/100)
+		if EVENT_WAKEUP:
+			wait_for_queues([bossQueue, ivInQueue, ardInQueue] + \
+				[channel.inQueue for name, channel in controls], WAKEUP_TIMEOUT)
+		else:
+			# Run at ~100 Hz
+			time.sleep(1.0/100)
+
+		# CONTROL LOOP #
+		# Errors and commands from the electrometer and arduino go first,
+		# whatever data is waiting.
+		for name, channel in controls:
+			while True:
+				items = channel.receive()
+
+				if items is None:
+					break
+
+				latency = time.time() - items['Sent']
+				if latency > CONTROL_LATENCY_WARNING:
+					print(f'[File] {name} control message took \
+{1e3*latency:.1f} ms to arrive.')
+
+				commErr = control_message(items, name, queues, commErr)
+
+		################
 
 		#   BOSS LOOP  #
 		# Listens to CMD, parses the command, and sends it around.
 		response, commErr = listen_to_boss(queue=bossQueue, err=commErr)
 
 		# If the command is specifically formatted, it will relay.
-		relay_message(response = response, queues = { \
-			'ArduinoOut' : ardOutQueue, \
-			'ElectrometerOut' : ivOutQueue, \
-			'Grapher' : graQueue })
+		relay_message(response = response, queues = queues)
 
 		# If commands are single words, we build the command.
 		if response is not None:
 			if response['close']:
+				writer.wait()
 				close(file, \
-					graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
+					graFeed, bossQueue, ardChannel, ardInQueue, ivChannel, \
 						ivInQueue, commErr)
 				# Only way to stop the while loop
 				onGoing = False
@@ -144,8 +367,9 @@ def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 			# One word commands
 			# Restarts the system in case of an error.
 			if response['cmd'] == 'restart':
+				writer.wait()
 				commErr = restart(file, \
-					graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
+					graFeed, bossQueue, ardChannel, ardInQueue, ivChannel, \
 						ivInQueue, commErr)
 			# Sets the arduino and electrometer in standby mode.
 			elif response['cmd'] == 'standby':
@@ -155,11 +379,11 @@ def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 					'cmd' 		: 'setState', 	\
 					'value'		: 'STANDBY'}
 
-				if ardOutQueue is not None:
-					ardOutQueue.put(standbyCMD)
+				if ardChannel is not None:
+					ardChannel.send(standbyCMD)
 
-				if ivOutQueue is not None:
-					ivOutQueue.put(standbyCMD)
+				if ivChannel is not None:
+					ivChannel.send(standbyCMD)
 
 			# Starts the system.
 			elif response['cmd'] == 'run':
@@ -171,11 +395,11 @@ def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 					'cmd' 		: 'setState', 	\
 					'value'		: 'RUNNING'}
 
-				if ardOutQueue is not None:
-					ardOutQueue.put(runCMD)
+				if ardChannel is not None:
+					ardChannel.send(runCMD)
 
-				if ivOutQueue is not None:
-					ivOutQueue.put(runCMD)
+				if ivChannel is not None:
+					ivChannel.send(runCMD)
 
 			elif response['cmd'] == 'next':
 				cmd = { \
@@ -184,8 +408,8 @@ def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 					'cmd' 		: 'next', 		\
 					'value'		: ''}
 
-				if ivOutQueue is not None:
-					ivOutQueue.put(cmd)
+				if ivChannel is not None:
+					ivChannel.send(cmd)
 
 			# # Debug command to let the arduino know we are done with the
 			# # measurements.
@@ -202,64 +426,146 @@ def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 
 		################
 
+		samplesBefore = stats['Samples']
+
+		# The grapher gets what arrived in this wakeup as one message,
+		# {'IV' : IV_DTYPE rows, 'SiPM' : SiPM of each IV row, 'HT' :
+		# HT_DTYPE rows}.
+		graBatch = {}
+
 		#   IV LOOP    #
-		items, commErr = listen_to_queue(queue=ivInQueue, err=commErr)
-		if items is not None:
+		# Takes everything the electrometer sent since the last wakeup and
+		# saves the data as one batch per SiPM. With the sample ring the
+		# rows are in the ring and the grapher reads them from there.
+		allItems, commErr = drain_queue(queue=ivInQueue, err=commErr, \
+			maxItems=MAX_BATCH)
+		ivBatch = {}
+		graRows = []
+		graSiPMs = []
+		for items in allItems:
+			# Without a control queue the acknowledgements and control
+			# messages come here too.
+			items = accept_message(ivChannel, items)
+			if items is None:
+				continue
+
 			if items['Data'] is not None:
-				data = items['Data']
+				# rows = IV_DTYPE rows (see FileManager), a batch of them
+				rows, numSiPM = items['Data']
+				rows = FileManager.to_records(rows, FileManager.IV_DTYPE)
 
-				# data[0] = time
-				# data[1] = voltage
-				# data[2] = current
-				file.add_IV(data[0:3], numSiPM=data[3])
-				graQueue.put([data[0], None, data[1], data[2], None, None])
+				ivBatch.setdefault(numSiPM, []).append(rows)
+				graRows.append(rows)
+				graSiPMs.append(np.full(len(rows), numSiPM, dtype='u1'))
+				stats['Samples'] += len(rows)
 
-			if items['Error'] is not None:
-				commErr = f'{commErr} Electrometer returned error: {items["Error"]}'
+			# Commands meant for the secretary refer to the data sent
+			# before them, so that data is saved first.
+			if items['CMD'] is not None and \
+				items['CMD']['process'] == Process.SECRETARY:
+				save_IV_batch(file, writer, ivBatch)
+				secretary_command(file, writer, items['CMD'])
 
-			if items['FatalError'] is not None:
-				if items['FatalError']:
-					# If a fatal error is present in any of the
-					# other threads. We close. 
-					raise Exception('Electrometer returned with a fatal error.')
+			# Without a control queue errors and commands come here.
+			commErr = control_message(items, 'Electrometer', queues, commErr)
 
-			if items['CMD'] is not None:
-				cmd = items['CMD']
+		save_IV_batch(file, writer, ivBatch)
+		stats['Samples'] += read_ring(file, writer, ring)
+		ivSamples = stats['Samples'] - samplesBefore
 
-				relay_message(response = cmd, queues = { \
-					'ArduinoOut' : ardOutQueue, \
-					'ElectrometerOut' : ivOutQueue, \
-					'Grapher' : graQueue })
+		if graRows:
+			graBatch['IV'] = np.concatenate(graRows)
+			graBatch['SiPM'] = np.concatenate(graSiPMs)
 
 		################
 
 		# ARDUINO LOOP #
-		items, commErr = listen_to_queue(queue=ardInQueue, err=commErr)
-		if items is not None:
+		allItems, commErr = drain_queue(queue=ardInQueue, err=commErr, \
+			maxItems=MAX_BATCH)
+		htBatch = []
+		for items in allItems:
+			items = accept_message(ardChannel, items)
+			if items is None:
+				continue
+
 			if items['Data'] is not None:
 				data = items['Data']
 
-				file.add_HT(data)
-				graQueue.put([None, data[0], None, None, data[1], data[2]])
+				htBatch.append(data)
+				stats['Samples'] += 1
 
-			if items['Error'] is not None:
-				commErr = f'{commErr} Arduino returned error: {items["Error"]}'
+			commErr = control_message(items, 'Arduino', queues, commErr)
 
+		if htBatch:
+			htRows = FileManager.to_records(htBatch, FileManager.HT_DTYPE)
 
-			if items['FatalError'] is not None:
-				if items['FatalError']:
-					# If a fatal error is present in any of the
-					# other threads. We close. 
-					raise Exception('Arduino returned with a fatal error.')
+			graBatch['HT'] = htRows
+			save_HT_batch(file, writer, htRows)
 
-			if items['CMD'] is not None:
-				cmd = items['CMD']
+		# The grapher may not keep up, what does not fit in its queue waits
+		# in graFeed (see GrapherFeedManager).
+		if graBatch:
+			graFeed.send(graBatch)
+		else:
+			graFeed.flush()
 
-				relay_message(response = cmd, queues = { \
-					'ArduinoOut' : ardOutQueue, \
-					'ElectrometerOut' : ivOutQueue, \
-					'Grapher' : graQueue })
+		# Writes the buffered rows that have been waiting for too long.
+		writer.submit(file.flush, onlyExpired=True)
+		file.sync_journal(onlyExpired=True)
 
+		################
+
+		# IDLE LOOP #
+		# No I-V rows (the H-T ones never stop), good time to reclaim the
+		# space of deleted and restarted runs. It runs in a thread of its
+		# own on files nobody writes, the secretary keeps routing commands
+		# and saving rows meanwhile.
+		if ivSamples > 0:
+			stats['LastIV'] = time.time()
+			stats['Compacted'] = False
+
+		elif COMPACT_WHEN_IDLE and not stats['Compacted'] and \
+			not writer.busy() and \
+			time.time() - stats['LastIV'] >= COMPACT_IDLE_TIME:
+			writer.background(file.compact_runs, \
+				minDeadFraction=COMPACT_MIN_DEAD, skip=file.files_in_use())
+			stats['Compacted'] = True
+
+		################
+
+		# STATS LOOP #
+		# Reports how fast data is coming in and how much is left waiting
+		# in the queues so a backed up router is easy to spot.
+		if time.time() - stats['LastReport'] >= STATS_INTERVAL:
+			elapsed = time.time() - stats['LastReport']
+			maxDepth, blocked, blockedTime = writer.stats()
+
+			print(f'[File] Ingesting {stats["Samples"]/elapsed:.1f} samples/s. \
+Electrometer queue depth: {queue_depth(ivInQueue)}, Arduino queue depth: \
+{queue_depth(ardInQueue)}. Writer queue depth: {writer.depth()} (max \
+{maxDepth}), full {blocked} times for {blockedTime:.3f} s.')
+
+			# Time from a command being sent to being acknowledged, and
+			# from a control message being sent to arriving.
+			for name, channel in [('Electrometer', ivChannel), ('Arduino', ardChannel)]:
+				if channel is None:
+					continue
+
+				acked, received = channel.stats()
+
+				print(f'[File] {name} control: {acked[0]} commands acknowledged \
+in {1e3*acked[1]:.2f} ms on average (max {1e3*acked[2]:.2f} ms), \
+{channel.overdue(1.0)} waiting for more than 1 s. {received[0]} messages \
+received in {1e3*received[1]:.2f} ms on average (max {1e3*received[2]:.2f} ms).')
+
+			# Rows the grapher did not get, or got merged with others,
+			# because it was falling behind.
+			dropped, coalesced = graFeed.stats()
+			print(f'[File] Grapher: {dropped} rows dropped and {coalesced} rows \
+coalesced.')
+
+			stats['Samples'] = 0
+			stats['LastReport'] = time.time()
 
 		################
 
@@ -270,16 +576,30 @@ def loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 
 		################
 
+# Waits up to timeout seconds for the reply of a process to a command,
+# the first message without data or command.
+def wait_for_reply(channel, timeout):
+	deadline = time.time() + timeout
+
+	while True:
+		response = channel.receive(timeout=max(deadline - time.time(), 1e-3))
+
+		if response is None:
+			raise Empty
+
+		if response['Data'] is None and response['CMD'] is None:
+			return response
+
 # Sends a command and listens for a reply from the arduino and
 # electrometer.
-def send_and_listen(cmd, graQueue, bossQueue, ardOutQueue, ardInQueue, \
-	ivOutQueue, ivInQueue, commErr):
+def send_and_listen(cmd, graFeed, bossQueue, ardChannel, ardInQueue, \
+	ivChannel, ivInQueue, commErr):
 
-	if ardOutQueue is not None:
-		ardOutQueue.put(cmd)
+	if ardChannel is not None:
+		ardChannel.send(cmd)
 
 		try:
-			response = ardInQueue.get(timeout=10)
+			response = wait_for_reply(ardChannel, 10)
 			if response is not None:
 				if response['Error'] is not None:
 					commErr = f'{commErr} {response["Error"]}'
@@ -290,11 +610,11 @@ def send_and_listen(cmd, graQueue, bossQueue, ardOutQueue, ardInQueue, \
 			commErr = f'{commErr} {err}.'
 			print(f'[File] Error while listening to Arduino: {err}.')
 
-	if ivOutQueue is not None:
-		ivOutQueue.put(cmd)
+	if ivChannel is not None:
+		ivChannel.send(cmd)
 
 		try:
-			response = ivInQueue.get(timeout=10)
+			response = wait_for_reply(ivChannel, 10)
 			if response is not None:
 				if response['Error'] is not None:
 					commErr = f'{commErr} {response["Error"]}'
@@ -305,8 +625,8 @@ def send_and_listen(cmd, graQueue, bossQueue, ardOutQueue, ardInQueue, \
 			commErr = f'{commErr} {err}.'
 			print(f'[File] Error while listening to Electroemeter: {err}.')
 
-	if graQueue is not None:
-		graQueue.put(cmd)
+	if graFeed is not None:
+		graFeed.put(cmd)
 
 	return commErr
 
@@ -314,7 +634,7 @@ def send_and_listen(cmd, graQueue, bossQueue, ardOutQueue, ardInQueue, \
 # Command -> 'close'
 # Send a command to retrieve all the cumulated errors, and close
 # all the processes.
-def close(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
+def close(file, graFeed, bossQueue, ardChannel, ardInQueue, ivChannel, \
 	ivInQueue, commErr):
 	print('[File] Closing everything.')
 
@@ -325,7 +645,7 @@ def close(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 		'value'		: '' }
 
 	commErr = send_and_listen(closeResponse, \
-		graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, ivInQueue, commErr)
+		graFeed, bossQueue, ardChannel, ardInQueue, ivChannel, ivInQueue, commErr)
 
 	# Finally, add any errors that were
 	# present in the run.
@@ -337,7 +657,7 @@ def close(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 # Command -> 'restart'
 # Restarts the software by cleaning the error, and opening a new database
 # under the same name as the last one.
-def restart(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
+def restart(file, graFeed, bossQueue, ardChannel, ardInQueue, ivChannel, \
 	ivInQueue, commErr):
 	print('[File] Restarting everything.')
 
@@ -349,7 +669,7 @@ def restart(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 
 	# Retrieve the errors from all the processes.
 	commErr = send_and_listen(restartResponse, \
-		graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, ivInQueue, commErr)
+		graFeed, bossQueue, ardChannel, ardInQueue, ivChannel, ivInQueue, commErr)
 
 	# Save errors to file.
 	if file is not None:
@@ -367,13 +687,25 @@ def restart(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
 ######################################
 
 
+# ardCtrlQueue and ivCtrlQueue bring the errors, commands and replies
+# of the arduino and electrometer (see ControlManager), if None they
+# come with the data in ardInQueue and ivInQueue.
+# ivRing is the name of the sample ring (see SampleRingManager) the
+# electrometer sends the measurements to, if None they come through
+# ivInQueue.
 def file_process_main(*, bossQueue, graQueue, ardOutQueue=None, ardInQueue=None, \
-	ivOutQueue=None, ivInQueue=None):
+	ivOutQueue=None, ivInQueue=None, ardCtrlQueue=None, ivCtrlQueue=None, \
+	ivRing=None):
 	
 	# Makes sure all output gets written to a log and console.
 	sys.stdout = Logger()
 
+	ardChannel = new_channel(ardOutQueue, ardCtrlQueue, ardInQueue)
+	ivChannel = new_channel(ivOutQueue, ivCtrlQueue, ivInQueue)
+
 	file = None
+	writer = None
+	ring = None
 	commulativeError = ''
 
 	# Only three config for now. Database name, file name and comment
@@ -384,35 +716,74 @@ def file_process_main(*, bossQueue, graQueue, ardOutQueue=None, ardInQueue=None,
 	comment = configs['Comment']
 	NUM_SIPMS = int(configs['NumSiPMsToTest'])
 
+	# Sends to the grapher without waiting for it, see GrapherFeedManager.
+	graFeed = GrapherFeed(graQueue, \
+		policy=configs.get('GrapherPolicy', fallback='coalesce'), \
+		maxRows=configs.getint('GrapherMaxRows', fallback=100000), \
+		commandTimeout=configs.getfloat('GrapherCommandTimeout', fallback=5.0))
+
 	try:
 		# File creation/initialization
 		print('[File] Setting up database.')
-		file = FileManager.sipmFileManager(db_name, numSiPMs=NUM_SIPMS)
+		FileManager.clear_unfinished_database(db_name, config=configs)
+		file = FileManager.sipmFileManager(db_name, numSiPMs=NUM_SIPMS, \
+			config=configs)
+		file.recover_journals()
 		file.create_dataset(name_of_measurements)
 		file.add_attribute('Comment', comment)
 
-		loop(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
-			ivInQueue, commulativeError)
+		if ivRing is not None:
+			ring = SampleRing(ivRing)
+
+		# HDF5 writes happen in their own thread, see WriterHelper.
+		# Anything else done with the file waits for the writer first.
+		writer = WriterHelper( \
+			maxItems=configs.getint('WriterQueueSize', fallback=256), \
+			threaded=configs.getboolean('WriterThread', fallback=False))
+
+		loop(file, writer, graFeed, bossQueue, ardChannel, ardInQueue, \
+			ivChannel, ivInQueue, ring, commulativeError)
+		writer.stop()
 		
 	# If an error occurred during secretary, the best thing to do 
 	# is to delete everything and restart the software.
 	# Before closing, we retrieve all the errors if possible.
+	# With the journal the run is kept: close() saves what it can and
+	# if that fails the journal is replayed the next time.
 	except Exception as err:
-		print('[File] Error with the file manager. Deleting previous data base.')
+		if file is not None and file.journal:
+			print('[File] Error with the file manager. Keeping the data base.')
+		else:
+			print('[File] Error with the file manager. Deleting previous data base.')
 		print(f'[File] Error: {err}.')
 		commulativeError = f'{commulativeError} {err}.'
+
+		# Whatever the writer had left is saved, or skipped if the
+		# writer is what failed.
+		if writer is not None:
+			try:
+				writer.stop()
+			except Exception as writerErr:
+				print(f'[File] Writer error: {writerErr}.')
 		
 		# If the file broke the error will not be saved.
 		# In fact, nothing will.
-		close(file, graQueue, bossQueue, ardOutQueue, ardInQueue, ivOutQueue, \
+		close(file, graFeed, bossQueue, ardChannel, ardInQueue, ivChannel, \
 			ivInQueue, commulativeError)
 
-		if file is not None:
+		if file is not None and not file.journal:
 			file.delete_dataset()
 
 		traceback.print_exc(file=sys.stdout)
 			
 	# Open resources.
 	finally:
+		# If the writer failed some rows are only in the journal.
 		if file is not None:
-			file.close()
\ No newline at end of file
+			file.close(failed=writer is not None and writer.failed)
+
+		if ring is not None:
+			ring.close()
+
+		# The 'close' may still be waiting for room in the grapher queue.
+		graFeed.close()
\ No newline at end of file
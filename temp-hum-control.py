@@ -49,19 +49,22 @@ def main():
 
 		ardInQueue = Queue()
 		ardOutQueue = Queue()
-		graQueue = Queue()
+		ardCtrlQueue = Queue()
+		graQueue = Queue(maxsize=config.getint('GrapherQueueSize', fallback=4))
 		consoleQueue = Queue()
 		# iv_Queue = Queue() 
 
 		# Arduino code that measures the humidity/temperature measurements
 		humtemp_process = Process(target=arduino_process_main, \
-			kwargs={'inQueue' : ardOutQueue, 'outQueue' : ardInQueue })
+			kwargs={'inQueue' : ardOutQueue, 'outQueue' : ardInQueue, \
+			'ctrlQueue' : ardCtrlQueue })
 
 		# Secretary (file Manager)
 		file_process = Process(target=file_process_main, \
 			kwargs={'bossQueue' : consoleQueue, 'graQueue' : graQueue, \
 			'ardOutQueue' : ardOutQueue, 'ardInQueue' : ardInQueue, \
-			'ivOutQueue' : None, 'ivInQueue' : None })
+			'ivOutQueue' : None, 'ivInQueue' : None, \
+			'ardCtrlQueue' : ardCtrlQueue })
 
 		# Code that plots every data avaliable
 		gra_process = Process(target=grapher_process_main, args=(graQueue,), kwargs={'humidity_only' : True})